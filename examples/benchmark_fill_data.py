@@ -0,0 +1,143 @@
+"""
+Benchmark of StatLineTable.fill_data on the test tables in tests/data
+
+The cached json files of each test table (DataProperties, TypedDataSet and the dimensions) are
+rebuilt from the stored question_df in a temporary directory, so no connection to opendata.cbs.nl
+is needed. The long table is then built with the previous reshape, which copied the question_df
+for every observation, and with the current fill_data.
+
+Run it from the root of the repository::
+
+    python examples/benchmark_fill_data.py
+"""
+import json
+import math
+import tempfile
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+from cbsodata.utils import StatLineTable
+
+DATA_DIR = Path(__file__).parent.parent / "tests" / "data"
+TABLES = ["84410NED", "82010NED", "80884ENG", "47003NED", "47005NED"]
+REPEAT = 5
+
+
+def to_json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_cache(table_id, cache_dir):
+    """ Rebuild the json files of the table from the question_df stored in tests/data """
+    question_df = pd.read_pickle(DATA_DIR / f"question_df_{table_id}.pkl", compression="zip")
+    columns = list(question_df.columns)
+    dimensions = [c for c in columns[columns.index("Default") + 1:-1] if not c.endswith("_Key")]
+    levels = list(question_df.index.names)
+    question_df = question_df.reset_index()
+
+    # the questions of the first observation
+    keys = question_df[[d + "_Key" for d in dimensions]].apply(tuple, axis=1)
+    n_questions = int((keys == keys.iloc[0]).values.argmin()) or len(question_df)
+
+    properties = [{"odata.type": "Cbs.OData.Dimension", "ID": i, "Position": i, "ParentID": None,
+                   "Type": "Dimension", "Key": d, "Title": d} for i, d in enumerate(dimensions)]
+    sections = set()
+    for position, row in question_df.head(n_questions).iterrows():
+        path = list()
+        for level in levels:
+            level_id = to_json_value(row[level])
+            if level_id is None or level_id == row["ID"]:
+                break
+            path.append(int(level_id))
+        titles = row["Section"].split("\n") if row.get("Section") else list()
+        parent_id = None
+        for section_id, title in zip(path, titles):
+            if section_id not in sections:
+                sections.add(section_id)
+                properties.append({"odata.type": "Cbs.OData.TopicGroup", "ID": section_id,
+                                   "ParentID": parent_id, "Type": "TopicGroup", "Key": "",
+                                   "Title": title})
+            parent_id = section_id
+        topic = {"odata.type": "Cbs.OData.Topic", "ID": row["ID"], "Position": position + 1,
+                 "ParentID": parent_id, "Type": "Topic"}
+        for key in ("Key", "Title", "Description", "Datatype", "Unit", "Decimals", "Default"):
+            topic[key] = to_json_value(row[key])
+        properties.append(topic)
+
+    data_set = list()
+    for start in range(0, len(question_df), n_questions):
+        block = question_df.iloc[start:start + n_questions]
+        observation = dict(ID=len(data_set))
+        observation.update({d: block[d + "_Key"].iloc[0] for d in dimensions})
+        observation.update({k: to_json_value(v) for k, v in zip(block["Key"], block["Values"])})
+        data_set.append(observation)
+
+    tables = dict(DataProperties=properties, TypedDataSet=data_set,
+                  TableInfos=[dict(ShortTitle=table_id)])
+    for d in dimensions:
+        pairs = dict.fromkeys(zip(question_df[d + "_Key"], question_df[d]))
+        tables[d] = [dict(Key=k, Title=t) for k, t in pairs]
+
+    output_directory = Path(cache_dir) / table_id
+    output_directory.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        with open(output_directory / f"{name}.json", "w") as stream:
+            json.dump(table, stream)
+
+
+def fill_data_per_observation(statline):
+    """ The previous reshape: one copy of the question_df per observation """
+    df_list = list()
+    for typed_data_set in statline.typed_data_set:
+        values = list()
+        for key, data in typed_data_set.items():
+            if key == "ID":
+                df = statline.question_df.copy()
+            elif key in statline.dimensions:
+                df.loc[:, key] = statline.dimensions[key].loc[data, statline.title_key]
+                df.loc[:, key + "_" + statline.key_key] = data
+            else:
+                values.append(data)
+        df.loc[:, statline.value_key] = values
+        df_list.append(df)
+    return pd.concat(df_list, axis=0)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = Path(tmp_dir) / "cache"
+        print(f"{'table':10s} {'rows':>6s} {'per observation':>16s} {'fill_data':>10s} "
+              f"{'speedup':>8s}")
+        for table_id in TABLES:
+            write_cache(table_id, cache_dir)
+            statline = StatLineTable(table_id, cache_dir_name=str(cache_dir),
+                                     image_dir_name=str(Path(tmp_dir) / "images"),
+                                     to_pickle=False, write_info_to_image_dir=False,
+                                     categorical_dimensions=False)
+
+            # restore the question list as it is before fill_data
+            statline.initialize_dataframes()
+            statline.fill_question_list()
+            question_df = statline.question_df
+
+            old_df = fill_data_per_observation(statline)
+            old_time = min(timeit.repeat(lambda: fill_data_per_observation(statline),
+                                         number=1, repeat=REPEAT))
+
+            def fill_data():
+                statline.question_df = question_df
+                statline.fill_data()
+
+            new_time = min(timeit.repeat(fill_data, number=1, repeat=REPEAT))
+            pd.testing.assert_frame_equal(statline.question_df, old_df)
+
+            print(f"{table_id:10s} {len(old_df):6d} {old_time:15.3f}s {new_time:9.3f}s "
+                  f"{old_time / new_time:7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
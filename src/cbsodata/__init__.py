@@ -24,10 +24,19 @@
 
 """Statistics Netherlands opendata API client for Python"""
 
-from pkg_resources import get_distribution, DistributionNotFound
 import logging
 from logging import NullHandler
 
+try:
+    # importlib.metadata reads the version from the package metadata only, which is much faster
+    # than importing pkg_resources
+    from importlib.metadata import version, PackageNotFoundError
+except ImportError:  # Python < 3.8
+    from pkg_resources import get_distribution, DistributionNotFound as PackageNotFoundError
+
+    def version(dist_name):
+        return get_distribution(dist_name).version
+
 # Set default logging handler to avoid "No handler found" warnings.
 logging.getLogger(__name__).addHandler(NullHandler())
 
@@ -35,8 +44,8 @@ logging.getLogger(__name__).addHandler(NullHandler())
 try:
     # Change here if project is renamed and does not equal the package name
     dist_name = __name__
-    __version__ = get_distribution(dist_name).version
-except DistributionNotFound:
+    __version__ = version(dist_name)
+except PackageNotFoundError:
     __version__ = 'unknown'
 finally:
-    del get_distribution, DistributionNotFound
+    del version, PackageNotFoundError
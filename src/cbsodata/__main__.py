@@ -24,80 +24,92 @@
 """Statistics Netherlands opendata CLI client"""
 
 import argparse
+import collections
+import itertools
 import json
 import sys
 
-from cbsodata.cbsodata3 import (get_data, get_table_list, get_info)
+from cbsodata.cbsodata3 import (iter_data, get_table_list, get_info)
 
 try:
     from cbsodata import __version__
 except ModuleNotFoundError:
     __version__ = "unknown"
 
-AVAILABLE_CMDS = ["data", "info", "list"]
+AVAILABLE_CMDS = ["data", "info", "list", "mirror"]
 
 
-def json_outputter(data_obj, max_rows=None):
-    """Print data in JSON format."""
+def _head(data_obj, max_rows=None):
+    """The first max_rows rows of a list or an iterator of rows."""
 
-    # cut of the at max_rows
     if isinstance(max_rows, (int, float)):
-        data_obj = data_obj[0:max_rows]
+        return itertools.islice(data_obj, max(int(max_rows), 0))
+    return data_obj
 
-    for line in data_obj:
+
+def json_outputter(data_obj, max_rows=None):
+    """Print data in JSON format, one row per line (NDJSON).
+
+    The data can be an iterator of rows, each row is printed as soon as it
+    is received.
+    """
+
+    for line in _head(data_obj, max_rows=max_rows):
         print(json.dumps(line))
 
 
-def text_outputter(data_obj, max_rows=None):
-    """Print data in text format."""
+def text_outputter(data_obj, max_rows=None, sample_rows=None, file=None,
+                   chunk_size=1000):
+    """Print data in text format.
+
+    Each column is as wide as its longest value or name. The values are
+    converted to strings once, per column, and each line is made with one
+    format call. The lines are written in chunks of chunk_size lines to
+    file (default sys.stdout).
+
+    With sample_rows, the widths of the columns are computed from the first
+    sample_rows rows only, so the other rows are printed as soon as they are
+    received. Longer values in these rows are not cut off, and columns which
+    are not in the first rows are not shown.
+    """
+
+    out = sys.stdout if file is None else file
 
     # cut of the at max_rows
-    if isinstance(max_rows, (int, float)):
-        data_obj = data_obj[0:max_rows]
-
-    # collect the maximum length in each column
-    value_max_len = {}
-    for d in data_obj:
-        for key, value in d.items():
-            try:
-                if len(str(value)) > value_max_len[key]:
-                    value_max_len[key] = len(str(value))
-            except KeyError:
-                value_max_len[key] = len(str(value))
-
-    # get a list of columns
-    columns = value_max_len.keys()
-
-    # check if the column name is larger than the largest value
-    for col in columns:
-        if len(str(col)) > value_max_len[col]:
-            value_max_len[col] = len(str(col))
-
-    # print the column line
-    col_line = ""
-    for i, col in enumerate(columns):
-        if i != (len(columns) - 1):
-            col_line = col_line + str(col) \
-                .upper().ljust(value_max_len[col] + 2)
-        else:
-            col_line = col_line + str(col).upper()
-    print(col_line)
-
-    # print the data
-    for d in data_obj:
-        line = ""
-        for i, col in enumerate(columns):
-            if i != (len(columns) - 1):
-                try:
-                    line = line + str(d[col]).ljust(value_max_len[col] + 2)
-                except KeyError:
-                    line = " " * (value_max_len[col] + 2)
-            else:
-                try:
-                    line = line + str(d[col])
-                except KeyError:
-                    pass
-        print(line)
+    rows = iter(_head(data_obj, max_rows=max_rows))
+    if sample_rows is not None:
+        sample_rows = max(sample_rows, 1)
+    sample = list(itertools.islice(rows, sample_rows))
+
+    # get a list of columns, in the order of appearance
+    columns = list(dict.fromkeys(key for d in sample for key in d))
+    if not columns:
+        out.write("\n")
+        out.flush()
+        return
+
+    # collect the maximum length in each column, including the column name
+    str_columns = [[str(d.get(col, "")) for d in sample] for col in columns]
+    widths = [max(len(str(col)), max(map(len, values), default=0))
+              for col, values in zip(columns, str_columns)]
+
+    # all columns except the last are padded with two spaces, and at least
+    # one space if a value is longer than the column
+    line_format = "".join("{{:<{}}} ".format(width + 1)
+                          for width in widths[:-1]) + "{}"
+
+    lines = [line_format.format(*[str(col).upper() for col in columns])]
+    lines.extend(line_format.format(*values) for values in zip(*str_columns))
+
+    for d in rows:
+        if len(lines) >= chunk_size:
+            out.write("\n".join(lines) + "\n")
+            lines = []
+        lines.append(line_format.format(*[str(d.get(col, "")) for col in columns]))
+
+    if lines:
+        out.write("\n".join(lines) + "\n")
+    out.flush()
 
 
 def parse_argument_table_id(parser):
@@ -140,6 +152,15 @@ def parse_argument_max_rows(parser):
         help="maximum number of rows to output")
 
 
+def parse_argument_sample_rows(parser):
+    parser.add_argument(
+        "--sample_rows",
+        default=None,
+        type=int,
+        help="compute the column widths of the text format from the first "
+             "rows only and print the other rows while downloading")
+
+
 def save_list_to_json(data_obj, fp):
     """Write list with dicts to json"""
 
@@ -148,6 +169,14 @@ def save_list_to_json(data_obj, fp):
             f.write(json.dumps(line) + "\n")
 
 
+def write_rows_to_json(data_obj, f):
+    """Write each row to the json file f while passing it on."""
+
+    for line in data_obj:
+        f.write(json.dumps(line) + "\n")
+        yield line
+
+
 def main():
 
     if len(sys.argv) > 1 and sys.argv[1] == "data":
@@ -163,18 +192,31 @@ def main():
         parse_argument_catalog(parser)
         parse_argument_output_format(parser)
         parse_argument_max_rows(parser)
+        parse_argument_sample_rows(parser)
         parse_argument_output(parser)
         args = parser.parse_args(sys.argv[2:])
 
-        result = get_data(args.table_id, catalog_url=args.catalog_url)
-
         if args.output_file:
-            save_list_to_json(result, args.output_file)
-
-        if args.output_format == "text":
-            text_outputter(result, max_rows=args.max_rows)
+            # the output file gets all rows, the first max_rows are shown
+            # while the table is written
+            with open(args.output_file, 'w+') as f:
+                result = write_rows_to_json(
+                    iter_data(args.table_id, catalog_url=args.catalog_url), f)
+                if args.output_format == "text":
+                    text_outputter(result, max_rows=args.max_rows,
+                                   sample_rows=args.sample_rows)
+                else:
+                    json_outputter(result, max_rows=args.max_rows)
+                # write the remaining rows
+                collections.deque(result, maxlen=0)
         else:
-            json_outputter(result, max_rows=args.max_rows)
+            # only download the rows that are shown
+            result = iter_data(args.table_id, catalog_url=args.catalog_url,
+                               max_rows=args.max_rows)
+            if args.output_format == "text":
+                text_outputter(result, sample_rows=args.sample_rows)
+            else:
+                json_outputter(result)
 
     elif len(sys.argv) > 1 and sys.argv[1] == "info":
         parser = argparse.ArgumentParser(
@@ -216,6 +258,7 @@ def main():
         parse_argument_catalog(parser)
         parse_argument_output_format(parser)
         parse_argument_max_rows(parser)
+        parse_argument_sample_rows(parser)
         parse_argument_output(parser)
         args = parser.parse_args(sys.argv[2:])
 
@@ -225,10 +268,78 @@ def main():
             save_list_to_json(result, args.output_file)
 
         if args.output_format == "text":
-            text_outputter(result, max_rows=args.max_rows)
+            text_outputter(result, max_rows=args.max_rows,
+                           sample_rows=args.sample_rows)
         else:
             json_outputter(result, max_rows=args.max_rows)
 
+    elif len(sys.argv) > 1 and sys.argv[1] == "mirror":
+        parser = argparse.ArgumentParser(
+            prog="cbsodata",
+            description="""
+                CBS Open Data: Command Line Interface
+
+                Download many tables, each to its own directory.
+            """
+        )
+        parser.add_argument(
+            "table_ids",
+            nargs="*",
+            type=str,
+            help="table identifiers (default: all tables of the table list)")
+        parser.add_argument(
+            "--dir", "-d",
+            default="mirror",
+            type=str,
+            help="directory of the mirror")
+        parser.add_argument(
+            "--filters",
+            default=None,
+            type=str,
+            help="only mirror the tables of the table list which agree on "
+                 "the filter, e.g. \"Language eq 'en'\"")
+        parser.add_argument(
+            "--workers", "-w",
+            default=4,
+            type=int,
+            help="number of tables downloaded at the same time")
+        parser.add_argument(
+            "--typed",
+            action="store_true",
+            help="download the typed data set")
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="skip the tables which are downloaded according to the "
+                 "journal of the previous run")
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="only download the tables which are new or of which the "
+                 "Modified date changed since the previous sync")
+        parse_argument_catalog(parser)
+        parse_argument_output_format(parser)
+        args = parser.parse_args(sys.argv[2:])
+
+        from cbsodata.mirror import iter_mirror, iter_sync
+
+        if args.sync:
+            result = iter_sync(args.table_ids or None, dir=args.dir,
+                               typed=args.typed, filters=args.filters,
+                               catalog_url=args.catalog_url,
+                               max_workers=args.workers)
+        else:
+            result = iter_mirror(args.table_ids or None, dir=args.dir,
+                                 typed=args.typed, filters=args.filters,
+                                 catalog_url=args.catalog_url,
+                                 max_workers=args.workers,
+                                 resume=args.resume)
+
+        if args.output_format == "text":
+            text_outputter(result)
+        else:
+            json_outputter(result)
+
     # no valid sub command
     else:
         parser = argparse.ArgumentParser(
@@ -0,0 +1,319 @@
+"""
+Statistics Netherlands opendata API client for Python (asyncio)
+
+The functions in this module are the asyncio equivalents of the functions in
+:mod:`cbsodata.cbsodata3` and use the same *options*. All requests go through
+one shared aiohttp.ClientSession. The number of requests running at the same
+time is bounded by *options.pool_maxsize*, so many tables can be fetched at
+once with *asyncio.gather*::
+
+    >>> tables = await asyncio.gather(*[get_data(t) for t in table_ids])
+
+This module requires aiohttp (``pip install aiohttp``).
+"""
+
+__all__ = ['download_data', 'get_data', 'get_info', 'get_meta',
+           'get_table_list', 'close_session']
+
+import asyncio
+import logging
+
+import requests
+
+from cbsodata.cbsodata3 import (options, _get_catalog_url, _get_table_url,
+                                _get_table_list_url, _get_params, _select,
+                                _filters, _label_data, _save_data,
+                                _check_output, _data_set_to_output)
+from cbsodata.json_decoder import get_loads
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# The shared client session, the semaphore bounding the number of requests
+# and the event loop they belong to
+_session = None
+_semaphore = None
+_loop = None
+
+
+def _get_session():
+    """Get the client session shared by all the download calls.
+
+    The session and the semaphore are bound to the running event loop. A new
+    session is created when the event loop has changed.
+    """
+
+    global _session, _semaphore, _loop
+
+    if aiohttp is None:
+        raise ImportError("cbsodata.aio requires aiohttp. Install it with "
+                          "'pip install aiohttp'")
+
+    loop = asyncio.get_running_loop()
+
+    if _loop is not loop or _semaphore is None:
+        _semaphore = asyncio.Semaphore(options.pool_maxsize)
+
+    if options.async_session is not None:
+        _loop = loop
+        return options.async_session, _semaphore
+
+    if _session is None or _session.closed or _loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=options.pool_connections * options.pool_maxsize,
+            limit_per_host=options.pool_maxsize
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+
+    _loop = loop
+
+    return _session, _semaphore
+
+
+async def close_session():
+    """Close the shared client session and all its connections."""
+
+    global _session, _semaphore, _loop
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+    _session = None
+    _semaphore = None
+    _loop = None
+
+
+def _get_proxy(url, proxies):
+    """Get the proxy for the protocol of the url."""
+
+    if not proxies:
+        return None
+
+    return proxies.get(url.split(":", 1)[0])
+
+
+async def _get_json(url, params=None, proxies=None):
+    """Request the url and decode the json response."""
+
+    session, semaphore = _get_session()
+
+    async with semaphore:
+        try:
+            response = await session.get(url, params=params,
+                                         proxy=_get_proxy(url, proxies))
+        except aiohttp.ClientSSLError:
+            # als je van binnen het cbs download met je het http protocol gebruiken
+            url = url.replace("https", "http")
+            response = await session.get(url, params=params)
+
+        async with response:
+            logger.info("Download " + str(response.url))
+
+            if response.status >= 400:
+                raise requests.HTTPError(
+                    "{} Error: {} for url: {}".format(
+                        response.status, response.reason, response.url)
+                )
+
+            return get_loads(options.json_decoder)(await response.read())
+
+
+async def _download_metadata(table_id, metadata_name, select=None,
+                             filters=None, catalog_url=None, proxies=None):
+    """Download metadata."""
+
+    url = _get_table_url(table_id, catalog_url=catalog_url) + metadata_name
+    params = _get_params(select=select, filters=filters)
+
+    try:
+        data = []
+
+        while (url is not None):
+
+            res = await _get_json(url, params=params, proxies=proxies)
+            data.extend(res['value'])
+
+            # the next link already contains the parameters
+            url = res.get('odata.nextLink')
+            params = None
+
+        return data
+
+    except requests.HTTPError as http_err:
+        raise requests.HTTPError(
+            "Downloading table '{}' failed. {}".format(table_id, str(http_err))
+        )
+
+
+async def download_data(table_id, dir=None, typed=False, select=None,
+                        filters=None, catalog_url=None, proxies=None):
+    """Download the CBS data and metadata.
+
+    All the metadata tables are downloaded at the same time. See
+    :func:`cbsodata.cbsodata3.download_data` for the parameters.
+
+    Returns
+    -------
+    dict
+        A dictionary with the (meta)data of the table
+    """
+
+    _proxies = options.proxies if proxies is None else proxies
+    _catalog_url = _get_catalog_url(catalog_url)
+
+    metadata_tables = await _download_metadata(
+        table_id, "", catalog_url=_catalog_url, proxies=_proxies
+    )
+
+    # The names of the tables with metadata
+    metadata_table_names = [table['name'] for table in metadata_tables]
+
+    # Download only the typed or untyped data
+    typed_or_not_str = "TypedDataSet" if typed else "UntypedDataSet"
+    metadata_table_names.remove(typed_or_not_str)
+
+    downloads = []
+    for table_name in metadata_table_names:
+        if table_name in ["TypedDataSet", "UntypedDataSet"]:
+            downloads.append(_download_metadata(
+                table_id, table_name, select=select, filters=filters,
+                catalog_url=_catalog_url, proxies=_proxies))
+        else:
+            downloads.append(_download_metadata(
+                table_id, table_name, catalog_url=_catalog_url,
+                proxies=_proxies))
+
+    tables = await asyncio.gather(*downloads)
+
+    data = {}
+    loop = asyncio.get_running_loop()
+
+    for table_name, metadata in zip(metadata_table_names, tables):
+
+        data[table_name] = metadata
+
+        # save the data in a thread to keep the event loop free
+        if dir:
+            await loop.run_in_executor(None, _save_data, metadata, dir,
+                                       table_name)
+
+    return data
+
+
+async def get_table_list(select=None, filters=None, catalog_url=None,
+                         proxies=None):
+    """Get a list with the available tables.
+
+    See :func:`cbsodata.cbsodata3.get_table_list` for the parameters.
+
+    Returns
+    -------
+    list
+        A list with the description of each table in the catalog.
+    """
+
+    _proxies = options.proxies if proxies is None else proxies
+
+    url = _get_table_list_url(catalog_url)
+
+    params = {}
+    if select:
+        params['$select'] = _select(select)
+    if filters:
+        params['$filter'] = _filters(filters)
+
+    try:
+        res = await _get_json(url, params=params, proxies=_proxies)
+        return res['value']
+
+    except requests.HTTPError as http_err:
+        raise requests.HTTPError(
+            "Downloading table list failed. {}".format(str(http_err))
+        )
+
+
+async def get_info(table_id, catalog_url=None, proxies=None):
+    """Get information about a table.
+
+    See :func:`cbsodata.cbsodata3.get_info` for the parameters.
+
+    Returns
+    -------
+    dict
+        Table information
+    """
+
+    _proxies = options.proxies if proxies is None else proxies
+
+    info_list = await _download_metadata(
+        table_id,
+        "TableInfos",
+        catalog_url=_get_catalog_url(catalog_url),
+        proxies=_proxies,
+    )
+
+    if len(info_list) > 0:
+        return info_list[0]
+    else:
+        return None
+
+
+async def get_meta(table_id, name, catalog_url=None, proxies=None):
+    """Get the metadata of a table.
+
+    See :func:`cbsodata.cbsodata3.get_meta` for the parameters.
+
+    Returns
+    -------
+    list
+        A list with metadata (dict type)
+    """
+
+    _proxies = options.proxies if proxies is None else proxies
+
+    return await _download_metadata(
+        table_id,
+        name,
+        catalog_url=_get_catalog_url(catalog_url),
+        proxies=_proxies,
+    )
+
+
+async def get_data(table_id, dir=None, typed=False, select=None, filters=None,
+                   catalog_url=None, proxies=None, output="records",
+                   categorical=True):
+    """Get the CBS data table.
+
+    See :func:`cbsodata.cbsodata3.get_data` for the parameters.
+
+    Returns
+    -------
+    list, pandas.DataFrame, pyarrow.Table, numpy.recarray
+        The requested data.
+    """
+
+    _check_output(output)
+
+    metadata = await download_data(
+        table_id,
+        dir=dir,
+        typed=typed,
+        select=select,
+        filters=filters,
+        catalog_url=catalog_url,
+        proxies=proxies,
+    )
+
+    if output != "records":
+        return _data_set_to_output(metadata, output, categorical=categorical)
+
+    if "TypedDataSet" in metadata.keys():
+        data = metadata["TypedDataSet"]
+    else:
+        data = metadata["UntypedDataSet"]
+
+    return _label_data(metadata, data)
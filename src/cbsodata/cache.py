@@ -0,0 +1,234 @@
+"""
+Response caches for the downloads of cbsodata3
+
+A cache is enabled by setting it in the options::
+
+    >>> from cbsodata import cbsodata3
+    >>> from cbsodata.cache import FileCache
+    >>> cbsodata3.options.cache = FileCache("http_cache", ttl=24 * 3600)
+
+The responses are stored by the full url of the request, including the
+$select and $filter parameters. A cached response is used without a request
+if it is younger than *ttl* seconds, or if it has been stored for the same
+version (the *Modified* field of the TableInfos) of the table. Otherwise the
+request is send with the ETag/Last-Modified of the cached response, so the
+server can answer with '304 Not Modified' instead of the data.
+"""
+
+__all__ = ['CachedResponse', 'ResponseCache', 'MemoryCache', 'FileCache']
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = collections.namedtuple(
+    "CachedResponse",
+    ["url", "body", "etag", "last_modified", "version", "stored"]
+)
+
+
+class ResponseCache(object):
+    """
+    Base class of the response caches
+
+    Parameters
+    ----------
+    ttl: float, optional
+        Number of seconds a response is used without asking the server. Default = None, which
+        means the server is always asked (unless the version of the table is known)
+    max_size: int, optional
+        Maximum number of bytes of the stored responses. The least recently used responses are
+        removed if the cache gets larger. Default = None, which means the size is unbounded
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.RLock()
+
+    def is_fresh(self, response, version=None):
+        """
+        Check if the cached response can be used without asking the server
+
+        Parameters
+        ----------
+        response: CachedResponse
+            The cached response
+        version: str, optional
+            The current version of the table the response belongs to
+
+        Returns
+        -------
+        bool:
+            True if the response is still valid
+        """
+        if version is not None and response.version == version:
+            return True
+        if self.ttl is not None and time.time() - response.stored < self.ttl:
+            return True
+        return False
+
+    def get(self, url):
+        """ Get the cached response of the url, or None if it is not stored """
+        raise NotImplementedError
+
+    def set(self, url, body, etag=None, last_modified=None, version=None):
+        """ Store the body (bytes) of the response of the url """
+        raise NotImplementedError
+
+    def touch(self, url, version=None):
+        """ Mark the cached response of the url as valid again after a '304 Not Modified' """
+        response = self.get(url)
+        if response is not None:
+            self.set(url, response.body, etag=response.etag,
+                     last_modified=response.last_modified, version=version or response.version)
+
+    def clear(self):
+        """ Remove all the cached responses """
+        raise NotImplementedError
+
+
+class MemoryCache(ResponseCache):
+    """
+    Response cache which keeps the responses in memory
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        super(MemoryCache, self).__init__(ttl=ttl, max_size=max_size)
+        self._responses = collections.OrderedDict()
+        self._size = 0
+
+    def get(self, url):
+        with self._lock:
+            try:
+                response = self._responses[url]
+            except KeyError:
+                return None
+            self._responses.move_to_end(url)
+            return response
+
+    def set(self, url, body, etag=None, last_modified=None, version=None):
+        with self._lock:
+            self._remove(url)
+            self._responses[url] = CachedResponse(url, body, etag, last_modified, version,
+                                                  time.time())
+            self._size += len(body)
+
+            while self.max_size is not None and self._size > self.max_size and self._responses:
+                self._remove(next(iter(self._responses)))
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self._size = 0
+
+    def _remove(self, url):
+        response = self._responses.pop(url, None)
+        if response is not None:
+            self._size -= len(response.body)
+
+
+class FileCache(ResponseCache):
+    """
+    Response cache which stores the responses on disk
+
+    Each response is stored in two files in the cache directory, named after the hash of the
+    url: a json file with the url and headers and a file with the body. The modification time of
+    the json file is used to restore the order of the least recently used responses when the
+    cache is opened again.
+
+    Parameters
+    ----------
+    directory: str
+        Directory to store the responses
+    ttl: float, optional
+        Number of seconds a response is used without asking the server. Default = None
+    max_size: int, optional
+        Maximum number of bytes of the stored bodies. Default = None (unbounded)
+    """
+
+    def __init__(self, directory, ttl=None, max_size=None):
+        super(FileCache, self).__init__(ttl=ttl, max_size=max_size)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # the size of the body of each stored response, from least to most recently used
+        self._sizes = collections.OrderedDict()
+        header_files = sorted(self.directory.glob("*.json"), key=lambda f: f.stat().st_mtime)
+        for header_file in header_files:
+            body_file = header_file.with_suffix(".body")
+            if body_file.exists():
+                self._sizes[header_file.stem] = body_file.stat().st_size
+
+    def _files(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return key, self.directory / (key + ".json"), self.directory / (key + ".body")
+
+    def get(self, url):
+        key, header_file, body_file = self._files(url)
+
+        with self._lock:
+            try:
+                with open(header_file, "r") as stream:
+                    header = json.load(stream)
+                with open(body_file, "rb") as stream:
+                    body = stream.read()
+            except (IOError, ValueError):
+                return None
+
+            # keep track of the last access for the eviction
+            os.utime(header_file)
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+
+        return CachedResponse(url, body, header.get("etag"), header.get("last_modified"),
+                              header.get("version"), header["stored"])
+
+    def set(self, url, body, etag=None, last_modified=None, version=None):
+        key, header_file, body_file = self._files(url)
+        header = dict(url=url, etag=etag, last_modified=last_modified, version=version,
+                      stored=time.time())
+
+        with self._lock:
+            logger.debug(f"Caching response of {url}")
+            with open(body_file, "wb") as stream:
+                stream.write(body)
+            with open(header_file, "w") as stream:
+                json.dump(header, stream)
+            self._sizes[key] = len(body)
+            self._sizes.move_to_end(key)
+
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes.keys()):
+                self._remove(key)
+
+    def _remove(self, key):
+        for suffix in (".json", ".body"):
+            try:
+                (self.directory / (key + suffix)).unlink()
+            except OSError:
+                pass
+        self._sizes.pop(key, None)
+
+    def _evict(self):
+        """ Remove the least recently used responses until the cache fits in max_size """
+        size = sum(self._sizes.values())
+        if self.max_size is None or size <= self.max_size:
+            return
+
+        for key in list(self._sizes.keys()):
+            if size <= self.max_size:
+                break
+            logger.debug(f"Removing cached response {key}")
+            size -= self._sizes[key]
+            self._remove(key)
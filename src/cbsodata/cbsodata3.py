@@ -26,16 +26,24 @@ Statistics Netherlands opendata API client for Python
 """
 
 __all__ = ['download_data', 'get_data', 'get_info', 'get_meta',
-           'get_table_list', 'options', 'catalog']
+           'get_table_list', 'iter_data', 'options', 'catalog',
+           'close_session']
 
-import os
-import json
 import copy
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 import requests
 from requests import Session, Request
+from requests.adapters import HTTPAdapter
+
+from cbsodata.columnar import (COLUMNAR_FORMATS, columns_to_output,
+                               get_dtypes, pages_to_columns)
+from cbsodata.json_decoder import get_loads
+from cbsodata.storage import DataWriter, check_save_format
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +64,39 @@ class OptionsManager(object):
         self.api_version = "3"
         self.proxies = None
 
+        # The connection pool shared by all requests. The number of hosts
+        # to keep a pool for and the number of connections kept alive per
+        # host. Set *session* to use your own requests.Session.
+        self.pool_connections = 10
+        self.pool_maxsize = 10
+        self.session = None
+
+        # The number of metadata tables downloaded at the same time. Keep
+        # it below pool_maxsize to reuse all connections.
+        self.max_workers = 1
+
+        # The number of pages of a data set to request ahead while the
+        # current page is processed. 0 means the pages are downloaded one
+        # after the other.
+        self.prefetch_pages = 0
+
+        # The cache for the responses, see cbsodata.cache. None means the
+        # responses are not cached.
+        self.cache = None
+
+        # The aiohttp.ClientSession used by cbsodata.aio. If None, a shared
+        # session is created on the first request.
+        self.async_session = None
+
+        # The format of the files of the tables stored in a directory, see
+        # cbsodata.storage: "json", "ndjson", "ndjson.gz" or "ndjson.zst".
+        self.save_format = "json"
+
+        # The json library decoding the responses: "orjson", "ujson",
+        # "simdjson" or "json". None means the fastest one installed, see
+        # cbsodata.json_decoder.
+        self.json_decoder = None
+
         # Enable in next version
         # self.catalog_url = "opendata.cbs.nl"
 
@@ -103,6 +144,54 @@ class OptionsManager(object):
 # User options
 options = OptionsManager()
 
+# The shared session and the pool settings it was created with
+_session = None
+_session_pool_settings = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """Get the session shared by all the download calls.
+
+    The session keeps the connections alive and reuses them for the next
+    request to the same host. If a session is set in the options, that
+    session is used instead.
+    """
+
+    global _session, _session_pool_settings
+
+    if options.session is not None:
+        return options.session
+
+    pool_settings = (options.pool_connections, options.pool_maxsize)
+
+    with _session_lock:
+        if _session is None or _session_pool_settings != pool_settings:
+            if _session is not None:
+                _session.close()
+
+            adapter = HTTPAdapter(pool_connections=options.pool_connections,
+                                  pool_maxsize=options.pool_maxsize)
+            _session = Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_settings = pool_settings
+
+        return _session
+
+
+def close_session():
+    """Close the shared session and all the connections in its pool."""
+
+    global _session, _session_pool_settings
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+
+        _session = None
+        _session_pool_settings = None
+
 
 def _get_catalog_url(url):
     return options.catalog_url if url is None else url
@@ -125,12 +214,283 @@ def _get_table_url(table_id, catalog_url=None):
     return "{http}{baseurl}/{bulk}/{table_id}/".format(**components)
 
 
+# The metadata tables which are not a dimension of the data set
+NON_DIMENSION_TABLES = [
+    "TableInfos", "TypedDataSet", "UntypedDataSet",
+    "DataProperties", "CategoryGroups"
+]
+
+
 def _download_metadata(table_id, metadata_name, select=None, filters=None,
-                       catalog_url=None, proxies=None):
-    """Download metadata."""
+                       catalog_url=None, proxies=None, prefetch=0,
+                       record_count=None, version=None, columnar=False,
+                       dir=None, save_format=None):
+    """Download metadata.
+
+    The rows are returned as a list of dicts, or as a dict with the values
+    of each column if columnar is True. If dir is given, each page is saved
+    as soon as it is downloaded.
+    """
+
+    pages = _iter_metadata_pages(table_id, metadata_name, select=select,
+                                 filters=filters, catalog_url=catalog_url,
+                                 proxies=proxies, prefetch=prefetch,
+                                 record_count=record_count, version=version)
+
+    if dir:
+        pages = _save_pages(pages, dir, metadata_name,
+                            save_format=save_format)
+
+    if columnar:
+        return pages_to_columns(pages)
+
+    data = []
+
+    for page in pages:
+        data.extend(page)
+
+    return data
+
+
+def _get_json(url, params=None, proxies=None, version=None, revalidate=False):
+    """Request the url and decode the json response.
+
+    If a cache is set in the options, a cached response is returned without
+    a request if it is fresh or stored for the same version of the table.
+    Otherwise the request asks the server to only send the response if it
+    has been modified. With revalidate, the server is always asked.
+
+    The response is decoded from its bytes by the json library of
+    options.json_decoder.
+    """
+
+    loads = get_loads(options.json_decoder)
+
+    s = _get_session()
+    p = Request('GET', url, params=params).prepare()
+
+    cache = options.cache
+    cached = cache.get(p.url) if cache is not None else None
+
+    if cached is not None:
+        if not revalidate and cache.is_fresh(cached, version=version):
+            logger.info("Read from cache " + p.url)
+            return loads(cached.body)
+
+        if cached.etag:
+            p.headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            p.headers['If-Modified-Since'] = cached.last_modified
+
+    try:
+        r = s.send(p, proxies=proxies)
+    except requests.exceptions.SSLError:
+        # als je van binnen het cbs download met je het http protocol gebruiken
+        url = url.replace("https", "http")
+        p = Request('GET', url, params=params).prepare()
+        r = s.send(p)
+    logger.info("Download " + p.url)
+
+    if cached is not None and r.status_code == 304:
+        cache.touch(cached.url, version=version)
+        return loads(cached.body)
+
+    r.raise_for_status()
+
+    if cache is not None:
+        cache.set(p.url, r.content, etag=r.headers.get('ETag'),
+                  last_modified=r.headers.get('Last-Modified'),
+                  version=version)
+
+    return loads(r.content)
+
+
+def _iter_metadata_pages(table_id, metadata_name, select=None, filters=None,
+                         catalog_url=None, proxies=None, prefetch=0,
+                         record_count=None, version=None, max_rows=None):
+    """Download metadata page by page.
+
+    Without prefetch, the next page is only requested after the current
+    page has been processed by the caller. See _iter_prefetched_pages for
+    the prefetch and record_count arguments. The version of the table is
+    used to validate cached responses. With max_rows, only the first
+    max_rows rows are requested, see _iter_top_pages.
+
+    Yields
+    ------
+    list
+        The rows of one page.
+    """
 
     # http://opendata.cbs.nl/ODataApi/OData/37506wwm/UntypedDataSet?$format=json
     url = _get_table_url(table_id, catalog_url=catalog_url) + metadata_name
+    params = _get_params(select=select, filters=filters)
+
+    try:
+        if max_rows is not None:
+            for page in _iter_top_pages(url, params, max_rows,
+                                        proxies=proxies, version=version):
+                yield page
+        elif prefetch > 0:
+            for page in _iter_prefetched_pages(url, params, proxies=proxies,
+                                               prefetch=prefetch,
+                                               record_count=record_count,
+                                               version=version):
+                yield page
+        else:
+            while (url is not None):
+
+                res = _get_json(url, params=params, proxies=proxies,
+                                version=version)
+
+                try:
+                    url = res['odata.nextLink']
+                except KeyError:
+                    url = None
+
+                yield res['value']
+
+    except requests.HTTPError as http_err:
+        raise requests.HTTPError(
+            "Downloading table '{}' failed. {}".format(table_id, str(http_err))
+        )
+
+
+def _iter_top_pages(url, params, max_rows, proxies=None, version=None):
+    """Download the first max_rows rows.
+
+    The number of rows still needed is send as $top, so the server does not
+    return more rows than needed. The server may return less rows than asked
+    for (at most one page), in which case the next rows are requested with
+    $skip, until max_rows rows are received or the table has no more rows.
+    """
+
+    n_rows = 0
+    while n_rows < max_rows:
+        window = dict(params)
+        window["$top"] = max_rows - n_rows
+        if n_rows > 0:
+            window["$skip"] = n_rows
+
+        page = _get_json(url, params=window, proxies=proxies,
+                         version=version)['value'][:max_rows - n_rows]
+        if not page:
+            break
+        n_rows += len(page)
+
+        yield page
+
+
+def _iter_prefetched_pages(url, params, proxies=None, prefetch=1,
+                           record_count=None, version=None):
+    """Download pages in the background while the caller handles a page.
+
+    The next page is requested as soon as the current page is decoded, so
+    the download overlaps with the processing of the current page. If the
+    number of rows of the table is known (record_count) and prefetch is
+    larger than one, the pages are requested as $skip windows of the size of
+    the first page, with at most prefetch requests at the same time. The
+    pages are always yielded in order.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    # the requests in flight and the requests waiting to be send, as tuples
+    # of (url, params, follow the next link of the page)
+    futures = deque()
+    waiting = deque([(url, params, True)])
+    fan_out = prefetch > 1 and bool(record_count)
+
+    def submit():
+        # keep at most prefetch requests in flight
+        while waiting and len(futures) < prefetch:
+            page_url, page_params, follow = waiting.popleft()
+            futures.append(
+                (executor.submit(_get_json, page_url, page_params, proxies,
+                                 version),
+                 follow)
+            )
+
+    try:
+        submit()
+
+        while futures:
+
+            future, follow = futures.popleft()
+            res = future.result()
+            page = res['value']
+            next_url = res.get('odata.nextLink') if follow else None
+
+            if next_url is not None and fan_out and len(page) > 0:
+                fan_out = False
+                page_size = len(page)
+                for skip in range(page_size, record_count, page_size):
+                    window = dict(params)
+                    window.update({"$skip": skip, "$top": page_size})
+                    waiting.append((url, window, False))
+
+                if waiting:
+                    # the last window follows the next link, in case the
+                    # table has more rows than in the table information
+                    _, window, _ = waiting.pop()
+                    del window["$top"]
+                    waiting.append((url, window, True))
+                else:
+                    waiting.append((next_url, params, True))
+
+            elif next_url is not None:
+                waiting.append((next_url, params, True))
+
+            # request the next pages before the current page is handled
+            submit()
+
+            yield page
+
+    finally:
+        for future, _ in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _get_table_infos(table_id, catalog_url=None, proxies=None):
+    """Download the table information.
+
+    The server is always asked for the table information, even if it is
+    cached, because its Modified field is used as the version of the table.
+    """
+
+    url = _get_table_url(table_id, catalog_url=catalog_url) + "TableInfos"
+
+    try:
+        res = _get_json(url, params=_get_params(), proxies=proxies,
+                        revalidate=True)
+        return res['value']
+
+    except requests.HTTPError as http_err:
+        raise requests.HTTPError(
+            "Downloading table '{}' failed. {}".format(table_id, str(http_err))
+        )
+
+
+def _get_table_version(table_infos):
+    """Get the version (the Modified field) from the table information."""
+
+    try:
+        return table_infos[0]["Modified"]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+def _get_record_count(table_infos):
+    """Get the number of rows of the data set from the table information."""
+
+    try:
+        return int(table_infos[0]["RecordCount"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _get_params(select=None, filters=None):
+    """Create the url parameters of a metadata request."""
 
     params = {}
     params["$format"] = FORMAT
@@ -140,50 +500,122 @@ def _download_metadata(table_id, metadata_name, select=None, filters=None,
     if filters:
         params['$filter'] = _filters(filters)
 
-    try:
-        data = []
+    return params
 
-        while (url is not None):
 
-            s = Session()
-            p = Request('GET', url, params=params).prepare()
+def _get_table_list_url(catalog_url=None):
+    """Create the url of the table list of a catalog."""
 
-            try:
-                r = s.send(p, proxies=proxies)
-            except requests.exceptions.SSLError:
-                # als je van binnen het cbs download met je het http protocol gebruiken
-                url = url.replace("https", "http")
-                p = Request('GET', url, params=params).prepare()
-                r = s.send(p)
-            logger.info("Download " + p.url)
-            r.raise_for_status()
+    components = {"http": "https://" if options.use_https else "http://",
+                  "baseurl": _get_catalog_url(catalog_url),
+                  "catalog": CATALOG}
 
-            res = r.json(encoding='utf-8')
-            data.extend(res['value'])
+    return "{http}{baseurl}/{catalog}/Tables?$format=json".format(**components)
 
-            try:
-                url = res['odata.nextLink']
-            except KeyError:
-                url = None
 
-        return data
+def _get_labels(metadata):
+    """Get the title of each key of the dimension tables in the metadata."""
 
-    except requests.HTTPError as http_err:
-        raise requests.HTTPError(
-            "Downloading table '{}' failed. {}".format(table_id, str(http_err))
-        )
+    norm_cols = list(set(metadata.keys()) - set(NON_DIMENSION_TABLES))
+
+    return {norm_col: {r['Key']: r['Title'] for r in metadata[norm_col]}
+            for norm_col in norm_cols}
 
 
-def _save_data(data, dir, metadata_name):
-    """Save the data."""
+def _label_rows(rows, labels):
+    """Replace the dimension keys in the rows by the titles in labels.
 
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+    Keys without a title are kept.
+    """
 
-    fp = os.path.join(dir, metadata_name + '.json')
+    for row in rows:
 
-    with open(fp, 'w') as output_file:
-        json.dump(data, output_file, indent=2)
+        for norm_col, titles in labels.items():
+
+            if norm_col in row:
+                key = row[norm_col]
+                row[norm_col] = titles.get(key, key)
+
+    return rows
+
+
+OUTPUT_FORMATS = ["records"] + COLUMNAR_FORMATS
+
+
+def _check_output(output):
+    """Check if the output format is supported."""
+
+    if output not in OUTPUT_FORMATS:
+        raise ValueError("output must be one of '{}', not '{}'".format(
+            "', '".join(OUTPUT_FORMATS), output))
+
+
+def _label_data(metadata, data):
+    """Replace the dimension keys in the data by their titles."""
+
+    return _label_rows(data, _get_labels(metadata))
+
+
+def _get_dimensions(metadata, label=False):
+    """Get the keys (and titles if label is True) of each dimension table."""
+
+    norm_cols = [name for name in metadata.keys()
+                 if name not in NON_DIMENSION_TABLES]
+
+    return {norm_col: ([r['Key'] for r in metadata[norm_col]],
+                       [r['Title'] for r in metadata[norm_col]]
+                       if label else None)
+            for norm_col in norm_cols}
+
+
+def _data_set_to_output(metadata, output, label=True, categorical=True):
+    """Convert the data set in the metadata to a columnar output format.
+
+    The data set may be a list of rows or a dict with the values of each
+    column. The topics get the type of their Datatype in the DataProperties
+    (typed data set only) and the dimensions are stored as categories, with
+    the titles as labels if label is True. The dimensions are plain columns
+    if categorical is False.
+    """
+
+    data_set_name = "TypedDataSet" if "TypedDataSet" in metadata.keys() \
+        else "UntypedDataSet"
+    data = metadata[data_set_name]
+    if not isinstance(data, dict):
+        data = pages_to_columns([data])
+
+    dtypes = None
+    if data_set_name == "TypedDataSet":
+        dtypes = get_dtypes(metadata.get("DataProperties"))
+
+    return columns_to_output(data, output, dtypes=dtypes,
+                             dimensions=_get_dimensions(metadata, label=label),
+                             categorical=categorical)
+
+
+def _save_data(data, dir, metadata_name, save_format=None):
+    """Save the data in the format of options.save_format."""
+
+    _save_format = options.save_format if save_format is None \
+        else save_format
+
+    with DataWriter(dir, metadata_name, save_format=_save_format) as writer:
+        writer.write_rows(data)
+
+
+def _save_pages(pages, dir, metadata_name, save_format=None):
+    """Save each page while passing it on.
+
+    The file is only stored when all pages are saved.
+    """
+
+    _save_format = options.save_format if save_format is None \
+        else save_format
+
+    with DataWriter(dir, metadata_name, save_format=_save_format) as writer:
+        for page in pages:
+            writer.write_rows(page)
+            yield page
 
 
 def _filters(query):
@@ -223,8 +655,131 @@ def _select(select):
     return select
 
 
+def _get_metadata_table_names(table_id, typed=False, catalog_url=None,
+                              proxies=None, version=None):
+    """Get the names of the metadata tables to download for a table."""
+
+    # http://opendata.cbs.nl/ODataApi/OData/37506wwm?$format=json
+    metadata_tables = _download_metadata(
+        table_id, "", catalog_url=catalog_url, proxies=proxies,
+        version=version
+    )
+
+    # The names of the tables with metadata
+    metadata_table_names = [table['name'] for table in metadata_tables]
+
+    # Download only the typed or untyped data
+    typed_or_not_str = "TypedDataSet" if typed else "UntypedDataSet"
+    metadata_table_names.remove(typed_or_not_str)
+
+    return metadata_table_names
+
+
+def _download_tables(table_id, table_names, select=None, filters=None,
+                     catalog_url=None, proxies=None, max_workers=None,
+                     prefetch=None, table_infos=None, version=None,
+                     columnar=False, dir=None, save_format=None):
+    """Download the metadata tables in the order of table_names.
+
+    The table information is not downloaded again if given. The data set is
+    collected per column if columnar is True. If dir is given, the tables
+    are saved while they are downloaded.
+    """
+
+    _max_workers = options.max_workers if max_workers is None else max_workers
+    _prefetch = options.prefetch_pages if prefetch is None else prefetch
+
+    downloaded = {}
+    record_count = None
+
+    if table_infos is not None:
+        downloaded["TableInfos"] = table_infos
+
+    if _prefetch > 1 and not filters and "TableInfos" in table_names:
+        # the number of rows is needed to request several pages at once
+        if "TableInfos" not in downloaded:
+            downloaded["TableInfos"] = _download_metadata(
+                table_id, "TableInfos", catalog_url=catalog_url,
+                proxies=proxies, version=version
+            )
+        record_count = _get_record_count(downloaded["TableInfos"])
+
+    def download_table(table_name):
+
+        # download table
+        if table_name in downloaded:
+            if dir:
+                _save_data(downloaded[table_name], dir, table_name,
+                           save_format=save_format)
+            return downloaded[table_name]
+        elif table_name in ["TypedDataSet", "UntypedDataSet"]:
+            return _download_metadata(table_id, table_name,
+                                      select=select, filters=filters,
+                                      catalog_url=catalog_url,
+                                      proxies=proxies, prefetch=_prefetch,
+                                      record_count=record_count,
+                                      version=version, columnar=columnar,
+                                      dir=dir, save_format=save_format)
+        else:
+            return _download_metadata(table_id, table_name,
+                                      catalog_url=catalog_url,
+                                      proxies=proxies, version=version,
+                                      dir=dir, save_format=save_format)
+
+    if _max_workers > 1:
+        # the tables are independent, download them at the same time. The
+        # results are returned in the order of table_names.
+        with ThreadPoolExecutor(max_workers=_max_workers) as executor:
+            return list(executor.map(download_table, table_names))
+    else:
+        return list(map(download_table, table_names))
+
+
+def _download_data(table_id, typed=False, select=None, filters=None,
+                   catalog_url=None, proxies=None, max_workers=None,
+                   prefetch=None, columnar=False, dir=None,
+                   save_format=None):
+    """Download the metadata tables of a table.
+
+    If dir is given, the tables are saved while they are downloaded.
+
+    Returns
+    -------
+    dict
+        The (meta)data of the table. The data set is a dict with the values
+        of each column if columnar is True.
+    """
+
+    _catalog_url = _get_catalog_url(catalog_url)
+
+    table_infos = None
+    version = None
+    if options.cache is not None:
+        # the Modified field of the table information tells whether the
+        # cached tables are still valid
+        table_infos = _get_table_infos(table_id, catalog_url=_catalog_url,
+                                       proxies=proxies)
+        version = _get_table_version(table_infos)
+
+    metadata_table_names = _get_metadata_table_names(
+        table_id, typed=typed, catalog_url=_catalog_url, proxies=proxies,
+        version=version
+    )
+
+    tables = _download_tables(table_id, metadata_table_names, select=select,
+                              filters=filters, catalog_url=_catalog_url,
+                              proxies=proxies, max_workers=max_workers,
+                              prefetch=prefetch, table_infos=table_infos,
+                              version=version, columnar=columnar, dir=dir,
+                              save_format=save_format)
+
+    return dict(zip(metadata_table_names, tables))
+
+
 def download_data(table_id, dir=None, typed=False, select=None, filters=None,
-                  catalog_url=None, proxies=None):
+                  catalog_url=None, proxies=None, max_workers=None,
+                  prefetch=None, output="records", categorical=True,
+                  save_format=None):
     """Download the CBS data and metadata.
 
     Parameters
@@ -245,47 +800,65 @@ def download_data(table_id, dir=None, typed=False, select=None, filters=None,
     proxies : dict
         Dictionary mapping protocol to the URL of the proxy to be
         used on each Request. Default None.
+    max_workers : int
+        The number of metadata tables to download at the same time.
+        Default None, which means options.max_workers is used.
+    prefetch : int
+        The number of pages of the data set to request ahead while a
+        page is processed. If larger than one and no filters are given,
+        the pages are requested as windows of rows at the same time.
+        Default None, which means options.prefetch_pages is used.
+    output : str
+        The format of each table: "records" for a list of dicts, "pandas"
+        (or "dataframe") for a pandas.DataFrame, "arrow" for a
+        pyarrow.Table or "numpy" for a numpy record array. The columnar
+        formats type the topics of the data set by the Datatype in the
+        DataProperties and store the dimension keys as categories. Default
+        "records".
+    categorical : bool
+        Store the dimension columns of the columnar formats as categories
+        (pandas) or dictionary arrays (arrow). If False, the dimensions are
+        plain columns. Default True.
+    save_format : str
+        The format of the files in dir: "json", "ndjson", "ndjson.gz" or
+        "ndjson.zst" (see cbsodata.storage). The pages of the data set are
+        written as soon as they are downloaded. Default None, which means
+        options.save_format is used.
 
     Returns
     -------
-    list
+    dict
         A dictionary with the (meta)data of the table
     """
 
-    _catalog_url = _get_catalog_url(catalog_url)
+    _check_output(output)
 
-    # http://opendata.cbs.nl/ODataApi/OData/37506wwm?$format=json
-    metadata_tables = _download_metadata(
-        table_id, "", catalog_url=_catalog_url, proxies=proxies
-    )
+    columnar = output != "records"
 
-    # The names of the tables with metadata
-    metadata_table_names = [table['name'] for table in metadata_tables]
+    _save_format = options.save_format if save_format is None \
+        else save_format
+    check_save_format(_save_format)
 
-    # Download only the typed or untyped data
-    typed_or_not_str = "TypedDataSet" if typed else "UntypedDataSet"
-    metadata_table_names.remove(typed_or_not_str)
+    # the tables are saved while they are downloaded
+    metadata = _download_data(table_id, typed=typed, select=select,
+                              filters=filters, catalog_url=catalog_url,
+                              proxies=proxies, max_workers=max_workers,
+                              prefetch=prefetch, columnar=columnar, dir=dir,
+                              save_format=_save_format)
 
     data = {}
 
-    for table_name in metadata_table_names:
+    for table_name, table in metadata.items():
 
-        # download table
-        if table_name in ["TypedDataSet", "UntypedDataSet"]:
-            metadata = _download_metadata(table_id, table_name,
-                                          select=select, filters=filters,
-                                          catalog_url=_catalog_url,
-                                          proxies=proxies)
+        if not columnar:
+            data[table_name] = table
+        elif table_name in ["TypedDataSet", "UntypedDataSet"]:
+            data[table_name] = _data_set_to_output(metadata, output,
+                                                   label=False,
+                                                   categorical=categorical)
         else:
-            metadata = _download_metadata(table_id, table_name,
-                                          catalog_url=_catalog_url,
-                                          proxies=proxies)
-
-        data[table_name] = metadata
-
-        # save the data
-        if dir:
-            _save_data(metadata, dir, table_name)
+            data[table_name] = columns_to_output(pages_to_columns([table]),
+                                                 output)
 
     return data
 
@@ -317,13 +890,8 @@ def get_table_list(select=None, filters=None, catalog_url=None, proxies=None):
     # http://opendata.cbs.nl/ODataCatalog/Tables?$format=json
 
     _proxies = options.proxies if proxies is None else proxies
-    _catalog_url = _get_catalog_url(catalog_url)
 
-    components = {"http": "https://" if options.use_https else "http://",
-                  "baseurl": _catalog_url,
-                  "catalog": CATALOG}
-
-    url = "{http}{baseurl}/{catalog}/Tables?$format=json".format(**components)
+    url = _get_table_list_url(catalog_url)
 
     params = {}
     if select:
@@ -332,14 +900,7 @@ def get_table_list(select=None, filters=None, catalog_url=None, proxies=None):
         params['$filter'] = _filters(filters)
 
     try:
-        s = Session()
-        p = Request('GET', url, params=params).prepare()
-
-        logger.info("Download " + p.url)
-
-        r = s.send(p, proxies=_proxies)
-        r.raise_for_status()
-        res = r.json()
+        res = _get_json(url, params=params, proxies=_proxies)
 
         return res['value']
 
@@ -370,9 +931,8 @@ def get_info(table_id, catalog_url=None, proxies=None):
 
     _proxies = options.proxies if proxies is None else proxies
 
-    info_list = _download_metadata(
+    info_list = _get_table_infos(
         table_id,
-        "TableInfos",
         catalog_url=_get_catalog_url(catalog_url),
         proxies=_proxies,
     )
@@ -383,7 +943,8 @@ def get_info(table_id, catalog_url=None, proxies=None):
         return None
 
 
-def get_meta(table_id, name, catalog_url=None, proxies=None):
+def get_meta(table_id, name, catalog_url=None, proxies=None,
+             output="records"):
     """Get the metadata of a table.
 
     Parameters
@@ -397,25 +958,37 @@ def get_meta(table_id, name, catalog_url=None, proxies=None):
     proxies : dict
         Dictionary mapping protocol to the URL of the proxy to be
         used on each Request. Default None.
+    output : str
+        The format of the metadata: "records", "pandas" (or "dataframe"),
+        "arrow" or "numpy". Default "records".
 
     Returns
     -------
-    list
-        A list with metadata (dict type)
+    list, pandas.DataFrame, pyarrow.Table, numpy.recarray
+        The metadata
     """
 
+    _check_output(output)
+
     _proxies = options.proxies if proxies is None else proxies
 
-    return _download_metadata(
+    metadata = _download_metadata(
         table_id,
         name,
         catalog_url=_get_catalog_url(catalog_url),
         proxies=_proxies,
+        columnar=output != "records",
     )
 
+    if output == "records":
+        return metadata
+
+    return columns_to_output(metadata, output)
+
 
 def get_data(table_id, dir=None, typed=False, select=None, filters=None,
-             catalog_url=None, proxies=None):
+             catalog_url=None, proxies=None, max_workers=None, prefetch=None,
+             output="records", categorical=True, save_format=None):
     """Get the CBS data table.
 
     Parameters
@@ -436,15 +1009,59 @@ def get_data(table_id, dir=None, typed=False, select=None, filters=None,
     proxies : dict
         Dictionary mapping protocol to the URL of the proxy to be
         used on each Request. Default None.
+    max_workers : int
+        The number of metadata tables to download at the same time.
+        Default None, which means options.max_workers is used.
+    prefetch : int
+        The number of pages of the data set to request ahead while a
+        page is processed. If larger than one and no filters are given,
+        the pages are requested as windows of rows at the same time.
+        Default None, which means options.prefetch_pages is used.
+    output : str
+        The format of the data: "records" for a list of dicts, "pandas"
+        (or "dataframe") for a pandas.DataFrame, "arrow" for a
+        pyarrow.Table or "numpy" for a numpy record array. The pages are
+        collected per column for the columnar formats. The topics get the
+        type of their Datatype in the DataProperties and the dimensions are
+        categories labeled by their titles. Default "records".
+    categorical : bool
+        Store the dimension columns of the columnar formats as categories
+        (pandas) or dictionary arrays (arrow). If False, the dimensions are
+        plain columns with the titles. Default True.
+    save_format : str
+        The format of the files in dir, see download_data. Default None,
+        which means options.save_format is used.
 
     Returns
     -------
-    list
+    list, pandas.DataFrame, pyarrow.Table, numpy.recarray
         The requested data.
     """
 
+    _check_output(output)
+
     _proxies = options.proxies if proxies is None else proxies
     _catalog_url = _get_catalog_url(catalog_url)
+    _save_format = options.save_format if save_format is None \
+        else save_format
+    check_save_format(_save_format)
+
+    if output != "records":
+        metadata = _download_data(
+            table_id,
+            typed=typed,
+            select=select,
+            filters=filters,
+            catalog_url=_catalog_url,
+            proxies=_proxies,
+            max_workers=max_workers,
+            prefetch=prefetch,
+            columnar=True,
+            dir=dir,
+            save_format=_save_format,
+        )
+
+        return _data_set_to_output(metadata, output, categorical=categorical)
 
     metadata = download_data(
         table_id,
@@ -454,6 +1071,9 @@ def get_data(table_id, dir=None, typed=False, select=None, filters=None,
         filters=filters,
         catalog_url=_catalog_url,
         proxies=_proxies,
+        max_workers=max_workers,
+        prefetch=prefetch,
+        save_format=_save_format,
     )
 
     if "TypedDataSet" in metadata.keys():
@@ -461,27 +1081,104 @@ def get_data(table_id, dir=None, typed=False, select=None, filters=None,
     else:
         data = metadata["UntypedDataSet"]
 
-    exclude = [
-        "TableInfos", "TypedDataSet", "UntypedDataSet",
-        "DataProperties", "CategoryGroups"
-    ]
+    return _label_data(metadata, data)
 
-    norm_cols = list(set(metadata.keys()) - set(exclude))
 
-    for norm_col in norm_cols:
-        metadata[norm_col] = {r['Key']: r for r in metadata[norm_col]}
+def iter_data(table_id, typed=False, select=None, filters=None,
+              catalog_url=None, proxies=None, batches=False, max_workers=None,
+              prefetch=None, max_rows=None):
+    """Iterate over the rows of the CBS data table.
 
-    for i in range(0, len(data)):
+    The rows are yielded as soon as the page holding them has been
+    downloaded, so only one page of the data set is kept in memory. The
+    dimension keys are replaced by their titles, as in get_data.
 
-        for norm_col in norm_cols:
+    Parameters
+    ----------
+    table_id : str
+        The identifier of the table.
+    typed : bool
+        Return a typed data table. Default False.
+    select : list
+        Column label or list of column labels to return.
+    filters : str
+        Return only rows that agree on the filter.
+    catalog_url : str
+        The url of the catalog. Default "opendata.cbs.nl".
+    proxies : dict
+        Dictionary mapping protocol to the URL of the proxy to be
+        used on each Request. Default None.
+    batches : bool
+        Yield the rows per page (a list of dicts) instead of row by
+        row. Default False.
+    max_workers : int
+        The number of dimension tables to download at the same time.
+        Default None, which means options.max_workers is used.
+    prefetch : int
+        The number of pages of the data set to request ahead while a
+        page is processed. If larger than one and no filters are given,
+        the pages are requested as windows of rows at the same time.
+        Default None, which means options.prefetch_pages is used.
+    max_rows : int
+        Only return the first max_rows rows. The number of rows is passed
+        to the server ($top), so no more rows are downloaded than needed.
+        The pages are not prefetched in that case. Default None, which
+        means all rows are returned.
+
+    Yields
+    ------
+    dict, list
+        A row of the data table, or a list of rows if batches is True.
+    """
 
-            try:
-                v = data[i][norm_col]
-                data[i][norm_col] = metadata[norm_col][v]['Title']
-            except KeyError:
-                pass
+    _proxies = options.proxies if proxies is None else proxies
+    _catalog_url = _get_catalog_url(catalog_url)
+    _prefetch = options.prefetch_pages if prefetch is None else prefetch
+    if max_rows is not None:
+        _prefetch = 0
+
+    table_infos = None
+    version = None
+    if options.cache is not None or (_prefetch > 1 and not filters):
+        # the version is used to validate the cache and the number of rows
+        # to request several pages at once
+        table_infos = _get_table_infos(table_id, catalog_url=_catalog_url,
+                                       proxies=_proxies)
+        version = _get_table_version(table_infos)
+
+    record_count = None
+    if _prefetch > 1 and not filters:
+        record_count = _get_record_count(table_infos)
+
+    metadata_table_names = _get_metadata_table_names(
+        table_id, typed=typed, catalog_url=_catalog_url, proxies=_proxies,
+        version=version
+    )
 
-    return data
+    # the dimension tables are needed to label the rows
+    data_set_name = [name for name in metadata_table_names
+                     if name in ["TypedDataSet", "UntypedDataSet"]][0]
+    dimension_names = [name for name in metadata_table_names
+                       if name not in NON_DIMENSION_TABLES]
+    dimension_tables = _download_tables(table_id, dimension_names,
+                                        catalog_url=_catalog_url,
+                                        proxies=_proxies,
+                                        max_workers=max_workers,
+                                        version=version)
+    labels = _get_labels(dict(zip(dimension_names, dimension_tables)))
+
+    for page in _iter_metadata_pages(table_id, data_set_name, select=select,
+                                     filters=filters, catalog_url=_catalog_url,
+                                     proxies=_proxies, prefetch=_prefetch,
+                                     record_count=record_count,
+                                     version=version, max_rows=max_rows):
+        page = _label_rows(page, labels)
+
+        if batches:
+            yield page
+        else:
+            for row in page:
+                yield row
 
 
 @contextmanager
@@ -0,0 +1,267 @@
+"""
+Columnar conversion of the OData tables
+
+The rows of the pages of a table are collected as one list of values per column
+(:func:`pages_to_columns`), which is converted in one go to a pandas DataFrame,
+a pyarrow Table or a numpy record array (:func:`columns_to_output`). The types
+of the columns follow the *Datatype* of the DataProperties and the dimension
+columns are dictionary encoded: an array of integer codes and one list of labels.
+
+pandas, numpy and pyarrow are only imported when the corresponding output is
+requested.
+"""
+
+# The Datatypes of the DataProperties holding integer and floating point numbers
+INTEGER_TYPES = ["Short", "Integer", "Long"]
+FLOAT_TYPES = ["Float", "Double", "Decimal"]
+
+# The output formats built from the columns of a table
+COLUMNAR_FORMATS = ["dataframe", "pandas", "arrow", "numpy"]
+
+
+def pages_to_columns(pages):
+    """
+    Collect the rows of the pages in one list of values per column
+
+    Parameters
+    ----------
+    pages: iterable
+        Iterable of pages, each page being a list of rows (dicts)
+
+    Returns
+    -------
+    dict:
+        The values of each column, in the order of the keys of the rows
+    """
+
+    columns = dict()
+    n_rows = 0
+
+    for page in pages:
+        if not page:
+            continue
+
+        for key in page[0].keys():
+            if key not in columns:
+                # a column which was missing in the previous pages
+                columns[key] = [None] * n_rows
+
+        for key, values in columns.items():
+            values.extend([row.get(key) for row in page])
+
+        n_rows += len(page)
+
+    return columns
+
+
+def columns_to_records(columns):
+    """ Convert the columns back to a list of rows (dicts) """
+
+    names = list(columns.keys())
+
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def get_dtypes(data_properties):
+    """
+    Get the Datatype of each topic in the DataProperties
+
+    Returns
+    -------
+    dict:
+        The Datatype per key of the topics
+    """
+
+    if not data_properties:
+        return dict()
+
+    return {prop["Key"]: prop["Datatype"] for prop in data_properties
+            if prop.get("Datatype") is not None}
+
+
+def encode_dimension(values, keys, titles=None):
+    """
+    Encode the values of a dimension column as codes into a list of labels
+
+    Parameters
+    ----------
+    values: list
+        The keys of the dimension in each row
+    keys: list
+        All the keys of the dimension, in the order of the dimension table
+    titles: list, optional
+        The title of each key. If given, the labels are the titles, otherwise the keys
+
+    Returns
+    -------
+    tuple:
+        The codes (numpy array of integers, -1 for missing values) and the labels. Keys which are
+        not in the dimension table are labeled by the key itself
+    """
+    import numpy as np
+    import pandas as pd
+
+    values = np.asarray(values, dtype=object)
+    labels = list(keys if titles is None else titles)
+
+    # the position of the first occurrence of each key
+    positions = dict()
+    for position, key in enumerate(keys):
+        positions.setdefault(key, position)
+    key_index = pd.Index(list(positions.keys()), dtype=object)
+    key_positions = np.array(list(positions.values()) + [-1], dtype=np.int64)
+
+    codes = key_positions[key_index.get_indexer(values)]
+
+    unknown = (codes < 0) & pd.notna(values)
+    if unknown.any():
+        extra = pd.unique(values[unknown])
+        codes[unknown] = len(labels) + pd.Index(extra, dtype=object).get_indexer(values[unknown])
+        labels.extend(extra)
+
+    # different keys may have the same title: make the labels unique
+    label_codes, categories = pd.factorize(pd.Index(labels, dtype=object))
+    codes = np.where(codes >= 0, label_codes[codes], -1)
+
+    return codes, list(categories)
+
+
+def decode_dimension(codes, labels):
+    """ Replace the codes of :func:`encode_dimension` by their labels (an object array) """
+    import numpy as np
+
+    # the missing values (-1) get the last label, which is None
+    return np.array(list(labels) + [None], dtype=object)[codes]
+
+
+def _is_missing(values):
+    return any(value is None for value in values)
+
+
+def columns_to_pandas(columns, dtypes=None, dimensions=None, categorical=True):
+    """ Convert the columns to a pandas DataFrame, see :func:`columns_to_output` """
+    import numpy as np
+    import pandas as pd
+
+    dtypes = dtypes or dict()
+    dimensions = dimensions or dict()
+
+    data = dict()
+    for name, values in columns.items():
+        datatype = dtypes.get(name)
+        if name in dimensions:
+            codes, categories = encode_dimension(values, *dimensions[name])
+            if categorical:
+                data[name] = pd.Categorical.from_codes(codes, categories=categories)
+            else:
+                data[name] = decode_dimension(codes, categories)
+        elif datatype in INTEGER_TYPES:
+            data[name] = pd.array(values, dtype="Int64")
+        elif datatype in FLOAT_TYPES:
+            data[name] = np.array(values, dtype=np.float64)
+        else:
+            data[name] = values
+
+    return pd.DataFrame(data, columns=list(columns.keys()))
+
+
+def columns_to_numpy(columns, dtypes=None, dimensions=None):
+    """ Convert the columns to a numpy record array, see :func:`columns_to_output` """
+    import numpy as np
+
+    dtypes = dtypes or dict()
+    dimensions = dimensions or dict()
+
+    if not columns:
+        return np.rec.array(np.empty(0, dtype=[]))
+
+    arrays = list()
+    for name, values in columns.items():
+        datatype = dtypes.get(name)
+        if name in dimensions:
+            # numpy has no categorical type, so the codes are always replaced by the labels
+            codes, categories = encode_dimension(values, *dimensions[name])
+            arrays.append(decode_dimension(codes, categories))
+        elif datatype in INTEGER_TYPES and not _is_missing(values):
+            arrays.append(np.array(values, dtype=np.int64))
+        elif datatype in INTEGER_TYPES or datatype in FLOAT_TYPES:
+            # integers with missing values are stored as floats with nan
+            arrays.append(np.array(values, dtype=np.float64))
+        elif _is_missing(values):
+            arrays.append(np.array(values, dtype=object))
+        else:
+            arrays.append(np.array(values))
+
+    return np.rec.fromarrays(arrays, names=list(columns.keys()))
+
+
+def columns_to_arrow(columns, dtypes=None, dimensions=None, categorical=True):
+    """ Convert the columns to a pyarrow Table, see :func:`columns_to_output` """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("output='arrow' requires pyarrow. Install it with 'pip install pyarrow'")
+
+    dtypes = dtypes or dict()
+    dimensions = dimensions or dict()
+
+    arrays = list()
+    for name, values in columns.items():
+        datatype = dtypes.get(name)
+        if name in dimensions:
+            codes, categories = encode_dimension(values, *dimensions[name])
+            if categorical:
+                indices = pa.array(codes, type=pa.int32(), mask=codes < 0)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(categories)))
+            else:
+                arrays.append(pa.array(decode_dimension(codes, categories)))
+        elif datatype in INTEGER_TYPES:
+            arrays.append(pa.array(values, type=pa.int64()))
+        elif datatype in FLOAT_TYPES:
+            arrays.append(pa.array(values, type=pa.float64()))
+        else:
+            arrays.append(pa.array(values))
+
+    return pa.Table.from_arrays(arrays, names=list(columns.keys()))
+
+
+def columns_to_output(columns, output, dtypes=None, dimensions=None, categorical=True):
+    """
+    Convert the columns to the output format
+
+    Parameters
+    ----------
+    columns: dict
+        The list of values of each column
+    output: {"dataframe", "pandas", "arrow", "numpy", "records"}
+        The output format
+    dtypes: dict, optional
+        The Datatype of the DataProperties per column. Columns with an integer or float Datatype
+        are converted to integer (pandas: nullable Int64) and float types. Other columns keep
+        their values
+    dimensions: dict, optional
+        The dimension columns, as a tuple with the keys and titles (or None) of the dimension.
+        These columns are stored as categoricals (pandas), dictionary arrays (arrow) or labels
+        (numpy)
+    categorical: bool, optional
+        Store the dimension columns as categoricals (pandas) and dictionary arrays (arrow). If
+        False, the labels are stored in plain (object) columns. Default = True
+
+    Returns
+    -------
+    pandas.DataFrame, pyarrow.Table, numpy.recarray or list
+        The converted columns
+    """
+
+    if output in ("dataframe", "pandas"):
+        return columns_to_pandas(columns, dtypes=dtypes, dimensions=dimensions,
+                                 categorical=categorical)
+    elif output == "arrow":
+        return columns_to_arrow(columns, dtypes=dtypes, dimensions=dimensions,
+                                categorical=categorical)
+    elif output == "numpy":
+        return columns_to_numpy(columns, dtypes=dtypes, dimensions=dimensions)
+    elif output == "records":
+        return columns_to_records(columns)
+    else:
+        raise ValueError(f"Output format {output} is not supported")
@@ -0,0 +1,417 @@
+"""
+Caches for the data frames of a StatLineTable
+
+The question, section and dimension data frames of a
+:class:`cbsodata.utils.StatLineTable` are stored in the cache directory in one
+of the following formats:
+
+* *parquet*: compressed column store. Supports column projection and predicate
+  pushdown, so only the row groups and columns needed are read
+* *feather*: uncompressed Arrow IPC files which are memory mapped on reading
+* *pickle*: the pandas pickles of the earlier versions
+
+The feather and parquet formats require pyarrow. All formats support the
+*columns* and *filters* arguments of :meth:`FrameCache.read`, for example to
+load only module 46::
+
+    >>> cache = get_frame_cache("parquet", "cache", "84410NED")
+    >>> question_df = cache.read("question", filters=[("L0", "==", 46)])
+
+Next to the data frames, a stamp file records the format, the layout version
+of the cache (:data:`CACHE_VERSION`) and the version of the table (the
+*Modified* field of the TableInfos). A cache with another stamp is stale and
+is rebuilt.
+"""
+
+__all__ = ['CACHE_VERSION', 'FRAME_CACHE_FORMATS', 'FrameCache', 'PickleFrameCache',
+           'FeatherFrameCache', 'ParquetFrameCache', 'get_frame_cache']
+
+import json
+import logging
+import operator
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Increase the version when the layout of the cached data frames changes, which invalidates all
+# existing caches
+CACHE_VERSION = 1
+
+FRAME_CACHE_FORMATS = ["parquet", "feather", "pickle"]
+
+# the comparison operators of the filters
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _check_filters(filters):
+    """ Check the filters: a list of (column, operator, value) tuples which must all be true """
+    for column, op, value in filters:
+        if op not in FILTER_OPERATORS and op not in ("in", "not in"):
+            raise ValueError(f"Filter operator {op} is not supported")
+
+
+def _filter_frame(df, filters):
+    """ Select the rows of the data frame (with columns or index levels) agreeing on the filters """
+    _check_filters(filters)
+
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        if column in df.columns:
+            values = df[column]
+        else:
+            values = pd.Series(df.index.get_level_values(column), index=df.index)
+        if op == "in":
+            mask &= values.isin(value)
+        elif op == "not in":
+            mask &= ~values.isin(value)
+        else:
+            mask &= FILTER_OPERATORS[op](values, value)
+
+    return df[mask.values]
+
+
+class FrameCache(object):
+    """
+    Base class of the data frame caches
+
+    Parameters
+    ----------
+    directory: str or Path
+        The cache directory
+    table_id: str
+        The ID of the table. The names of the files start with the table ID
+
+    Attributes
+    ----------
+    format: str
+        The name of the format, stored in the stamp
+    suffix: str
+        The suffix of the data frame files
+    """
+
+    format = None
+    suffix = None
+
+    def __init__(self, directory, table_id):
+        self.directory = Path(directory)
+        self.table_id = table_id
+        self.stamp_file = self.directory / f"{table_id}_cache.json"
+
+    def file_name(self, label):
+        """ The name of the file storing the data frame with label *label* """
+        return self.directory / ("_".join([self.table_id, label]) + self.suffix)
+
+    def make_stamp(self, table_version=None):
+        """ The stamp of the cache for the version of the table """
+        return dict(format=self.format, cache_version=CACHE_VERSION, table_version=table_version)
+
+    def is_valid(self, labels, table_version=None):
+        """
+        Check if the data frames can be read from the cache
+
+        Parameters
+        ----------
+        labels: list
+            The labels of the data frames which must be in the cache
+        table_version: str, optional
+            The current version of the table
+
+        Returns
+        -------
+        bool:
+            True if all the data frames are stored with the same stamp
+        """
+        try:
+            with open(self.stamp_file, "r") as stream:
+                stamp = json.load(stream)
+        except (IOError, ValueError):
+            return False
+
+        if stamp != self.make_stamp(table_version=table_version):
+            logger.info(f"Cache of {self.table_id} is stale: {stamp}")
+            return False
+
+        return all(self.file_name(label).exists() for label in labels)
+
+    def write_stamp(self, table_version=None):
+        """ Write the stamp after all data frames have been written """
+        with open(self.stamp_file, "w") as stream:
+            json.dump(self.make_stamp(table_version=table_version), stream)
+
+    def read(self, label, columns=None, filters=None):
+        """
+        Read a data frame from the cache
+
+        Parameters
+        ----------
+        label: str
+            The label of the data frame, such as "question"
+        columns: list, optional
+            Only read these columns. The index is always read. Default = None (all columns)
+        filters: list, optional
+            Only read the rows agreeing on all filters. A filter is a tuple (column, operator,
+            value), where the column can be an index level and the operator one of ==, !=, <, <=,
+            >, >=, in and not in. Default = None (all rows)
+
+        Returns
+        -------
+        DataFrame:
+            The stored data frame
+        """
+        raise NotImplementedError
+
+    def write(self, label, df):
+        """ Write the data frame with label *label* to the cache """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Remove the stamp, which invalidates the stored data frames """
+        try:
+            self.stamp_file.unlink()
+        except OSError:
+            pass
+
+
+class PickleFrameCache(FrameCache):
+    """
+    Store the data frames as pandas pickles. The projection and filters are applied after reading
+    """
+
+    format = "pickle"
+    suffix = ".pkl"
+
+    def read(self, label, columns=None, filters=None):
+        df = pd.read_pickle(self.file_name(label))
+        if filters:
+            df = _filter_frame(df, filters)
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+
+    def write(self, label, df):
+        df.to_pickle(self.file_name(label))
+
+
+class ArrowFrameCache(FrameCache):
+    """
+    Base class of the caches based on Arrow tables
+
+    The index is stored as columns. Columns of object type (for instance an ID column with
+    integers and None) are restored with their python values. Object columns which Arrow can not
+    store (mixing strings and numbers) are stored as json strings
+    """
+
+    metadata_key = b"cbsodata"
+
+    def __init__(self, directory, table_id):
+        super(ArrowFrameCache, self).__init__(directory, table_id)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(f"The {self.format} cache requires pyarrow. Install it with "
+                              "'pip install pyarrow' or use the pickle cache")
+
+    def to_arrow(self, df):
+        """ Convert the data frame to an Arrow table with the information to restore it """
+        import pyarrow as pa
+
+        # the index is stored in columns, where unnamed levels get a placeholder name
+        index_names = list(df.index.names)
+        index_columns = [f"__index_level_{level}__" if name is None else name
+                         for level, name in enumerate(index_names)]
+        integer_levels = list()
+        level_dtypes = list()
+        if isinstance(df.index, pd.MultiIndex):
+            # integer levels with missing values become floats by the reset of the index
+            integer_levels = [name for name, level in zip(index_columns, df.index.levels)
+                              if level.dtype.kind in "iu"]
+            level_dtypes = [str(level.dtype) for level in df.index.levels]
+        df = df.rename_axis(index_columns).reset_index()
+        for name in integer_levels:
+            df[name] = df[name].astype("Int64")
+
+        object_columns = [c for c in df.columns if df[c].dtype == object or c in integer_levels]
+        json_columns = list()
+        for column in object_columns:
+            try:
+                pa.array(df[column], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                json_columns.append(column)
+        if json_columns:
+            df = df.copy()
+            for column in json_columns:
+                df[column] = [json.dumps(value) for value in df[column]]
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        info = dict(index=index_columns, index_names=index_names, level_dtypes=level_dtypes,
+                    object_columns=object_columns, json_columns=json_columns)
+        metadata = dict(table.schema.metadata or {})
+        metadata[self.metadata_key] = json.dumps(info).encode("utf-8")
+
+        return table.replace_schema_metadata(metadata)
+
+    def from_arrow(self, table):
+        """ Convert the Arrow table back to the original data frame """
+        import pyarrow as pa
+
+        info = json.loads(table.schema.metadata[self.metadata_key].decode("utf-8"))
+        df = table.to_pandas()
+
+        for column in info["object_columns"]:
+            if column not in df.columns:
+                continue
+            if column in info["json_columns"]:
+                df[column] = [json.loads(value) for value in df[column]]
+            elif pa.types.is_integer(table.schema.field(column).type):
+                # integers with missing values: python ints and None, as before storing
+                values = table.column(column).to_pandas(types_mapper={
+                    table.schema.field(column).type: pd.Int64Dtype()}.get).astype(object)
+                df[column] = values.where(values.notna(), None)
+            elif df[column].dtype != object:
+                df[column] = df[column].astype(object)
+
+        df.set_index(info["index"], inplace=True, drop=True)
+        df.index.names = info["index_names"]
+        if isinstance(df.index, pd.MultiIndex):
+            # a selection of rows may have changed the type of the levels, such as a level which
+            # only has missing values left
+            for position, dtype in enumerate(info["level_dtypes"]):
+                if str(df.index.levels[position].dtype) != dtype:
+                    df.index = df.index.set_levels([df.index.levels[position].astype(dtype)],
+                                                   level=[position])
+
+        return df
+
+    def _read_columns(self, label, columns):
+        """ The columns to read: the requested columns and the index """
+        if columns is None:
+            return None
+
+        schema = self._read_schema(label)
+        info = json.loads(schema.metadata[self.metadata_key].decode("utf-8"))
+        return info["index"] + [c for c in columns if c not in info["index"]]
+
+    def _read_schema(self, label):
+        raise NotImplementedError
+
+
+class FeatherFrameCache(ArrowFrameCache):
+    """
+    Store the data frames as uncompressed Arrow IPC (feather) files, which are memory mapped on
+    reading. The filters are applied to the memory mapped table before converting it to pandas
+    """
+
+    format = "feather"
+    suffix = ".feather"
+
+    def _read_schema(self, label):
+        import pyarrow as pa
+
+        with pa.memory_map(str(self.file_name(label)), "r") as source:
+            return pa.ipc.open_file(source).schema
+
+    def read(self, label, columns=None, filters=None):
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+
+        table = feather.read_table(str(self.file_name(label)),
+                                   columns=self._read_columns(label, columns), memory_map=True)
+        if filters:
+            _check_filters(filters)
+            table = table.filter(pq.filters_to_expression(filters))
+
+        return self.from_arrow(table)
+
+    def write(self, label, df):
+        import pyarrow.feather as feather
+
+        feather.write_feather(self.to_arrow(df), str(self.file_name(label)),
+                              compression="uncompressed")
+
+
+class ParquetFrameCache(ArrowFrameCache):
+    """
+    Store the data frames as Parquet files. The filters are pushed down to the reader, which
+    skips the row groups that do not agree on the filters
+
+    Parameters
+    ----------
+    row_group_size: int, optional
+        Maximum number of rows per row group. Default = 100000
+    """
+
+    format = "parquet"
+    suffix = ".parquet"
+
+    def __init__(self, directory, table_id, row_group_size=100000):
+        super(ParquetFrameCache, self).__init__(directory, table_id)
+        self.row_group_size = row_group_size
+
+    def _read_schema(self, label):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(str(self.file_name(label)))
+
+    def read(self, label, columns=None, filters=None):
+        import pyarrow.parquet as pq
+
+        if filters:
+            _check_filters(filters)
+        table = pq.read_table(str(self.file_name(label)),
+                              columns=self._read_columns(label, columns),
+                              filters=filters or None, memory_map=True)
+
+        return self.from_arrow(table)
+
+    def write(self, label, df):
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(df), str(self.file_name(label)),
+                       row_group_size=self.row_group_size)
+
+
+def get_frame_cache(cache_format, directory, table_id):
+    """
+    Get the data frame cache of a table
+
+    Parameters
+    ----------
+    cache_format: {"parquet", "feather", "pickle", None}
+        The format of the cache. None means parquet if pyarrow is installed, otherwise pickle
+    directory: str or Path
+        The cache directory
+    table_id: str
+        The ID of the table
+
+    Returns
+    -------
+    FrameCache:
+        The cache
+    """
+    if cache_format is None:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            cache_format = "pickle"
+        else:
+            cache_format = "parquet"
+
+    if cache_format == "parquet":
+        return ParquetFrameCache(directory, table_id)
+    elif cache_format == "feather":
+        return FeatherFrameCache(directory, table_id)
+    elif cache_format == "pickle":
+        return PickleFrameCache(directory, table_id)
+    else:
+        raise ValueError("cache_format must be one of '{}', not '{}'".format(
+            "', '".join(FRAME_CACHE_FORMATS), cache_format))
@@ -0,0 +1,106 @@
+"""
+Decoding of the json responses and files
+
+The responses of the OData API and the stored tables are decoded by the fastest json library
+which is installed, in the order of :data:`JSON_DECODERS`: orjson, ujson, simdjson (pysimdjson)
+and the json module of the standard library. The documents are decoded straight from their
+bytes, without making a text copy first::
+
+    >>> loads = get_loads()
+    >>> loads(b'{"value": [{"Key": "T001"}]}')
+    {'value': [{'Key': 'T001'}]}
+
+A decoder is chosen by name with ``get_loads("ujson")``, or for all downloads with the option
+``cbsodata.options.json_decoder``. The import of the libraries is deferred to the first call.
+"""
+
+__all__ = ['JSON_DECODERS', 'get_decoder_name', 'get_loads']
+
+import functools
+import importlib
+import json
+
+# The supported json libraries, in the order in which they are preferred
+JSON_DECODERS = ["orjson", "ujson", "simdjson", "json"]
+
+
+def _is_installed(name):
+    """ Check if the json library can be imported """
+
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def get_decoder_name(name=None):
+    """
+    Get the name of the json library used to decode
+
+    Parameters
+    ----------
+    name: str, optional
+        The name of one of the :data:`JSON_DECODERS`. Default = None, which means the first
+        library which is installed
+
+    Returns
+    -------
+    str:
+        The name of the json library
+
+    Raises
+    ------
+    ValueError:
+        If the library is not supported
+    ImportError:
+        If the requested library is not installed
+    """
+
+    if name is None:
+        return next(decoder for decoder in JSON_DECODERS if _is_installed(decoder))
+
+    if name not in JSON_DECODERS:
+        raise ValueError("json_decoder must be one of '{}', not '{}'".format(
+            "', '".join(JSON_DECODERS), name))
+    if not _is_installed(name):
+        raise ImportError("The json decoder '{}' is not installed".format(name))
+
+    return name
+
+
+@functools.lru_cache(maxsize=None)
+def get_loads(name=None):
+    """
+    Get the function decoding a json document
+
+    Parameters
+    ----------
+    name: str, optional
+        The name of the json library, see :func:`get_decoder_name`. Default = None, which means
+        the fastest library which is installed
+
+    Returns
+    -------
+    function:
+        Function decoding a json document given as bytes or str to python objects. A document
+        which the library can not decode, such as an integer above 64 bits for orjson, is
+        decoded by the json module of the standard library, so the results are the same for all
+        libraries
+    """
+
+    name = get_decoder_name(name)
+
+    if name == "json":
+        return json.loads
+
+    fast_loads = importlib.import_module(name).loads
+
+    def loads(document):
+        try:
+            return fast_loads(document)
+        except ValueError:
+            return json.loads(document)
+
+    return loads
@@ -0,0 +1,377 @@
+"""
+Mirror many tables of Statistics Netherlands to disk
+
+The tables are downloaded by a bounded pool of worker threads, which share
+the connection pool of :mod:`cbsodata.cbsodata3`. Each table is stored in
+its own directory, with a file per metadata table in the format of
+``options.save_format``, in the same way as
+``download_data(table_id, dir=...)``::
+
+    >>> for result in iter_mirror(["82010NED", "80884ENG"], "mirror"):
+    ...     print(result["table_id"], result["status"])
+
+Every finished table is appended to a journal (a json lines file in the
+mirror directory). With *resume*, the tables which are in the journal
+already are skipped, so an interrupted run continues where it stopped.
+
+:func:`iter_sync` keeps a mirror up to date. It stores a snapshot of the
+table list with the *Modified* date of each table, and only downloads the
+tables which are new or modified since the previous sync::
+
+    >>> report = sync(dir="mirror", filters="Language eq 'en'")
+"""
+
+__all__ = ['JOURNAL_NAME', 'SNAPSHOT_NAME', 'iter_mirror', 'mirror',
+           'read_journal', 'read_snapshot', 'iter_sync', 'sync']
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cbsodata.cbsodata3 import (options, download_data, get_table_list,
+                                _get_table_version)
+
+logger = logging.getLogger(__name__)
+
+# The name of the journal in the mirror directory
+JOURNAL_NAME = "mirror_journal.jl"
+
+# The name of the snapshot of the table list in the mirror directory
+SNAPSHOT_NAME = "catalog_snapshot.json"
+
+
+def read_journal(journal):
+    """Read the entries of a journal.
+
+    Parameters
+    ----------
+    journal : str
+        The file name of the journal.
+
+    Returns
+    -------
+    dict
+        The last entry of each table in the journal. Empty if the journal
+        does not exist. A line which is not complete, because the run was
+        interrupted while it was written, is skipped.
+    """
+
+    entries = {}
+
+    try:
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["table_id"]] = entry
+    except FileNotFoundError:
+        pass
+
+    return entries
+
+
+def _mirror_table(table_id, dir, typed=False, catalog_url=None,
+                  proxies=None):
+    """Download a table to its directory and return its journal entry."""
+
+    start = time.perf_counter()
+    entry = {"table_id": table_id}
+
+    try:
+        data = download_data(table_id, dir=os.path.join(dir, table_id),
+                             typed=typed, catalog_url=catalog_url,
+                             proxies=proxies)
+    except Exception as err:
+        logger.warning("Mirroring table '{}' failed. {}".format(table_id,
+                                                                err))
+        entry.update(status="failed", error=str(err))
+    else:
+        entry.update(status="downloaded",
+                     modified=_get_table_version(data.get("TableInfos")))
+
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+
+    return entry
+
+
+def iter_mirror(table_ids=None, dir="mirror", typed=False, filters=None,
+                catalog_url=None, proxies=None, max_workers=4, resume=False,
+                journal=None):
+    """Mirror tables to disk and yield the result of each table.
+
+    Parameters
+    ----------
+    table_ids : list
+        The identifiers of the tables. If None, all the tables of the table
+        list of the catalog which agree on filters are mirrored.
+    dir : str
+        The directory of the mirror. Each table is stored in a directory
+        named after the table identifier. Default "mirror".
+    typed : bool
+        Download the typed data tables. Default False.
+    filters : str
+        Only mirror the tables of the table list which agree on the filter,
+        for example "Language eq 'en'". Only used if table_ids is None.
+    catalog_url : str
+        The url of the catalog. Default "opendata.cbs.nl".
+    proxies : dict
+        Dictionary mapping protocol to the URL of the proxy to be
+        used on each Request. Default None.
+    max_workers : int
+        The number of tables downloaded at the same time. Default 4.
+    resume : bool
+        Skip the tables which are downloaded according to the journal. If
+        False, a new journal is started. Default False.
+    journal : str
+        The file name of the journal. Default None, which means
+        mirror_journal.jl in the mirror directory.
+
+    Yields
+    ------
+    dict
+        The journal entry of each table, in the order in which the tables
+        are finished: the table_id, the status ("downloaded", "failed" or
+        "skipped"), the seconds it took and the Modified field of the
+        table information or the error.
+    """
+
+    if table_ids is None:
+        table_list = get_table_list(select=["Identifier"], filters=filters,
+                                    catalog_url=catalog_url, proxies=proxies)
+        table_ids = [table["Identifier"] for table in table_list]
+
+    # each table once, in the given order
+    table_ids = list(dict.fromkeys(table_ids))
+
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    _journal = os.path.join(dir, JOURNAL_NAME) if journal is None \
+        else journal
+
+    if resume:
+        done = {table_id for table_id, entry in read_journal(_journal).items()
+                if entry.get("status") == "downloaded"}
+    else:
+        done = set()
+        open(_journal, 'w').close()
+
+    if options.session is None and options.pool_maxsize < max_workers:
+        # keep a connection alive for each worker
+        options.pool_maxsize = max_workers
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+
+    try:
+        for table_id in table_ids:
+            if table_id in done:
+                yield {"table_id": table_id, "status": "skipped"}
+            else:
+                futures.append(executor.submit(
+                    _mirror_table, table_id, dir, typed=typed,
+                    catalog_url=catalog_url, proxies=proxies))
+
+        with open(_journal, 'a') as f:
+            for future in as_completed(futures):
+                entry = future.result()
+
+                # the entry is written before the next table is reported,
+                # so an interrupted run resumes after this table
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+
+                yield entry
+
+    finally:
+        # do not start the tables which are still waiting
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def mirror(table_ids=None, dir="mirror", **kwargs):
+    """Mirror tables to disk.
+
+    See iter_mirror for the parameters.
+
+    Returns
+    -------
+    list
+        The journal entry of each table.
+    """
+
+    return list(iter_mirror(table_ids=table_ids, dir=dir, **kwargs))
+
+
+def read_snapshot(snapshot):
+    """Read the snapshot of the table list of the previous sync.
+
+    Parameters
+    ----------
+    snapshot : str
+        The file name of the snapshot.
+
+    Returns
+    -------
+    dict
+        The Modified date, and the number of bytes and seconds of the
+        download, per table identifier. Empty if there is no snapshot.
+    """
+
+    try:
+        with open(snapshot, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_snapshot(snapshot, tables):
+    """Write the snapshot, replacing the previous one at once."""
+
+    tmp_file = snapshot + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(tables, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, snapshot)
+
+
+def _dir_size(dir):
+    """The number of bytes of the files in a directory."""
+
+    return sum(entry.stat().st_size for entry in os.scandir(dir)
+               if entry.is_file())
+
+
+def iter_sync(table_ids=None, dir="mirror", typed=False, filters=None,
+              catalog_url=None, proxies=None, max_workers=4, snapshot=None):
+    """Download the tables which are new or modified since the last sync.
+
+    The Modified date of each table in the table list of the catalog is
+    compared to the snapshot of the previous sync. Only the tables which
+    are new, modified or missing in the mirror directory are downloaded
+    (see iter_mirror), after which the snapshot is updated. Tables which
+    are no longer in the table list are removed from the snapshot, but
+    their files are kept.
+
+    Parameters
+    ----------
+    table_ids : list
+        Only sync these tables. Default None, which means all tables of the
+        table list which agree on filters.
+    dir : str
+        The directory of the mirror. Default "mirror".
+    typed : bool
+        Download the typed data tables. Default False.
+    filters : str
+        Only sync the tables of the table list which agree on the filter.
+    catalog_url : str
+        The url of the catalog. Default "opendata.cbs.nl".
+    proxies : dict
+        Dictionary mapping protocol to the URL of the proxy to be
+        used on each Request. Default None.
+    max_workers : int
+        The number of tables downloaded at the same time. Default 4.
+    snapshot : str
+        The file name of the snapshot. Default None, which means
+        catalog_snapshot.json in the mirror directory.
+
+    Yields
+    ------
+    dict
+        The result of each table: the table_id, the status ("new",
+        "modified", "unchanged", "removed" or "failed"), the bytes stored
+        and seconds taken by the download, or the bytes and seconds saved
+        for an unchanged table (the size and download time of the previous
+        download).
+    """
+
+    table_list = get_table_list(select=["Identifier", "Modified"],
+                                filters=filters, catalog_url=catalog_url,
+                                proxies=proxies)
+    catalog = {table["Identifier"]: table.get("Modified")
+               for table in table_list}
+
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+    _snapshot = os.path.join(dir, SNAPSHOT_NAME) if snapshot is None \
+        else snapshot
+    previous = read_snapshot(_snapshot)
+    tables = dict(previous)
+
+    if table_ids is not None:
+        for table_id in table_ids:
+            if table_id not in catalog:
+                yield {"table_id": table_id, "status": "failed",
+                       "error": "not in the table list"}
+        catalog = {table_id: catalog[table_id] for table_id in table_ids
+                   if table_id in catalog}
+
+    changes = {}
+    for table_id, modified in catalog.items():
+        if table_id not in previous:
+            changes[table_id] = "new"
+        elif previous[table_id].get("Modified") != modified or \
+                not os.path.isdir(os.path.join(dir, table_id)):
+            changes[table_id] = "modified"
+
+    downloaded = {"bytes": 0, "seconds": 0}
+    saved = {"bytes": 0, "seconds": 0}
+    start = time.perf_counter()
+
+    try:
+        for table_id in catalog:
+            if table_id not in changes:
+                entry = previous[table_id]
+                saved["bytes"] += entry.get("bytes", 0)
+                saved["seconds"] += entry.get("seconds", 0)
+                yield {"table_id": table_id, "status": "unchanged",
+                       "bytes_saved": entry.get("bytes", 0),
+                       "seconds_saved": entry.get("seconds", 0)}
+
+        for entry in iter_mirror(list(changes), dir=dir, typed=typed,
+                                 catalog_url=catalog_url, proxies=proxies,
+                                 max_workers=max_workers):
+            table_id = entry["table_id"]
+            if entry["status"] == "downloaded":
+                entry["status"] = changes[table_id]
+                entry["bytes"] = _dir_size(os.path.join(dir, table_id))
+                downloaded["bytes"] += entry["bytes"]
+                downloaded["seconds"] += entry["seconds"]
+                tables[table_id] = {"Modified": catalog[table_id],
+                                    "bytes": entry["bytes"],
+                                    "seconds": entry["seconds"]}
+            yield entry
+
+        if table_ids is None:
+            for table_id in previous:
+                if table_id not in catalog:
+                    del tables[table_id]
+                    yield {"table_id": table_id, "status": "removed"}
+
+    finally:
+        # also store the tables downloaded before an interruption
+        _write_snapshot(_snapshot, tables)
+
+    logger.info(
+        "Synced {} tables in {:.1f} s: downloaded {} tables ({} bytes, {:.1f} "
+        "s), skipped {} unchanged tables (saved {} bytes, {:.1f} s)".format(
+            len(catalog), time.perf_counter() - start, len(changes),
+            downloaded["bytes"], downloaded["seconds"],
+            len(catalog) - len(changes), saved["bytes"], saved["seconds"]))
+
+
+def sync(table_ids=None, dir="mirror", **kwargs):
+    """Download the tables which are new or modified since the last sync.
+
+    See iter_sync for the parameters.
+
+    Returns
+    -------
+    list
+        The result of each table.
+    """
+
+    return list(iter_sync(table_ids=table_ids, dir=dir, **kwargs))
@@ -0,0 +1,198 @@
+"""
+Bulk writer of data frames to a sqlite database
+
+:class:`SQLiteSink` writes the data frames of a :class:`cbsodata.utils.StatLineTable` to a
+sqlite database, for instance the database shared by all tables in the cache directory:
+
+* each table is replaced in one transaction with one *executemany* of all rows, so a failing
+  write leaves the previous version of the table in place
+* indexes are made on the given columns, such as the levels, the question Key and the keys of
+  the dimensions
+* the version of each table (the *Modified* field of the TableInfos) is stored in the table
+  :data:`VERSION_TABLE`, and a table of which the version did not change is not written again
+
+The column types are the same as those of :meth:`pandas.DataFrame.to_sql`, the index is written
+as columns as well::
+
+    >>> connection = connect_sqlite("cache/sqlite.db")
+    >>> sink = SQLiteSink(connection)
+    >>> sink.write_frame("84410NED_question", question_df, version="2019-10-01T02:00:00",
+    ...                  index_columns=["L0", "L1", "Key"])
+"""
+
+__all__ = ['VERSION_TABLE', 'SQLiteSink', 'connect_sqlite']
+
+import logging
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# the table storing the version of each written table
+VERSION_TABLE = "cbsodata_tables"
+
+
+def _quote(name):
+    """ Quote a table or column name """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _column_values(series):
+    """ The values of a column as python objects which can be stored by sqlite, NaN as None """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = np.array([None if pd.isna(v) else v.isoformat() for v in series], dtype=object)
+    else:
+        values = series.to_numpy(dtype=object)
+        if series.dtype == object:
+            # numpy scalars in object columns can not be stored by sqlite
+            values = np.array([v.item() if isinstance(v, np.generic) else v for v in values],
+                              dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values[missing] = None
+    return values
+
+
+def connect_sqlite(database, wal=True, **kwargs):
+    """
+    Connect to a sqlite database
+
+    Parameters
+    ----------
+    database: str or Path
+        The file name of the database
+    wal: bool, optional
+        Use write ahead logging, so the database can be read while a table is written. Default =
+        True
+    kwargs:
+        Passed to :func:`sqlite3.connect`
+
+    Returns
+    -------
+    sqlite3.Connection:
+        The connection
+    """
+    connection = sqlite3.connect(str(database), **kwargs)
+    if wal:
+        connection.execute("PRAGMA journal_mode=WAL")
+        # with write ahead logging, the database can not be corrupted by a normal sync
+        connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class SQLiteSink(object):
+    """
+    Write data frames to a sqlite database
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        The connection to the database, see :func:`connect_sqlite`
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {_quote(VERSION_TABLE)} "
+                                "(name TEXT PRIMARY KEY, version TEXT, n_rows INTEGER)")
+        self.connection.commit()
+
+    def table_exists(self, name):
+        """ Check if the table *name* is in the database """
+        cursor = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+        return cursor.fetchone() is not None
+
+    def table_version(self, name):
+        """ The version with which the table *name* was written, None if it is unknown """
+        cursor = self.connection.execute(
+            f"SELECT version FROM {_quote(VERSION_TABLE)} WHERE name=?", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def is_current(self, name, version):
+        """
+        Check if the table *name* is stored with version *version*
+
+        Parameters
+        ----------
+        name: str
+            The name of the table
+        version: str
+            The current version of the table. If None, the table is never current
+
+        Returns
+        -------
+        bool:
+            True if the table exists and was written with the same version
+        """
+        if version is None:
+            return False
+        return self.table_version(name) == version and self.table_exists(name)
+
+    def write_frame(self, name, df, version=None, index_columns=None, index=True, force=False):
+        """
+        Replace the table *name* by the data frame *df*
+
+        Parameters
+        ----------
+        name: str
+            The name of the table
+        df: pd.DataFrame
+            The data to write
+        version: str, optional
+            The version of the data, such as the *Modified* field of the TableInfos. If the table
+            is already stored with this version, it is not written again. Default = None, which
+            means the table is always written
+        index_columns: list, optional
+            Make an index on each of these columns. Columns which are not in the table are
+            skipped. Default = None
+        index: bool, optional
+            Write the index of *df* as columns. Default = True
+        force: bool, optional
+            Write the table, also if it is stored with the same version. Default = False
+
+        Returns
+        -------
+        bool:
+            True if the table was written, False if it was current
+        """
+        if not force and self.is_current(name, version):
+            logger.info(f"Table {name} is up to date with version {version}")
+            return False
+
+        if index:
+            df = df.reset_index()
+        # the same column types as pandas to_sql
+        schema = pd.io.sql.get_schema(df, name, con=self.connection)
+        columns = [_column_values(df[column]) for column in df.columns]
+        insert = "INSERT INTO {} VALUES ({})".format(_quote(name), ", ".join(["?"] * len(columns)))
+
+        connection = self.connection
+        begin = not connection.in_transaction
+        if begin:
+            connection.execute("BEGIN")
+        try:
+            connection.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            connection.execute(schema)
+            connection.executemany(insert, zip(*columns))
+            for column in index_columns or list():
+                if column not in df.columns:
+                    continue
+                connection.execute("CREATE INDEX {} ON {} ({})".format(
+                    _quote(f"ix_{name}_{column}"), _quote(name), _quote(column)))
+            connection.execute(f"INSERT OR REPLACE INTO {_quote(VERSION_TABLE)} VALUES (?, ?, ?)",
+                               (name, version, len(df)))
+        except Exception:
+            if begin:
+                connection.rollback()
+            raise
+        else:
+            if begin:
+                connection.commit()
+
+        logger.info(f"Wrote {len(df)} rows to table {name}")
+        return True
@@ -0,0 +1,259 @@
+"""
+Storage of the downloaded tables on disk
+
+Each metadata table of a downloaded table is stored in its own file in the directory of the table.
+The file format is chosen by the *save_format*:
+
+* ``"json"``: one json array, ``<name>.json``. This is the original layout, which is written
+  with an indent of two spaces
+* ``"ndjson"``: one json row per line, ``<name>.ndjson``
+* ``"ndjson.gz"``: the ndjson file compressed with gzip, ``<name>.ndjson.gz``
+* ``"ndjson.zst"``: the ndjson file compressed with zstandard, ``<name>.ndjson.zst``. This
+  requires the *zstandard* package
+
+The rows are written by a :class:`DataWriter` as soon as the pages of the table are downloaded,
+so a large table is not kept in memory as one json document. The file is written under a
+temporary name and only renamed to its final name when the table is complete::
+
+    >>> with DataWriter("84410NED", "TypedDataSet", save_format="ndjson.gz") as writer:
+    ...     for page in pages:
+    ...         writer.write_rows(page)
+
+:func:`iter_saved_data` reads the rows back one by one, from whichever format is on disk.
+"""
+
+__all__ = ['SAVE_FORMATS', 'DataWriter', 'check_save_format', 'find_data_file', 'save_data',
+           'iter_saved_data', 'read_saved_data']
+
+import gzip
+import io
+import json
+import os
+
+from cbsodata.json_decoder import get_loads
+
+# The supported formats of the files, in the order in which they are looked for
+SAVE_FORMATS = ["json", "ndjson", "ndjson.gz", "ndjson.zst"]
+
+
+def check_save_format(save_format):
+    """ Check if the format of the files is supported """
+
+    if save_format not in SAVE_FORMATS:
+        raise ValueError("save_format must be one of '{}', not '{}'".format(
+            "', '".join(SAVE_FORMATS), save_format))
+
+
+def _open(file_name, mode):
+    """ Open a file as utf-8 text, or as bytes if "b" is in mode, compressed according to its
+    extension """
+
+    binary = "b" in mode
+    if binary:
+        kwargs = dict(mode=mode)
+    else:
+        kwargs = dict(mode=mode + "t", encoding="utf-8")
+
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, **kwargs)
+    elif file_name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as err:
+            raise ImportError("The 'ndjson.zst' format requires the zstandard package") from err
+        stream = zstandard.open(file_name, **kwargs)
+        # the decompression reader can not read lines itself
+        return io.BufferedReader(stream) if binary else stream
+    else:
+        return open(file_name, **kwargs)
+
+
+def find_data_file(dir, metadata_name):
+    """
+    Find the file of a metadata table
+
+    Parameters
+    ----------
+    dir: str
+        The directory of the table
+    metadata_name: str
+        The name of the metadata table, such as "DataProperties"
+
+    Returns
+    -------
+    str or None:
+        The file name of the first format in :data:`SAVE_FORMATS` which exists, or None if the
+        metadata table is not stored
+    """
+
+    for save_format in SAVE_FORMATS:
+        file_name = os.path.join(dir, ".".join([metadata_name, save_format]))
+        if os.path.exists(file_name):
+            return file_name
+
+    return None
+
+
+class DataWriter(object):
+    """
+    Write the rows of a metadata table to disk while they are downloaded
+
+    Parameters
+    ----------
+    dir: str
+        The directory of the table. It is created if it does not exist
+    metadata_name: str
+        The name of the metadata table
+    save_format: str, optional
+        The format of the file, one of :data:`SAVE_FORMATS`. Default = "json"
+
+    Notes
+    -----
+    * The rows are written to a temporary file, which replaces the file of the table when the
+      writer is closed without an error. The files of the table in the other formats are
+      removed then, such that only one version of the table is on disk
+    * In the json format, the file is the same as written by ``json.dump(rows, f, indent=2)``
+    """
+
+    def __init__(self, dir, metadata_name, save_format="json"):
+        check_save_format(save_format)
+
+        self.dir = dir
+        self.metadata_name = metadata_name
+        self.save_format = save_format
+        self.file_name = os.path.join(dir, ".".join([metadata_name, save_format]))
+        self.n_rows = 0
+
+        if not os.path.exists(dir):
+            os.makedirs(dir, exist_ok=True)
+
+        # the compression is chosen by the extension, so keep it at the end
+        self._tmp_file_name = os.path.join(dir, ".".join([metadata_name, "tmp", save_format]))
+        self._stream = _open(self._tmp_file_name, "w")
+        if self.save_format == "json":
+            self._stream.write("[")
+
+    def write_rows(self, rows):
+        """
+        Write rows to the file
+
+        Parameters
+        ----------
+        rows: list
+            The rows (dicts) of a page of the table
+        """
+
+        if self.save_format == "json":
+            # the items of the page as written by json.dump with indent=2, without the brackets
+            if rows and self.n_rows > 0:
+                self._stream.write(",")
+            if rows:
+                self._stream.write(json.dumps(rows, indent=2)[1:-2])
+        else:
+            self._stream.write("".join([json.dumps(row) + "\n" for row in rows]))
+        self.n_rows += len(rows)
+
+    def close(self):
+        """ Complete the file and replace the previous file of the table """
+
+        if self.save_format == "json":
+            self._stream.write("\n]" if self.n_rows > 0 else "]")
+        self._stream.close()
+        os.replace(self._tmp_file_name, self.file_name)
+
+        for save_format in SAVE_FORMATS:
+            file_name = os.path.join(self.dir, ".".join([self.metadata_name, save_format]))
+            if file_name != self.file_name and os.path.exists(file_name):
+                os.remove(file_name)
+
+    def discard(self):
+        """ Remove the temporary file, keeping the previous file of the table """
+
+        self._stream.close()
+        if os.path.exists(self._tmp_file_name):
+            os.remove(self._tmp_file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # an incomplete table, also from a generator which is not exhausted, is not stored
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def save_data(data, dir, metadata_name, save_format="json"):
+    """
+    Save the rows of a metadata table
+
+    Parameters
+    ----------
+    data: list
+        The rows of the table
+    dir: str
+        The directory of the table
+    metadata_name: str
+        The name of the metadata table
+    save_format: str, optional
+        The format of the file, one of :data:`SAVE_FORMATS`. Default = "json"
+
+    Returns
+    -------
+    str:
+        The file name
+    """
+
+    with DataWriter(dir, metadata_name, save_format=save_format) as writer:
+        writer.write_rows(data)
+
+    return writer.file_name
+
+
+def iter_saved_data(dir, metadata_name, json_decoder=None):
+    """
+    Read the rows of a stored metadata table one by one
+
+    Parameters
+    ----------
+    dir: str
+        The directory of the table
+    metadata_name: str
+        The name of the metadata table
+    json_decoder: str, optional
+        The json library decoding the file, see :mod:`cbsodata.json_decoder`. Default = None,
+        which means the fastest library which is installed
+
+    Yields
+    ------
+    dict:
+        The rows of the table. The ndjson formats are read line by line, the json format is read
+        at once
+
+    Raises
+    ------
+    FileNotFoundError:
+        If the table is not stored in any of the formats
+    """
+
+    file_name = find_data_file(dir, metadata_name)
+    if file_name is None:
+        raise FileNotFoundError("No file of '{}' in {}".format(metadata_name, dir))
+
+    loads = get_loads(json_decoder)
+
+    # the bytes are decoded without a text copy
+    with _open(file_name, "rb") as stream:
+        if file_name.endswith(".json"):
+            yield from loads(stream.read())
+        else:
+            for line in stream:
+                if line.strip():
+                    yield loads(line)
+
+
+def read_saved_data(dir, metadata_name, json_decoder=None):
+    """ Read the rows of a stored metadata table, see :func:`iter_saved_data` """
+
+    return list(iter_saved_data(dir, metadata_name, json_decoder=json_decoder))
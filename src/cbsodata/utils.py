@@ -7,25 +7,40 @@ Een aantal losstaande functies en klasses voor betere verwerking van de OpenData
 """
 
 import collections
+import concurrent.futures
+import hashlib
 import json
 import logging
-import math
 import re
-import sqlite3
+import time
 from pathlib import Path
 
-import matplotlib.pylab as plt
+import numpy as np
 import pandas as pd
-import requests
-import yaml
+
+from cbsodata.columnar import decode_dimension, encode_dimension
+from cbsodata.frame_cache import get_frame_cache
+from cbsodata.sql_sink import SQLiteSink, connect_sqlite
+from cbsodata.storage import find_data_file, iter_saved_data
 
 logger = logging.getLogger(__name__)
 
-try:
-    from tabulate import tabulate
-except ImportError as err:
-    # tabulate is only needed for a proper doctring format of the pandas table
-    logger.warning(err)
+# the version of the plot manifest; a manifest of another version makes all plots render again
+PLOT_MANIFEST_VERSION = 1
+
+# matplotlib, yaml, tabulate and requests take long to import and are only needed for plotting,
+# writing the info files and downloading, so they are imported by the functions using them
+
+
+def _import_tabulate():
+    """ The tabulate function, or None if tabulate is not installed """
+    try:
+        from tabulate import tabulate
+    except ImportError as err:
+        # tabulate is only needed for a proper doctring format of the pandas table
+        logger.warning(err)
+        return None
+    return tabulate
 
 
 class DataProperties(object):
@@ -48,6 +63,108 @@ class DataProperties(object):
         self.default = indicator_dict.get("Default")
 
 
+def _to_id(value):
+    """ The IDs in the levels of the index are floats in case the level has missing values """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def level_depth(index):
+    """
+    The number of levels of the index with a value (not nan) for each row
+
+    Parameters
+    ----------
+    index: pd.Index
+        The index of the question data frame, with the ID of the module, sections and question in
+        the levels L0, L1, ..
+
+    Returns
+    -------
+    np.ndarray:
+        The depth of each row
+    """
+    if isinstance(index, pd.MultiIndex):
+        if index.nlevels == 0 or len(index) == 0:
+            return np.zeros(len(index), dtype=int)
+        return (np.column_stack([np.asarray(codes) for codes in index.codes]) >= 0).sum(axis=1)
+
+    return np.asarray(index.notna(), dtype=int)
+
+
+class QuestionIndex(object):
+    """
+    Index of the rows of the question data frame per ID of a module, section or question
+
+    Parameters
+    ----------
+    index: pd.Index
+        The index of the question data frame. The levels L0, L1, .. hold the ID of the module and
+        the sections and question below it
+
+    Attributes
+    ----------
+    positions: dict
+        The row positions (a sorted numpy array) of the rows of each ID
+    levels: dict
+        The level of the index holding the ID
+    children: dict
+        The IDs at the next level below each ID, in the order of the data frame
+    related: dict
+        The IDs sharing a row with each ID: the ID itself, its parents and its children
+    depth: np.ndarray
+        The number of levels with a value of each row (:func:`level_depth`)
+    """
+
+    def __init__(self, index):
+        if not isinstance(index, pd.MultiIndex):
+            index = pd.MultiIndex.from_arrays([index])
+
+        self.positions = dict()
+        self.levels = dict()
+        self.children = collections.OrderedDict()
+        self.related = dict()
+        self.depth = level_depth(index)
+
+        for level, (values, codes) in enumerate(zip(index.levels, index.codes)):
+            codes = np.asarray(codes)
+            # sort the row positions per code, keeping the order of the rows
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            all_codes = np.arange(len(values))
+            starts = np.searchsorted(sorted_codes, all_codes, side="left")
+            ends = np.searchsorted(sorted_codes, all_codes, side="right")
+            for value, start, end in zip(values, starts, ends):
+                if end > start:
+                    id = _to_id(value)
+                    self.positions[id] = order[start:end]
+                    self.levels[id] = level
+
+        # the structure follows from the unique combinations of the levels in the index
+        codes = np.column_stack([np.asarray(c) for c in index.codes])
+        unique_codes, first_rows = np.unique(codes, axis=0, return_index=True)
+        for row_codes in unique_codes[np.argsort(first_rows)]:
+            ids = [_to_id(index.levels[level][code]) if code >= 0 else None
+                   for level, code in enumerate(row_codes)]
+            related = set(id for id in ids if id is not None)
+            for parent_id, child_id in zip(ids[:-1], ids[1:]):
+                if parent_id is not None and child_id is not None:
+                    self.children.setdefault(parent_id, collections.OrderedDict())[child_id] = None
+            for id in related:
+                self.related.setdefault(id, set()).update(related)
+
+        for parent_id, children in self.children.items():
+            self.children[parent_id] = list(children.keys())
+
+    def __contains__(self, id):
+        return id in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+
 class StatLineTable(object):
     """
 
@@ -75,13 +192,13 @@ class StatLineTable(object):
         save recommended value is level value of 5
     to_sql: bool, optional
         If True, store the generated table to sqlite. Each table is stored to a table inside
-        a sqlite database. Default = False
+        a sqlite database, see :meth:`write_sql_data`. Default = False
     to_xls: bool, optional
         If True, store to Excel. Each table is stored to a seperate tab. Default = False
     to_pickle: bool, optional
-        If True, store the tables to pickle. In case a picke file exist, not even the downloaded
-        cache file are read, but the converted tables are directly obtained from the pickle files.
-        Default = True
+        If True, store the tables to the cache directory in the *cache_format*. In case a valid
+        cache exist, not even the downloaded cache file are read, but the converted tables are
+        directly obtained from the cached tables. Default = True
     write_questions_only: bool, optional
         Only write the questions
     reset_pickles: bool, optional
@@ -90,6 +207,15 @@ class StatLineTable(object):
         True. In case a pickle file is found in the case, the DataFrame is directly obtained from
         the case (speeding up processing/home/eelco/PycharmProjects/CBS/cbs_utils time). If you want
         to regenerate the picke file, set this flag to true (or just empty the cache)
+    cache_format: {"parquet", "feather", "pickle"}, optional
+        Format of the cached tables, see :mod:`cbsodata.frame_cache`. The cache is rebuilt when it
+        was written in another format, by another version of the cache or for another version
+        (the Modified field) of the table. Default = None, which means parquet if pyarrow is
+        installed and pickle otherwise
+    save_format: {"json", "ndjson", "ndjson.gz", "ndjson.zst"}, optional
+        Format of the downloaded open data files in the cache directory, see
+        :mod:`cbsodata.storage`. The files are read in the format in which they are stored, so a
+        cache directory written in another format stays readable. Default = "json"
     section_key: str, optional
         Default column name to refer to a section. Default = "Section"
     title_key: str, optional
@@ -184,6 +310,13 @@ class StatLineTable(object):
 
     make_the_plots: bool, optional
         Make all the plots belonging to the statline question. Default is False
+    plot_workers: int, optional
+        Number of processes rendering the plots of *make_the_plots*, see :meth:`plot`. Default =
+        None, which means the plots are made in the current process
+    skip_unchanged_plots: bool, optional
+        Only render the plots of which the data or the plot settings changed since the previous
+        run, based on the hashes stored in the plot manifest of the image directory. A plot is
+        always rendered if one of its files is missing or if *show_plot* is True. Default = True
     describe_the_data: bool, optional
         Give a description of the loaded statline data set. Convenient to get the module and
         question ID which you need to use in the  *modules_to_plot*  *questions_to_plot*  list
@@ -201,11 +334,17 @@ class StatLineTable(object):
                 \\newcommand *\\rot {\\multicolumn {1} {R {45} {1 em}}}
 
     write_info_to_image_dir: bool, optional
-        Write the information of the data structure to a file in the image directory. Default = True
+        Write the information of the data structure to a file in the image directory when the
+        data frames are loaded. Default = True
     color: str, optional
         Color for the plot. Default = "blue".
     fontsize: int, optional
         Font sizefor the plot. Default = 12
+    categorical_dimensions: bool, optional
+        Store the dimension columns of the *question_df* (the Title and the Key of each dimension)
+        as categoricals: one table with the labels of the dimension and an integer code per row.
+        This reduces the memory of large tables considerably. Set to False to store the labels
+        as strings in each row. Default = True
 
     Attributes
     ----------
@@ -215,6 +354,16 @@ class StatLineTable(object):
         The names of the sections
     dimension_df: pd.DataFrame
         The names of the dimensions
+    table_infos: list
+        The TableInfos of the table
+
+    Notes
+    -----
+    The table is processed lazily: the json tables are read when they are first needed, and the
+    data frames are read from the cache or build on the first access of *question_df*,
+    *section_df* or *dimension_df*. A script which only needs the *table_infos* does not read the
+    data set. Only the options *to_sql*, *to_xls*, *make_the_plots* and *describe_the_data*
+    load the data frames in the constructor
 
     Examples
     --------
@@ -303,10 +452,10 @@ class StatLineTable(object):
     Unit                   132 non-null object
     Decimals               132 non-null object
     Default                132 non-null object
-    Bedrijfsgrootte        132 non-null object
-    Bedrijfsgrootte_Key    132 non-null object
+    Bedrijfsgrootte        132 non-null category
+    Bedrijfsgrootte_Key    132 non-null category
     Values                 132 non-null int64
-    dtypes: int64(1), object(12)
+    dtypes: category(2), int64(1), object(10)
     memory usage: 14.9+ KB
 
     As you can see we have a datafrme of 132 rows: 12 items per questions for 11 size classes.
@@ -359,6 +508,8 @@ class StatLineTable(object):
                  to_pickle: bool = True,
                  write_questions_only: bool = False,
                  reset_pickles: bool = False,
+                 cache_format: str = None,
+                 save_format: str = "json",
                  units_key: str = "Unit",
                  key_key: str = "Key",
                  datatype_key: str = "Datatype",
@@ -387,11 +538,14 @@ class StatLineTable(object):
                  module_title_properties: dict = None,
                  question_title_properties: dict = None,
                  make_the_plots: bool = False,
+                 plot_workers: int = None,
+                 skip_unchanged_plots: bool = True,
                  describe_the_data: bool = False,
                  write_info_to_image_dir: bool = True,
                  rotate_latex_columns: bool = False,
                  color="blue",
                  fontsize=12,
+                 categorical_dimensions: bool = True,
                  ):
 
         self.table_id = table_id
@@ -400,6 +554,7 @@ class StatLineTable(object):
         self.max_levels = max_levels
         self.sort_choices = sort_choices
         self.rotate_latex_columns = rotate_latex_columns
+        self.categorical_dimensions = categorical_dimensions
 
         self.image_dir = Path(image_dir_name)
         self.image_dir.mkdir(exist_ok=True)
@@ -410,6 +565,7 @@ class StatLineTable(object):
         self.cache_dir.mkdir(exist_ok=True)
         self.output_directory = self.cache_dir / Path(self.table_id)
         self.output_directory.mkdir(exist_ok=True)
+        self.save_format = save_format
 
         self.modules_to_plot = modules_to_plot
         self.questions_to_plot = questions_to_plot
@@ -443,6 +599,11 @@ class StatLineTable(object):
         self.selection = selection
         # the selection_options will get the values we can select after the first plot
         self.selection_options = None
+        # the time it took to render each plot of the last call to plot
+        self.plot_timings = collections.OrderedDict()
+        self.skip_unchanged_plots = skip_unchanged_plots
+        self.skipped_plots = list()
+        self.plot_manifest_file = self.image_dir / Path("plot_manifest.json")
 
         self.export_plot_data = export_plot_data
         self.image_type = image_type
@@ -453,9 +614,9 @@ class StatLineTable(object):
 
         self.connection = None
 
-        self.typed_data_set = None
-        self.table_infos = None
-        self.data_properties = None
+        # the json tables of the open data, read on first access
+        self._table_data = dict()
+        self._table_data_checked = False
         self.dimensions = collections.OrderedDict()
 
         self.section_key = section_key
@@ -468,38 +629,26 @@ class StatLineTable(object):
         self.datatype_key = datatype_key
         self.x_axis_key = x_axis_key
 
-        self.question_df: pd.DataFrame = None
-        self.section_df: pd.DataFrame = None
-        self.dimension_df: pd.DataFrame = None
+        # the data frames are read from cache or build on first access by load_dataframes
+        self._question_df: pd.DataFrame = None
+        self._section_df: pd.DataFrame = None
+        self._dimension_df: pd.DataFrame = None
+        self._dataframes_loaded = False
+        self._question_index: QuestionIndex = None
         self.level_keys = [f"L{d}" for d in range(self.max_levels)]
         self.level_ids: collections.OrderedDict = None
 
-        # these data frames will cary the structure of the questionnaire
-        self.module_info_df: pd.DataFrame = None
-        self.question_info_df: pd.DataFrame = None
+        # these data frames will cary the structure of the questionnaire. They are made on first
+        # access by make_info_dataframes
+        self._module_info_df: pd.DataFrame = None
+        self._question_info_df: pd.DataFrame = None
+        self._info_dataframes_made = False
 
-        self.pickle_files = dict()
+        self.frame_cache = get_frame_cache(cache_format, self.cache_dir, self.table_id)
         self.df_labels = ["question", "section", "dimensions"]
-        for label in self.df_labels:
-            file_name = "_".join([self.table_id, label]) + ".pkl"
-            self.pickle_files[label] = self.cache_dir / Path(file_name)
-
-        updated_dfs = False
-        self.read_table_data()
-        if self.pickle_files["question"].exists() and not (reset_pickles or self.reset):
-            self.pkl_data(mode="read")
-        else:
-            self.initialize_dataframes()
-            self.fill_question_list()
-            self.fill_data()
-            self.question_df.set_index(self.level_keys, inplace=True, drop=True)
-            updated_dfs = True
-
-        if x_axis_key is None:
-            # no xlabel for the bar graph has been given. Take the first dimension
-            self.x_axis_key = self.dimension_df.loc[0, self.key_key]
-        else:
-            self.x_axis_key = x_axis_key
+        self.to_pickle = to_pickle
+        self.reset_pickles = reset_pickles
+        self.write_info_to_image_dir = write_info_to_image_dir
 
         if legend_position is None:
             self.legend_position = (1.05, 0)
@@ -508,27 +657,149 @@ class StatLineTable(object):
 
         self.legend_title = legend_title
 
+        # the following options need the data frames, so these are loaded now
         if to_sql:
             self.write_sql_data(write_questions_only=write_questions_only)
         if to_xls:
             self.write_xls_data(write_questions_only=write_questions_only)
-        if to_pickle and updated_dfs:
-            self.pkl_data(mode="write")
-
-        self.make_info_dataframes()
-        if write_info_to_image_dir:
-            self.write_info()
 
         if make_the_plots:
-            self.plot()
+            self.plot(workers=plot_workers)
 
         if describe_the_data:
             self.describe()
 
+    @property
+    def table_infos(self):
+        """ The TableInfos of the table, read on first access """
+        return self._get_table_data("TableInfos")
+
+    @property
+    def data_properties(self):
+        """ The DataProperties of the table, read on first access """
+        return self._get_table_data("DataProperties")
+
+    @property
+    def typed_data_set(self):
+        """ The TypedDataSet of the table, read on first access """
+        return self._get_table_data("TypedDataSet")
+
+    def _get_table_data(self, name):
+        if name not in self._table_data:
+            self.read_table_data(names=[name])
+        return self._table_data[name]
+
+    @property
+    def question_df(self):
+        """ The questions with their values, loaded on first access by :meth:`load_dataframes` """
+        if not self._dataframes_loaded:
+            self.load_dataframes()
+        return self._question_df
+
+    @question_df.setter
+    def question_df(self, question_df):
+        self._question_df = question_df
+        self._question_index = None
+
+    @property
+    def question_index(self):
+        """ The rows of the *question_df* per ID (:class:`QuestionIndex`), made on first access """
+        if self._question_index is None:
+            self._question_index = QuestionIndex(self.question_df.index)
+        return self._question_index
+
+    @property
+    def section_df(self):
+        """ The sections (TopicGroups), loaded on first access by :meth:`load_dataframes` """
+        if not self._dataframes_loaded:
+            self.load_dataframes()
+        return self._section_df
+
+    @section_df.setter
+    def section_df(self, section_df):
+        self._section_df = section_df
+
+    @property
+    def dimension_df(self):
+        """ The dimensions, loaded on first access by :meth:`load_dataframes` """
+        if not self._dataframes_loaded:
+            self.load_dataframes()
+        return self._dimension_df
+
+    @dimension_df.setter
+    def dimension_df(self, dimension_df):
+        self._dimension_df = dimension_df
+
+    @property
+    def question_info_df(self):
+        """ The key, title and unit of the questions, made on first access """
+        if not self._info_dataframes_made:
+            self.make_info_dataframes()
+        return self._question_info_df
+
+    @question_info_df.setter
+    def question_info_df(self, question_info_df):
+        self._question_info_df = question_info_df
+
+    @property
+    def module_info_df(self):
+        """ The parent and title of the sections, made on first access """
+        if not self._info_dataframes_made:
+            self.make_info_dataframes()
+        return self._module_info_df
+
+    @module_info_df.setter
+    def module_info_df(self, module_info_df):
+        self._module_info_df = module_info_df
+
+    @property
+    def x_axis_key(self):
+        """ The dimension on the x-axis of the plots. Default the first dimension """
+        if self._x_axis_key is None:
+            # no xlabel for the bar graph has been given. Take the first dimension
+            self._x_axis_key = self.dimension_df.loc[0, self.key_key]
+        return self._x_axis_key
+
+    @x_axis_key.setter
+    def x_axis_key(self, x_axis_key):
+        self._x_axis_key = x_axis_key
+
+    def load_dataframes(self):
+        """
+        Read the data frames from the cache, or build them from the table data
+
+        This is done once, on the first access of the *question_df*, *section_df* or
+        *dimension_df*. In case the data frames are build, they are stored to the cache if
+        *to_pickle* is True. The information files are written to the image directory if
+        *write_info_to_image_dir* is True
+        """
+        # set the flag first, as the data frames are accessed while building them
+        self._dataframes_loaded = True
+        try:
+            if not (self.reset_pickles or self.reset) and self.frame_cache.is_valid(
+                    self.df_labels, table_version=self.table_version):
+                self.pkl_data(mode="read")
+                self.level_keys = list(self.question_df.index.names)
+                self.max_levels = len(self.level_keys)
+            else:
+                self.initialize_dataframes()
+                self.fill_question_list()
+                self.fill_data()
+                self.question_df.set_index(self.level_keys, inplace=True, drop=True)
+                if self.to_pickle:
+                    self.pkl_data(mode="write")
+        except Exception:
+            self._dataframes_loaded = False
+            raise
+
+        if self.write_info_to_image_dir:
+            self.write_info()
+
     def make_info_dataframes(self):
         """
         Make info data frames by taking the proper selections
         """
+        self._info_dataframes_made = True
         col_sel = [self.key_key, self.title_key, self.units_key]
         self.question_info_df = self.question_df[col_sel].drop_duplicates()
 
@@ -541,11 +812,14 @@ class StatLineTable(object):
         Write some information to the image dir which makes it easier to analyse
         """
 
+        import yaml
+
         table_infos_file = self.image_dir / Path("TableInfos.yml")
         logger.info(f"Writing table information to {table_infos_file}")
         with open(table_infos_file, "w") as stream:
             yaml.dump(self.table_infos, stream, default_flow_style=False)
 
+        tabulate = _import_tabulate()
         if tabulate is not None:
             question_info_file = self.image_dir / Path("QuestionTable.txt")
             logger.info(f"Writing question structure to {question_info_file}")
@@ -557,9 +831,19 @@ class StatLineTable(object):
             with open(section_info_file, "w") as stream:
                 stream.write(tabulate(self.module_info_df, headers="keys", tablefmt="psql"))
 
+    @property
+    def table_version(self):
+        """ The version of the table: the Modified field of the TableInfos """
+        try:
+            return self.table_infos[0]["Modified"]
+        except (IndexError, KeyError, TypeError):
+            return None
+
     def pkl_data(self, mode="read"):
         """
-        Write all the data to pickle
+        Read or write all the data frames from or to the cache
+
+        The data frames are stored in the format of the frame cache (parquet, feather or pickle)
 
         Parameters
         ----------
@@ -573,29 +857,63 @@ class StatLineTable(object):
             action = "Reading from"
         else:
             action = "Writing to"
+            # invalidate the cache until all data frames are written
+            self.frame_cache.clear()
 
-        for label, pkl_file in self.pickle_files.items():
+        for label in self.df_labels:
             # write the result
-            logger.info(f"{action} pickle database {pkl_file}")
+            cache_file = self.frame_cache.file_name(label)
+            logger.info(f"{action} {self.frame_cache.format} cache {cache_file}")
             if mode == "read":
                 if label == "question":
-                    self.question_df = pd.read_pickle(pkl_file)
+                    self.question_df = self.frame_cache.read(label)
                 elif label == "section":
-                    self.section_df = pd.read_pickle(pkl_file)
+                    self.section_df = self.frame_cache.read(label)
                 elif label == "dimensions":
-                    self.dimension_df = pd.read_pickle(pkl_file)
+                    self.dimension_df = self.frame_cache.read(label)
                 else:
                     raise AssertionError("label must be question, section, or dimension")
             else:
                 if label == "question":
-                    self.question_df.to_pickle(pkl_file)
+                    self.frame_cache.write(label, self.question_df)
                 elif label == "section":
-                    self.section_df.to_pickle(pkl_file)
+                    self.frame_cache.write(label, self.section_df)
                 elif label == "dimensions":
-                    self.dimension_df.to_pickle(pkl_file)
+                    self.frame_cache.write(label, self.dimension_df)
                 else:
                     raise AssertionError("label must be question, section, or dimension")
 
+        if mode == "write":
+            self.frame_cache.write_stamp(table_version=self.table_version)
+
+    def read_cached_questions(self, columns=None, filters=None):
+        """
+        Read a selection of the question data frame from the cache
+
+        With the parquet and feather caches only the selected columns and rows are loaded, for
+        instance the questions of module 46::
+
+            >>> statline.read_cached_questions(filters=[("L0", "==", 46)])
+
+        Parameters
+        ----------
+        columns: list, optional
+            The columns to read. The levels of the index are always read. Default = None (all)
+        filters: list, optional
+            The (column, operator, value) tuples the rows must agree on, where the column can be a
+            level of the index. Default = None (all rows)
+
+        Returns
+        -------
+        DataFrame:
+            The selected questions
+        """
+        if not self.frame_cache.is_valid(["question"], table_version=self.table_version):
+            raise FileNotFoundError(f"No valid cache of table {self.table_id} found. Create it "
+                                    "with to_pickle=True")
+
+        return self.frame_cache.read("question", columns=columns, filters=filters)
+
     def write_xls_data(self, write_questions_only=True):
 
         """
@@ -609,56 +927,100 @@ class StatLineTable(object):
                 self.section_df.to_excel(stream, sheet_name="Sections", na_rep='NA')
                 self.dimension_df.to_excel(stream, sheet_name="Dimensions", na_rep='NA')
 
-    def write_sql_data(self, write_questions_only=True):
+    def write_sql_data(self, write_questions_only=True, force=False):
 
         """
         Write all the data to the sql lite database. Each table is written in the same database
+
+        Parameters
+        ----------
+        write_questions_only: bool, optional
+            Only write the question table, not the section and dimension tables. Default = True
+        force: bool, optional
+            Also write the tables which are stored with the current version. Default = False
+
+        Notes
+        -----
+        * The database is *sqlite.db* in the cache directory, unless *connection* was already
+          set to another connection, which is then reused
+        * Each table is replaced in one transaction, and indexes are made on the levels, the
+          question Key and the dimension keys
+        * Tables are only written if the *Modified* date of the table changed since the last
+          time, see :class:`cbsodata.sql_sink.SQLiteSink`. In that case the data frames are not
+          even loaded
         """
         # write the result
-        sqlite_db = self.cache_dir / "sqlite.db"
-        self.connection = sqlite3.connect(sqlite_db)
-        logger.info(f"Writing to sqlite database {sqlite_db}")
-        self.question_df.to_sql("_".join([self.table_id, "question"]), self.connection,
-                                if_exists="replace")
+        if self.connection is None:
+            sqlite_db = self.cache_dir / "sqlite.db"
+            logger.info(f"Connecting to sqlite database {sqlite_db}")
+            self.connection = connect_sqlite(sqlite_db)
+        sink = SQLiteSink(self.connection)
+
+        # the label, attribute with the data frame and columns to index of each table
+        tables = [("question", "question_df", self.level_keys + [self.key_key])]
         if not write_questions_only:
             # also write the help dataframes
-            self.section_df.to_sql("_".join([self.table_id, "section"]), self.connection,
-                                   if_exists="replace")
-            self.dimension_df.to_sql("_".join([self.table_id, "dimension"]), self.connection,
-                                     if_exists="replace")
-
-    def read_table_data(self):
+            tables.append(("section", "section_df", [self.id_key, self.parent_id_key]))
+            tables.append(("dimension", "dimension_df", [self.key_key]))
+
+        version = self.table_version
+        for label, df_name, index_columns in tables:
+            table_name = "_".join([self.table_id, label])
+            if not force and sink.is_current(table_name, version):
+                logger.info(f"Table {table_name} in sqlite is up to date")
+                continue
+            df = getattr(self, df_name)
+            if label == "question":
+                # the keys of the dimensions
+                index_columns = index_columns + [
+                    column for column in df.columns
+                    if column != self.key_key and str(column).endswith("_" + self.key_key)]
+            sink.write_frame(table_name, df, version=version, index_columns=index_columns,
+                             force=True)
+
+    def read_table_data(self, names=None):
         """
         Read the open data tables
+
+        The tables are downloaded first if they are not in the cache directory yet, or if *reset*
+        is True. The tables are read once and kept in memory
+
+        Parameters
+        ----------
+        names: list, optional
+            The names of the tables to read. Default = None, which means the DataProperties, the
+            TypedDataSet and the TableInfos
         """
 
-        type_data_set_file = self.output_directory / Path("TypedDataSet.json")
-        table_infos_file = self.output_directory / Path("TableInfos.json")
-        data_properties_file = self.output_directory / Path("DataProperties.json")
+        if names is None:
+            names = ["DataProperties", "TypedDataSet", "TableInfos"]
+
+        data_properties_file = find_data_file(self.output_directory, "DataProperties")
 
-        if not data_properties_file.exists() or self.reset:
+        if not self._table_data_checked and (data_properties_file is None or self.reset):
             logger.info(f"Importing table {self.table_id} and store to {self.output_directory}")
             # We cannot import the cbsodata module when using the debugger in PyCharm, therefore
             # only call import here
             from cbsodata import cbsodata3 as opendata
+            import requests
             try:
                 opendata.get_data(self.table_id, dir=str(self.output_directory),
-                                  catalog_url=self.catalog_url)
+                                  catalog_url=self.catalog_url, save_format=self.save_format)
             except requests.exceptions.SSLError as err:
                 logger.warning("Could not connect to opendata.cbs.nl. Check your connections")
                 raise err
 
-        # now we get the data from the json files which have been dumped by get_data
-        logger.info(f"Reading json {data_properties_file}")
-        with open(data_properties_file, "r") as stream:
-            self.data_properties = json.load(stream)
+            self._table_data.clear()
+        # the table is downloaded at most once, also when reset is True
+        self._table_data_checked = True
 
-        logger.info(f"Reading json {type_data_set_file}")
-        with open(type_data_set_file, "r") as stream:
-            self.typed_data_set = json.load(stream)
-        logger.info(f"Reading json {table_infos_file}")
-        with open(table_infos_file, "r") as stream:
-            self.table_infos = json.load(stream)
+        # now we get the data from the files which have been written by get_data, in any of the
+        # save formats. The ndjson files are read row by row
+        for name in names:
+            if name in self._table_data:
+                continue
+            logger.info(f"Reading {name} from {self.output_directory}")
+            self._table_data[name] = list(iter_saved_data(self.output_directory, name))
 
     def initialize_dataframes(self):
         """
@@ -707,6 +1069,7 @@ class StatLineTable(object):
 
         # create all the data frames. The question_df contains the questions, the section_df
         # all the sections, and the dimensions all the dimensions
+        self._dataframes_loaded = True
         self.question_df = pd.DataFrame(index=range(1, n_quest), columns=question_columns)
         self.section_df = pd.DataFrame(index=range(1, n_sec), columns=section_columns)
         self.dimension_df = pd.DataFrame(index=range(1, n_dim), columns=dimension_columns)
@@ -719,8 +1082,15 @@ class StatLineTable(object):
         -----
         * The questions are stored in modules, which again can be stored in sections and subsections
           This method keeps track of the level of the current question
+        * The properties are collected as plain records in one pass over the data properties. The
+          question, section and dimension data frames are created at the end
         """
 
+        # the records of the questions (per position), sections and dimensions (per ID)
+        question_records = collections.OrderedDict()
+        section_records = collections.OrderedDict()
+        dimension_records = collections.OrderedDict()
+
         # loop over all the data properties and store the questions, topic and dimensions
         for indicator in self.data_properties:
             data_props = DataProperties(indicator_dict=indicator)
@@ -751,32 +1121,48 @@ class StatLineTable(object):
                         self.level_ids[self.level_keys[this_level]] = None
 
             if data_props.type in ("Dimension", "TimeDimension"):
-                # the current block is a dimension. Store it to the dimensions_df
+                # the current block is a dimension. Store it to the dimension records
                 logger.debug(f"Reading dimension properties {data_props.key}")
-                for key, value in indicator.items():
-                    self.dimension_df.loc[data_props.id, key] = value
+                dimension_records.setdefault(data_props.id, dict()).update(indicator)
             elif data_props.type == "TopicGroup":
                 # the current block is a TopicGroup (such as a Module or a Section. Store it to
-                # the sections_df
+                # the section records
                 logger.debug(f"Reading topic group properties {data_props.key}")
-                for key, value in indicator.items():
-                    self.section_df.loc[data_props.id, key] = value
+                section_records.setdefault(data_props.id, dict()).update(indicator)
             else:
                 # The current block mush be a question because it is not a dimension and not a
-                # section
-
-                # get the index in the question_df from the position property of this block
+                # section. The position property of this block is the index in the question_df.
+                # Store all the values of the current dict and the current levels
                 index = int(data_props.position)
+                record = question_records.setdefault(index, dict())
+                record.update(indicator)
+                record.update(self.level_ids)
 
-                # copy all the values from the current dict  to the data frame
-                for key, value in indicator.items():
-                    self.question_df.loc[index, key] = value
-
-                section_title = None
-                for level, level_id in self.level_ids.items():
-                    self.question_df.loc[index, level] = level_id
+        # Based on the the level id which we have stored in the L0, L1, L2, L3 column we are going
+        # to build a complete description of the module/section/subsection leading to the current
+        # question
+        section_titles = {section_id: record.get(self.title_key)
+                          for section_id, record in section_records.items()}
+        for record in question_records.values():
+            section_title = None
+            for level in self.level_ids.keys():
+                # loop over all the L0, L1, L2, L3 values stored in this record. In case that the
+                # level is equal to the question ID, we are dealing with the current question
+                lev_id = record[level]
+                if lev_id == record.get(self.id_key):
+                    break
+                # If we passed this, it means we got a level L0, L1 which is referring to a module/
+                # section title
+                if section_title is None:
+                    section_title = section_titles[lev_id]
+                else:
+                    section_title += "\n" + section_titles[lev_id]
+            record[self.section_key] = section_title
 
-        # we have looped over all the block. Clean up the dataframes
+        # we have looped over all the block. Create the data frames in one go
+        self.question_df = _records_to_dataframe(question_records, self.question_df)
+        self.section_df = _records_to_dataframe(section_records, self.section_df)
+        self.dimension_df = _records_to_dataframe(dimension_records, self.dimension_df)
 
         # remove all empty rows and some unwanted columns
         self.question_df.dropna(axis=0, inplace=True, how="all")
@@ -784,17 +1170,13 @@ class StatLineTable(object):
         self.dimension_df.dropna(axis=0, inplace=True, how="all")
         self.dimension_df.dropna(axis=1, inplace=True, how="all")
 
-        # the dimensions dataframe contains the variables of the axis (such as 'Bedrijven'). Create
-        # a column in the question_df dataframe per dimension
+        # the dimensions dataframe contains the variables of the axis (such as 'Bedrijven').
         for dimension_key in self.dimension_df[self.key_key]:
-            self.question_df.loc[:, dimension_key] = None
-            # the dimension name is retrieved here. Each dimension has its own json datafile which
+            # the dimension name is retrieved here. Each dimension has its own data file which
             # contains more properties about this dimension, such as the Description. Read the
-            # json data file here, such as e.g. 'Bedrijven.json' and store in the dimensions dict
-            dimension_file = self.output_directory / Path(f"{dimension_key}.json")
-            with open(dimension_file, "r") as stream:
-                self.dimensions[dimension_key] = pd.DataFrame(
-                    json.load(stream)).set_index(self.key_key)
+            # data file here, such as e.g. 'Bedrijven.json' and store in the dimensions dict
+            self.dimensions[dimension_key] = pd.DataFrame(
+                list(iter_saved_data(self.output_directory, dimension_key))).set_index(self.key_key)
 
         # the section df contains all the TopicGroups which we have encountered, such that we can
         # keep track of all the module and section titles. Clean the data frame here and set the
@@ -812,41 +1194,16 @@ class StatLineTable(object):
                 except KeyError:
                     self.section_df = None
 
-        # Based on the the level id which we have stored in the L0, L1, L2, L3 column we are going
-        # to build a complete description of the module/section/subsection leading to the current
-        # question
-        level_labels = list(self.level_ids.keys())
-        for index, row in self.question_df.iterrows():
-            level_ids = row[level_labels]
-            section_title = None
-            for lev_id in level_ids.values:
-                # loop over all the L0, L1, L2, L3 values stored in this row. In case that the
-                # level is equal to the row ID, it means we are dealing with the current question
-                # so we can stop
-                if lev_id == row["ID"]:
-                    break
-                # If we passed this, it means we got a level L0, L1 which is referring to a module/
-                # section title. Look up the title belong to the stored ID from the section df
-                # and append it
-                if section_title is None:
-                    section_title = self.section_df.loc[lev_id, self.title_key]
-                else:
-                    section_title += "\n" + self.section_df.loc[lev_id, self.title_key]
-
-            # we have build a whole module/section/subsection title for this question. Store it
-            # to the Section column
-            self.question_df.loc[index, self.section_key] = section_title
-
         # finally, we can drop any empty column in case we have any to make it cleaner
-        #self.question_df.dropna(axis=1, inplace=True, how="all")
+        self.question_df.dropna(axis=1, inplace=True, how="all")
 
         # we may of lost a level if the structure was not deep enough. Update the levels
-        #common_levels = self.question_df.columns.intersection(self.level_keys)
-        #missing_levels = set(self.level_keys).difference(set(common_levels))
-        #for level in list(missing_levels):
-        #    self.level_keys.remove(level)
-        #    del self.level_ids[level]
-        #self.max_levels = len(self.level_keys)
+        common_levels = self.question_df.columns.intersection(self.level_keys)
+        missing_levels = set(self.level_keys).difference(set(common_levels))
+        for level in list(missing_levels):
+            self.level_keys.remove(level)
+            del self.level_ids[level]
+        self.max_levels = len(self.level_keys)
 
         logger.debug("Done reading data ")
 
@@ -857,41 +1214,54 @@ class StatLineTable(object):
 
         Notes
         -----
-        * We must have a questions_df filled by 'fill_question_list' already. Now
-        * We loop over all the dimensions and store a new data frame for each dimension value.
+        * We must have a questions_df filled by 'fill_question_list' already.
+        * The long table is built in one go: the typed data set is melted to one value per
+          observation (a combination of dimension values) and question, in the order of the
+          questions in the question_df. The question properties are then joined by repeating the
+          question_df once per observation. The dimensions are added as a Title and a Key column.
         """
 
-        df_list = list()
-        for typed_data_set in self.typed_data_set:
-
-            # loop over all the variables of the current block (belonging to one dimension value,
-            # such as 'Bedrijven van 10 en groter'
-            values = list()
-            for key, data in typed_data_set.items():
-                if key == "ID":
-                    # the first value is always an ID, Make a copy of the question dataframe to
-                    # a new data frame which we can fill with values for this dimension
-                    logger.debug(f"Collecting data of {data}")
-                    df = self.question_df.copy()
-                elif key in list(self.dimensions.keys()):
-                    # the next rows contain dimension properties. Get the values and store those
-                    # in the dimension column of are question dataframe. Store both the Title
-                    # and the short key
-                    df.loc[:, key] = self.dimensions[key].loc[data, self.title_key]
-                    df.loc[:, key + "_" + self.key_key] = data
-                else:
-                    # the rest of the rows in this block are the values belonging to the questions
-                    # store them in a list
-                    values.append(data)
+        question_keys = self.question_df[self.key_key].tolist()
+        n_questions = len(question_keys)
+        n_observations = len(self.typed_data_set)
+
+        # melt the data set: all the values of the first observation, then the second, etc.
+        values = pd.Series([observation.get(key) for observation in self.typed_data_set
+                            for key in question_keys])
+
+        # join the question properties by taking the rows of the question_df for each observation
+        positions = np.tile(np.arange(n_questions), n_observations)
+        question_df = self.question_df.take(positions)
 
-            # now copy the whole list of values to our question data frame and add them to a list
-            df.loc[:, self.value_key] = values
-            df_list.append(df)
+        # the dimensions in the order of the data set
+        if self.typed_data_set:
+            dimension_keys = [key for key in self.typed_data_set[0].keys()
+                              if key in self.dimensions]
+        else:
+            dimension_keys = list()
+
+        for key in dimension_keys:
+            logger.debug(f"Collecting data of dimension {key}")
+            dimension_df = self.dimensions[key]
+            observed = [observation.get(key) for observation in self.typed_data_set]
+
+            # store the Title and the short key of the dimension. In case of categoricals, the
+            # label table is shared by all the rows
+            key_codes, keys = encode_dimension(observed, dimension_df.index.tolist())
+            title_codes, titles = encode_dimension(observed, dimension_df.index.tolist(),
+                                                   dimension_df[self.title_key].tolist())
+            key_codes = np.repeat(key_codes, n_questions)
+            title_codes = np.repeat(title_codes, n_questions)
+            if self.categorical_dimensions:
+                question_df[key] = pd.Categorical.from_codes(title_codes, categories=titles)
+                question_df[key + "_" + self.key_key] = pd.Categorical.from_codes(
+                    key_codes, categories=keys)
+            else:
+                question_df[key] = decode_dimension(title_codes, titles)
+                question_df[key + "_" + self.key_key] = decode_dimension(key_codes, keys)
 
-        # we have create a dataframe for each dimension. Now append all the data frames to one
-        # big one
-        logger.info("Merging all the dataframes")
-        self.question_df = pd.concat(df_list, axis=0)
+        question_df[self.value_key] = values.values
+        self.question_df = question_df
 
     def describe(self):
         """
@@ -922,6 +1292,7 @@ class StatLineTable(object):
 
     def show_question_table(self, max_width=None):
         """ Make a nice print of all questions """
+        tabulate = _import_tabulate()
         if tabulate is not None:
             if max_width is not None:
                 df = dataframe_clip_strings(self.question_info_df.copy(), max_width)
@@ -939,6 +1310,7 @@ class StatLineTable(object):
         Make a nice print of all modules
         """
 
+        tabulate = _import_tabulate()
         if tabulate is not None:
             if max_width is not None:
                 df = dataframe_clip_strings(self.module_info_df.copy(), max_width)
@@ -973,29 +1345,35 @@ class StatLineTable(object):
 
         return self.selection_options
 
-    def scan_module_df(self, module_df, question_id, df_list=None):
+    def _collect_question_dfs(self, question_id, df_list=None):
+        """
+        Collect the data frames of the question *question_id* in *df_list*
+
+        The rows of the question are looked up in the *question_index*. In case the rows do not
+        form one question (because the ID belongs to a section), the questions below it are
+        collected
+        """
 
         if df_list is None:
             df_list = list()
-        for level_id, level_df in module_df.groupby(level=1):
-            if level_id != question_id:
-                continue
-            else:
-                sub_level_df = self._remove_all_section_levels(level_df)
-                is_question = self._has_equal_number_of_nans(level_id, sub_level_df=sub_level_df)
-                if not is_question:
-                    # the block we have is not a question, because the is an unequal amount of nans
-                    # in the index. Loop over the blocks and call this function again with the
-                    # subsubblocks
-                    logger.debug(f"looping over all levels  for {level_id}")
-                    try:
-                        for id, df in sub_level_df.groupby(level=1):
-                            logger.debug(f"Recursive call for {level_id}: {id}")
-                            df_list.append(self.get_question_df(id, df))
-                    except ValueError:
-                        logger.debug(f"Failed getting next level for {level_id}: {id}")
-                else:
-                    df_list.append(sub_level_df)
+
+        positions = self.question_index.positions.get(question_id)
+        if positions is None:
+            return df_list
+
+        depth = self.question_index.depth[positions]
+        is_question = self._has_equal_number_of_nans(question_id, sub_level_df=None, depth=depth)
+        if not is_question:
+            # the block we have is not a question, because the is an unequal amount of nans
+            # in the index. Loop over the blocks one level deeper
+            logger.debug(f"looping over all levels  for {question_id}")
+            for id in self.question_index.children.get(question_id, list()):
+                logger.debug(f"Recursive call for {question_id}: {id}")
+                self._collect_question_dfs(id, df_list=df_list)
+        else:
+            level_df = self.question_df.take(positions)
+            df_list.append(self._remove_all_section_levels(
+                level_df, level=self.question_index.levels[question_id], depth=depth))
 
         return df_list
 
@@ -1011,24 +1389,22 @@ class StatLineTable(object):
         Returns
         -------
         pd.DataFrame
-            The dataframe of the question you want to get
+            The dataframe of the question you want to get. In case the id belongs to a module or
+            section, a list with the data frames of the questions in it is returned. None if the
+            id is not found
 
         Notes
         -----
         * The question id is not in a fixed column as it depends on the depth of the current level.
-          Therefore, the levels are scanned until we got the question
+          The rows of each id are looked up in the *question_index*, which is made once
 
         """
-        df_list = None
-        for module_id, module_df in self.question_df.groupby(level=0):
-            # module_df_sel = module_df.loc[module_id]
-            df_list = self.scan_module_df(module_df=module_df, question_id=question_id,
-                                          df_list=df_list)
-
-        if df_list is None:
+        if question_id not in self.question_index:
             logger.warning(f"Could not find any question belonging to {question_id}. Please check ")
-            result_df = None
-        elif len(df_list) == 1:
+            return None
+
+        df_list = self._collect_question_dfs(question_id)
+        if len(df_list) == 1:
             # if we have only on match, do not return as a list but a a dataframe
             result_df = df_list[0]
         else:
@@ -1036,14 +1412,32 @@ class StatLineTable(object):
 
         return result_df
 
+    def get_question_dfs(self, question_ids):
+        """
+        Get the questions belonging to the ids *question_ids*
+
+        Parameters
+        ----------
+        question_ids: list
+            The ids of the questions you want to get
+
+        Returns
+        -------
+        collections.OrderedDict
+            The result of :meth:`get_question_df` per id
+        """
+        return collections.OrderedDict((question_id, self.get_question_df(question_id))
+                                       for question_id in question_ids)
+
     @staticmethod
     def close_plots():
+        import matplotlib.pyplot as plt
         plt.close("all")
 
     def prepare_all_data(self):
         self.plot(only_prepare=True)
 
-    def plot(self, only_prepare=False):
+    def plot(self, only_prepare=False, workers=None, force=False):
         """
         Loop over all the modules and plot all questions per module
 
@@ -1051,11 +1445,29 @@ class StatLineTable(object):
         ----------
         only_prepare: bool, optional
             If true, only prepare the data frames for plotting. Do not plot
+        workers: int, optional
+            Number of processes rendering the plots. The data of each plot is prepared in the
+            current process, the processes render the plots with the non-interactive Agg backend
+            and store the images and the exported data. *show_plot* is ignored in that case.
+            Default = None, which means the plots are rendered one by one in the current process
+        force: bool, optional
+            Render all the plots, also the plots which did not change since the previous run (see
+            *skip_unchanged_plots*)
+
+        Notes
+        -----
+        * The file names follow from the titles of the module and question. In case two questions
+          give the same file name, a counter is added to the name of the second one, in the order
+          of the table. The names are therefore the same for any number of workers
+        * The render time of each plot is stored in *plot_timings*, the file names of the plots
+          which were not rendered because they did not change in *skipped_plots*
         """
         if isinstance(self.modules_to_plot, int):
             # turn modules_to_plot into a list if only a integer was given
             self.modules_to_plot = [self.modules_to_plot]
 
+        plot_jobs = list()
+
         for module_id, module_df in self.question_df.groupby(level=0):
 
             if self.modules_to_plot is not None:
@@ -1075,17 +1487,149 @@ class StatLineTable(object):
                     reported.append(level_id)
 
                 self._plot_module_questions(level_id=level_id, level_df=level_df,
-                                            only_prepare=only_prepare)
+                                            only_prepare=only_prepare, plot_jobs=plot_jobs)
+
+        if not only_prepare:
+            self.render_plots(plot_jobs, workers=workers, force=force)
+
+    def read_plot_manifest(self):
+        """
+        Read the hashes of the plots stored in the image directory
+
+        Returns
+        -------
+        dict:
+            The content hash per file base of the plots. Empty if there is no manifest or if it
+            was written by another version of the manifest
+        """
+        try:
+            with open(self.plot_manifest_file, "r") as stream:
+                manifest = json.load(stream)
+        except (OSError, ValueError) as err:
+            logger.debug(f"No plot manifest read from {self.plot_manifest_file}: {err}")
+            return dict()
+        if manifest.get("manifest_version") != PLOT_MANIFEST_VERSION:
+            logger.debug(f"Plot manifest {self.plot_manifest_file} has another version")
+            return dict()
+        return manifest.get("plots", dict())
+
+    def write_plot_manifest(self, plot_hashes):
+        """
+        Write the hashes of the plots to the image directory
+
+        Parameters
+        ----------
+        plot_hashes: dict
+            The content hash per file base of the plots
+        """
+        manifest = dict(manifest_version=PLOT_MANIFEST_VERSION,
+                        plots=dict(sorted(plot_hashes.items())))
+        # write to a temporary file first, so an interrupted run does not leave a broken manifest
+        tmp_file = self.plot_manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as stream:
+            json.dump(manifest, stream, indent=2)
+        tmp_file.replace(self.plot_manifest_file)
+
+    def render_plots(self, plot_jobs, workers=None, force=False):
+        """
+        Render the plots of the plot jobs made by :meth:`make_plot_job`
+
+        Parameters
+        ----------
+        plot_jobs: list
+            The :class:`PlotJob` of each plot
+        workers: int, optional
+            Number of processes rendering the plots. Default = None, which means the plots are
+            rendered in the current process
+        force: bool, optional
+            Render all the plots, also the unchanged plots
+        """
+
+        # make the file names unique, in the order of the jobs
+        file_base_count = collections.Counter()
+        for plot_job in plot_jobs:
+            file_base_count[plot_job.file_base] += 1
+            if file_base_count[plot_job.file_base] > 1:
+                plot_job.file_base = "_".join([plot_job.file_base,
+                                               str(file_base_count[plot_job.file_base])])
+
+        start = time.perf_counter()
+
+        # skip the plots of which the hash is the same as in the previous run
+        use_manifest = self.skip_unchanged_plots and not self.show_plot
+        plot_hashes = dict()
+        self.skipped_plots = list()
+        if use_manifest:
+            previous_hashes = self.read_plot_manifest()
+            plot_hashes.update(previous_hashes)
+            new_hashes = dict()
+            for count, plot_job in enumerate(plot_jobs):
+                new_hashes[count] = plot_job.content_hash()
+                if not force and plot_job.is_unchanged(previous_hashes.get(plot_job.file_base),
+                                                       new_hashes[count]):
+                    self.skipped_plots.append(plot_job.file_base)
+            skipped = set(self.skipped_plots)
+        else:
+            skipped = set()
+        to_render = [count for count, plot_job in enumerate(plot_jobs)
+                     if plot_job.file_base not in skipped]
+
+        timings = dict()
+        n_jobs = len(to_render)
+        try:
+            if workers is None or workers <= 1 or n_jobs <= 1:
+                for done, count in enumerate(to_render):
+                    timings[count] = render_plot(plot_jobs[count])
+                    if use_manifest:
+                        plot_hashes[plot_jobs[count].file_base] = new_hashes[count]
+                    logger.debug(f"Rendered plot {done + 1}/{n_jobs}: "
+                                 f"{plot_jobs[count].file_base}")
+            else:
+                if self.show_plot:
+                    logger.warning("The plots can not be shown when they are rendered by workers")
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers, initializer=_init_plot_worker) as executor:
+                    futures = {executor.submit(_render_plot_job, plot_jobs[count]): count
+                               for count in to_render}
+                    for done, future in enumerate(concurrent.futures.as_completed(futures)):
+                        count = futures[future]
+                        timings[count] = future.result()
+                        if use_manifest:
+                            plot_hashes[plot_jobs[count].file_base] = new_hashes[count]
+                        logger.info(f"Rendered plot {done + 1}/{n_jobs}: "
+                                    f"{plot_jobs[count].file_base} ({timings[count]:.2f} s)")
+        finally:
+            # also store the plots rendered before an error, so they are skipped the next time
+            if use_manifest:
+                self.write_plot_manifest(plot_hashes)
+        wall_time = time.perf_counter() - start
+
+        self.plot_timings = collections.OrderedDict(
+            (plot_jobs[count].file_base, timings[count]) for count in to_render)
+        logger.info(f"Rendered {n_jobs} plots in {wall_time:.2f} s with {workers or 1} worker(s) "
+                    f"(render time {sum(timings.values()):.2f} s), "
+                    f"skipped {len(self.skipped_plots)} unchanged plots")
 
     @staticmethod
-    def _remove_all_section_levels(level_df):
+    def _remove_all_section_levels(level_df, level=1, depth=None):
         """
         Remove all the levels from *level_df* that belong to a section
 
+        Parameters
+        ----------
+        level_df: pd.DataFrame
+            The rows of a question or section
+        level: int, optional
+            The level of the index holding the id of the question or section. The levels above it
+            are dropped. Default = 1
+        depth: np.ndarray, optional
+            The number of levels with a value of each row (see :func:`level_depth`). Default =
+            None, which means it is obtained from the index of *level_df*
+
         Returns
         -------
         pd.DataFrame
-            Dataframe with all section levels removed
+            Dataframe with all section levels removed. The data is not copied
 
         Notes
         -----
@@ -1093,58 +1637,77 @@ class StatLineTable(object):
         first level always applies to the module, so we can drop it here. Then, there more be
         section levels we we may also drop. We can see that by looking at the next level: if that
         has at least a nan, the current level can not be a section and we can continue. Otherwise
-        we drop the current level too
+        we drop the current level too. As the levels of a row are filled from L0 down to its depth,
+        the next level has a nan if the smallest depth of the rows does not reach it
         """
 
-        try:
-            # for pandas version >= 0.24.0
-            sub_level_df = level_df.droplevel(0)
-        except AttributeError:
-            # for pandas version < 0.24.0
-            sub_level_df = level_df.copy()
-            sub_level_df.index = level_df.index.droplevel(level=0)
-
-        while True:
-            try:
-                if sub_level_df.index.get_level_values(1).isnull().any():
-                    break
-            except IndexError:
-                break
-            else:
-                # we have found only valid values at the next level, so we can drop the current one
-                # because it belongs to a section
-                try:
-                    sub_level_df = sub_level_df.droplevel(0)
-                except AttributeError:
-                    sub_level_df.index = sub_level_df.index.droplevel(level=0)
+        index = level_df.index
+        if not isinstance(index, pd.MultiIndex):
+            return level_df
+
+        if depth is None:
+            depth = level_depth(index)
+
+        # the first level to keep
+        first_level = level
+        if len(depth) > 0:
+            first_level = max(level, min(int(depth.min()), index.nlevels) - 1)
+
+        if first_level == 0:
+            return level_df
+
+        sub_level_df = level_df.copy(deep=False)
+        sub_level_df.index = index.droplevel(list(range(first_level)))
 
         return sub_level_df
 
     @staticmethod
-    def _has_equal_number_of_nans(level_id, sub_level_df):
+    def _has_equal_number_of_nans(level_id, sub_level_df, depth=None):
+        """
+        Check if all the rows have the same number of nans in the index, which means they are the
+        options of one question
 
-        equal_number = False
-        last_number = None
-        for index, row in sub_level_df.iterrows():
-            try:
-                # count number of nans in de index of the current row
-                number_of_nan = sum([math.isnan(x) for x in index])
-            except TypeError:
-                return equal_number
-            if last_number is not None and number_of_nan != last_number:
-                logger.debug("Need to go one level deeper")
-                return equal_number
+        Parameters
+        ----------
+        level_id: int
+            The id of the question or section
+        sub_level_df: pd.DataFrame
+            The rows of the question or section
+        depth: np.ndarray, optional
+            The number of levels with a value of each row (see :func:`level_depth`). Default =
+            None, which means it is obtained from the index of *sub_level_df*
+
+        Returns
+        -------
+        bool:
+            True if all rows have the same number of nans
+        """
 
-            last_number = number_of_nan
+        if depth is None:
+            if not isinstance(sub_level_df.index, pd.MultiIndex):
+                # only the level of the question itself is left, which has no nans
+                return True
+            depth = level_depth(sub_level_df.index)
 
-        equal_number = True
+        equal_number = len(depth) == 0 or depth.min() == depth.max()
+        if not equal_number:
+            logger.debug(f"Need to go one level deeper for {level_id}")
 
         return equal_number
 
-    def question_or_its_parent_in_index(self, level_df):
+    def question_or_its_parent_in_index(self, level_df, level_id=None):
         """
         Check if a question or any of the parent is in de index.
 
+        Parameters
+        ----------
+        level_df: pd.DataFrame
+            The rows of a question or section
+        level_id: int, optional
+            The id of the question or section of *level_df*. If given, its parents and children
+            are looked up in the *question_index*. Otherwise, all the ids in the index of
+            *level_df* are checked
+
         Return
         ------
         bool:
@@ -1153,14 +1716,20 @@ class StatLineTable(object):
         if isinstance(self.questions_to_plot, int):
             # if the questions_to_plot is given as a single int, make it a list
             self.questions_to_plot = [self.questions_to_plot]
-        in_index = False
-        for question_index in level_df.index.values:
-            if set(question_index).intersection(set(self.questions_to_plot)):
-                in_index = True
-                break
-        return in_index
-
-    def _plot_module_questions(self, level_id: int, level_df: pd.DataFrame, only_prepare=False):
+
+        if level_id is not None and level_id in self.question_index:
+            ids = self.question_index.related[level_id]
+        else:
+            index = level_df.index
+            if not isinstance(index, pd.MultiIndex):
+                index = pd.MultiIndex.from_arrays([index])
+            index = index.remove_unused_levels()
+            ids = set(_to_id(value) for values in index.levels for value in values)
+
+        return not ids.isdisjoint(self.questions_to_plot)
+
+    def _plot_module_questions(self, level_id: int, level_df: pd.DataFrame, only_prepare=False,
+                               plot_jobs=None):
         """
         Plot the questions of a module
 
@@ -1172,10 +1741,12 @@ class StatLineTable(object):
             A pandas dataframe of the current module questions
         only_prepare:  bool, optional
             If true, we do not make the plots, only prepare the data frames
+        plot_jobs: list, optional
+            If given, the plot jobs are appended to this list instead of making the plots
         """
 
         if self.questions_to_plot is not None and not self.plot_all_questions:
-            plot_question = self.question_or_its_parent_in_index(level_df)
+            plot_question = self.question_or_its_parent_in_index(level_df, level_id=level_id)
             if not plot_question:
                 logger.debug(f"Skipping question {level_id}")
                 return
@@ -1193,7 +1764,8 @@ class StatLineTable(object):
             try:
                 for id, df in sub_level_df.groupby(level=1):
                     logger.debug(f"Calling plot for {level_id}: {id}")
-                    self._plot_module_questions(id, df, only_prepare=only_prepare)
+                    self._plot_module_questions(id, df, only_prepare=only_prepare,
+                                                plot_jobs=plot_jobs)
             except ValueError:
                 logger.debug(f"Failed getting next level for {level_id}: {id}")
             finally:
@@ -1201,10 +1773,12 @@ class StatLineTable(object):
 
         logger.debug("Making plot")
 
-        if not only_prepare:
-            self.make_the_plot(sub_level_df=sub_level_df)
-        else:
+        if only_prepare:
             self.prepare_data_frame(sub_level_df=sub_level_df)
+        elif plot_jobs is not None:
+            plot_jobs.append(self.make_plot_job(sub_level_df=sub_level_df))
+        else:
+            self.make_the_plot(sub_level_df=sub_level_df)
 
     def prepare_data_frame(self, sub_level_df):
 
@@ -1218,6 +1792,10 @@ class StatLineTable(object):
         # per size class in the columns.
         sub_level_df.reset_index(inplace=True)
         index = [self.title_key] + self.dimension_df[self.key_key].tolist()
+        for column in index:
+            # the selection and the plots work on the labels, not on categorical codes
+            if isinstance(sub_level_df[column].dtype, pd.CategoricalDtype):
+                sub_level_df[column] = sub_level_df[column].astype(object)
         sub_level_df.set_index(index, drop=True, inplace=True)
         sub_level_df = sub_level_df[self.value_key]
 
@@ -1272,6 +1850,24 @@ class StatLineTable(object):
 
         """
 
+        render_plot(self.make_plot_job(sub_level_df=sub_level_df))
+
+    def make_plot_job(self, sub_level_df):
+        """
+        Prepare the plot of the data stored in the *sub_level_df* Dataframe
+
+        Parameters
+        ----------
+        sub_level_df: pd.Dataframe
+            Dataframe containing the data to plot
+
+        Returns
+        -------
+        PlotJob:
+            The prepared data, titles and file name of the plot, which can be rendered by
+            :func:`render_plot` in another process
+        """
+
         key = sub_level_df[self.key_key].values[0]
         units = sub_level_df[self.units_key].values[0]
         section_title = sub_level_df[self.section_key].values[0]
@@ -1287,107 +1883,298 @@ class StatLineTable(object):
 
         sub_level_df = self.prepare_data_frame(sub_level_df=sub_level_df)
 
-        fig, axis = plt.subplots(nrows=1, ncols=1, figsize=(10, 6))
-        fig.subplots_adjust(left=0.4, right=0.7)
-
-        sub_level_df.plot(kind="barh", ax=axis)
-
-        axis.set_xlabel(units)
-        axis.invert_yaxis()
+        hide_y_axis = False
         if question_title is None:
             question_title = sub_level_df.index.values[0]
-            axis.get_yaxis().set_visible(False)
-        else:
-            axis.set_ylabel("")
-
-        patches, labels = axis.get_legend_handles_labels()
-        if isinstance(self.selection, dict):
-            inv_map = {v: k for k, v in self.selection.items()}
-            new_labels = list()
-            for label in labels:
-                try:
-                    new_labels.append(inv_map[label])
-                except KeyError:
-                    new_labels.append(label)
-            labels = new_labels
+            hide_y_axis = True
 
         if self.legend_title is not None:
             legend_title = self.legend_title
         else:
             legend_title = self.x_axis_key
 
-        axis.legend(patches, labels, loc="lower left", bbox_to_anchor=self.legend_position,
-                    title=legend_title)
-
-        def add_figtext(title, properties):
-            location = properties["loc"]
-            color = properties.get("color")
-            plt.figtext(location[0], location[1], title, color=color)
-
-        add_figtext(survey_title, self.survey_title_properties)
-        add_figtext(module_title, self.module_title_properties)
-        add_figtext(question_title, self.question_title_properties)
-
-        # plt.title(df["Title"].values[0])
-
         if self.apply_selection:
             suffix = "sel"
         else:
             suffix = "all"
         file_base = "_".join([self.table_id,
-                              re.sub("\s+", "_", module_title).lower(),
-                              re.sub("\s+", "_", question_title).lower(),
+                              re.sub(r"\s+", "_", module_title).lower(),
+                              re.sub(r"\s+", "_", question_title).lower(),
                               suffix])
         file_base = re.sub("[()/]", "", file_base)
-        file_name = Path(file_base + self.image_type)
-        image_name = self.image_dir / file_name
 
-        if self.save_plot:
-            logger.info(f"Saving image to {image_name}")
-            plt.savefig(image_name)
-        if self.show_plot:
-            plt.ioff()
-            plt.show()
+        logger.debug(f"Prepared plot of {key}: {file_base}")
 
-        if self.store_plot_data_to_xls:
-            xls_file = Path(file_base + ".xlsx")
-            xls_file = self.image_dir / xls_file
-            logger.info(f"Saving plot data to {xls_file}")
-            with pd.ExcelWriter(xls_file) as writer:
-                sub_level_df.to_excel(writer, sheet_name=self.x_axis_key)
+        return PlotJob(plot_df=sub_level_df, file_base=file_base, image_dir=self.image_dir,
+                       image_type=self.image_type, units=units, survey_title=survey_title,
+                       module_title=module_title, question_title=question_title,
+                       hide_y_axis=hide_y_axis, selection=self.selection,
+                       legend_title=legend_title, legend_position=self.legend_position,
+                       survey_title_properties=self.survey_title_properties,
+                       module_title_properties=self.module_title_properties,
+                       question_title_properties=self.question_title_properties,
+                       save_plot=self.save_plot, show_plot=self.show_plot,
+                       store_plot_data_to_xls=self.store_plot_data_to_xls,
+                       store_plot_data_to_tex=self.store_plot_data_to_tex,
+                       sheet_name=self.x_axis_key,
+                       rotate_latex_columns=self.rotate_latex_columns)
+
+
+class PlotJob(object):
+    """
+    The data and properties of the plot of one question
 
+    The plot job does not refer to the StatLineTable, so it can be rendered by :func:`render_plot`
+    in another process. The parameters are the prepared data frame (*plot_df*), the base of the
+    file names (*file_base*) and the plot properties of the StatLineTable
+    """
+
+    def __init__(self, plot_df, file_base, image_dir, image_type=".png", units=None,
+                 survey_title=None, module_title=None, question_title=None, hide_y_axis=False,
+                 selection=None, legend_title=None, legend_position=(1.05, 0),
+                 survey_title_properties=None, module_title_properties=None,
+                 question_title_properties=None, save_plot=False, show_plot=False,
+                 store_plot_data_to_xls=False, store_plot_data_to_tex=False, sheet_name=None,
+                 rotate_latex_columns=False):
+        self.plot_df = plot_df
+        self.file_base = file_base
+        self.image_dir = Path(image_dir)
+        self.image_type = image_type
+        self.units = units
+        self.survey_title = survey_title
+        self.module_title = module_title
+        self.question_title = question_title
+        self.hide_y_axis = hide_y_axis
+        self.selection = selection
+        self.legend_title = legend_title
+        self.legend_position = legend_position
+        self.survey_title_properties = survey_title_properties
+        self.module_title_properties = module_title_properties
+        self.question_title_properties = question_title_properties
+        self.save_plot = save_plot
+        self.show_plot = show_plot
+        self.store_plot_data_to_xls = store_plot_data_to_xls
+        self.store_plot_data_to_tex = store_plot_data_to_tex
+        self.sheet_name = sheet_name
+        self.rotate_latex_columns = rotate_latex_columns
+
+    def output_files(self):
+        """
+        The files written by :func:`render_plot` for this plot
+
+        Returns
+        -------
+        list:
+            The paths of the image and the exported data
+        """
+        suffixes = list()
+        if self.save_plot:
+            suffixes.append(self.image_type)
+        if self.store_plot_data_to_xls:
+            suffixes.append(".xlsx")
         if self.store_plot_data_to_tex:
-            tex_file = Path(file_base + ".tex")
-            tex_file = self.image_dir / tex_file
-
-            logger.info(f"Saving plot data to {tex_file}")
-
-            # for latex we transpose the matrix
-            sub_level_df = sub_level_df.T
-
-            if self.rotate_latex_columns:
-                # in order to have the \rot command to work, add the following in the preamble
-
-                # \newcolumntype {R}[2] { %
-                #   > {\adjustbox {angle =  # 1,lap=\width-(#2)}\bgroup}%
-                #   l %
-                #   < {\egroup} %
-                #   }
-                #   \newcommand *\rot {\multicolumn {1} {R {45} {1 em}}}
-
-                rotated_columns = dict()
-                for col_name in sub_level_df.columns:
-                    rotated_columns[col_name] = r"\rot{" + col_name + r"}"
-                sub_level_df.rename(columns=rotated_columns, inplace=True)
-
-            sub_level_df.to_latex(tex_file, longtable=False, decimal=",")
-            if self.rotate_latex_columns:
-                with open(tex_file, "r") as fp:
-                    text = fp.read()
-                new_tex = text.replace("\\textbackslash rot\\{", "\\rot{")
-                new_tex = new_tex.replace("\\}", r"}")
-                with open(tex_file, "w") as fp:
-                    fp.write(new_tex)
+            suffixes.append(".tex")
+        return [self.image_dir / Path(self.file_base + suffix) for suffix in suffixes]
+
+    def content_hash(self):
+        """
+        Hash of the data and the settings of the plot
+
+        Returns
+        -------
+        str:
+            The sha256 hex digest of the values, labels and types of *plot_df* and of all the
+            other properties of the plot except the image directory
+        """
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(self.plot_df, index=True).values.tobytes())
+        labels = [list(self.plot_df.columns), list(self.plot_df.index.names),
+                  [str(dtype) for dtype in self.plot_df.dtypes]]
+        digest.update(repr(labels).encode("utf-8"))
+        settings = {name: value for name, value in vars(self).items()
+                    if name not in ("plot_df", "image_dir")}
+        digest.update(repr(sorted(settings.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_unchanged(self, previous_hash, new_hash=None):
+        """
+        Check if the plot was already rendered with the same data and settings
+
+        Parameters
+        ----------
+        previous_hash: str
+            The hash of the plot in the plot manifest, or None if it is not present
+        new_hash: str, optional
+            The current hash of the plot. Default = None, which means it is calculated
+
+        Returns
+        -------
+        bool:
+            True if the hashes are equal and all the files of the plot exist
+        """
+        if previous_hash is None:
+            return False
+        if new_hash is None:
+            new_hash = self.content_hash()
+        output_files = self.output_files()
+        return (previous_hash == new_hash and len(output_files) > 0 and
+                all(output_file.exists() for output_file in output_files))
+
+
+def render_plot(plot_job, close=False):
+    """
+    Render the plot of a plot job and store the image and the data
+
+    Parameters
+    ----------
+    plot_job: PlotJob
+        The prepared plot
+    close: bool, optional
+        Close the figure after storing it. Default = False
+
+    Returns
+    -------
+    float:
+        The time it took to render the plot in seconds
+    """
+
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+
+    sub_level_df = plot_job.plot_df
+
+    fig, axis = plt.subplots(nrows=1, ncols=1, figsize=(10, 6))
+    fig.subplots_adjust(left=0.4, right=0.7)
+
+    sub_level_df.plot(kind="barh", ax=axis)
+
+    axis.set_xlabel(plot_job.units)
+    axis.invert_yaxis()
+    if plot_job.hide_y_axis:
+        axis.get_yaxis().set_visible(False)
+    else:
+        axis.set_ylabel("")
+
+    patches, labels = axis.get_legend_handles_labels()
+    if isinstance(plot_job.selection, dict):
+        inv_map = {v: k for k, v in plot_job.selection.items()}
+        new_labels = list()
+        for label in labels:
+            try:
+                new_labels.append(inv_map[label])
+            except KeyError:
+                new_labels.append(label)
+        labels = new_labels
+
+    axis.legend(patches, labels, loc="lower left", bbox_to_anchor=plot_job.legend_position,
+                title=plot_job.legend_title)
+
+    def add_figtext(title, properties):
+        location = properties["loc"]
+        color = properties.get("color")
+        fig.text(location[0], location[1], title, color=color)
+
+    add_figtext(plot_job.survey_title, plot_job.survey_title_properties)
+    add_figtext(plot_job.module_title, plot_job.module_title_properties)
+    add_figtext(plot_job.question_title, plot_job.question_title_properties)
+
+    # plt.title(df["Title"].values[0])
+
+    file_base = plot_job.file_base
+    image_name = plot_job.image_dir / Path(file_base + plot_job.image_type)
+
+    if plot_job.save_plot:
+        logger.info(f"Saving image to {image_name}")
+        fig.savefig(image_name)
+    if plot_job.show_plot:
+        plt.ioff()
+        plt.show()
+
+    if plot_job.store_plot_data_to_xls:
+        xls_file = Path(file_base + ".xlsx")
+        xls_file = plot_job.image_dir / xls_file
+        logger.info(f"Saving plot data to {xls_file}")
+        with pd.ExcelWriter(xls_file) as writer:
+            sub_level_df.to_excel(writer, sheet_name=plot_job.sheet_name)
+
+    if plot_job.store_plot_data_to_tex:
+        tex_file = Path(file_base + ".tex")
+        tex_file = plot_job.image_dir / tex_file
+
+        logger.info(f"Saving plot data to {tex_file}")
+
+        # for latex we transpose the matrix
+        sub_level_df = sub_level_df.T
+
+        if plot_job.rotate_latex_columns:
+            # in order to have the \rot command to work, add the following in the preamble
+
+            # \newcolumntype {R}[2] { %
+            #   > {\adjustbox {angle =  # 1,lap=\width-(#2)}\bgroup}%
+            #   l %
+            #   < {\egroup} %
+            #   }
+            #   \newcommand *\rot {\multicolumn {1} {R {45} {1 em}}}
+
+            rotated_columns = dict()
+            for col_name in sub_level_df.columns:
+                rotated_columns[col_name] = r"\rot{" + col_name + r"}"
+            sub_level_df.rename(columns=rotated_columns, inplace=True)
+
+        sub_level_df.to_latex(tex_file, longtable=False, decimal=",")
+        if plot_job.rotate_latex_columns:
+            with open(tex_file, "r") as fp:
+                text = fp.read()
+            new_tex = text.replace("\\textbackslash rot\\{", "\\rot{")
+            new_tex = new_tex.replace("\\}", r"}")
+            with open(tex_file, "w") as fp:
+                fp.write(new_tex)
+
+    if close:
+        plt.close(fig)
+
+    return time.perf_counter() - start
+
+
+def _init_plot_worker():
+    """ The worker processes render the plots without a display """
+    import matplotlib.pyplot as plt
+    plt.switch_backend("agg")
+
+
+def _render_plot_job(plot_job):
+    """ Render a plot job in a worker process, closing the figure afterwards """
+    return render_plot(plot_job, close=True)
+
+
+def _records_to_dataframe(records, template_df):
+    """
+    Create a data frame from records
+
+    Parameters
+    ----------
+    records: dict
+        The record (a dict with the value per column) of each index
+    template_df: DataFrame
+        Empty data frame with the columns and the initial index
+
+    Returns
+    -------
+    DataFrame:
+        The data frame with the columns of *template_df*. The rows are in the same order as if each
+        value was assigned with *template_df.loc[index, key] = value*: first the indices of
+        *template_df* which have a record, then the new indices in order of appearance. Missing
+        values are NaN
+    """
+    if not records:
+        return template_df.iloc[0:0].copy()
+
+    index = [i for i in template_df.index if i in records]
+    index.extend([i for i in records.keys() if i not in template_df.index])
+
+    return pd.DataFrame([records[i] for i in index], index=index, columns=template_df.columns,
+                        dtype=object)
 
 
 def dataframe_clip_strings(df, max_width, include=None, exclude=None):
@@ -6,6 +6,200 @@
     If you don't know what this is for, just leave it empty.
     Read more about conftest.py under:
     https://pytest.org/latest/plugins.html
+
+    The *cbs_server* fixture starts a small local stub of the CBS OData interface
+    (ODataFeed and ODataCatalog) serving the table *STUB_TABLE_ID*. It allows to
+    test the transport, pagination and storage logic without access to
+    opendata.cbs.nl.
 """
 
-# import pytest
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+import pytest
+
+STUB_TABLE_ID = "99999STB"
+STUB_PAGE_SIZE = 5
+
+STUB_SIZES = [
+    ("WP1", "2 of meer werkzame personen"),
+    ("WP2", "2 tot 250 werkzame personen"),
+    ("WP3", "250 of meer werkzame personen"),
+]
+STUB_PERIODS = [
+    ("2016JJ00", "2016"),
+    ("2017JJ00", "2017"),
+    ("2018JJ00", "2018"),
+    ("2019JJ00", "2019"),
+]
+
+
+def _topic(id, position, parent_id, key, title, unit="% van bedrijven"):
+    return {"odata.type": "Cbs.OData.Topic", "ID": id, "Position": position,
+            "ParentID": parent_id, "Type": "Topic", "Key": key, "Title": title,
+            "Description": None, "Datatype": "Integer", "Unit": unit,
+            "Decimals": 0, "Default": "Zero"}
+
+
+def _topic_group(id, parent_id, title):
+    return {"odata.type": "Cbs.OData.TopicGroup", "ID": id, "ParentID": parent_id,
+            "Type": "TopicGroup", "Key": "", "Title": title, "Description": None}
+
+
+def _dimension(id, position, key, title, type="Dimension"):
+    return {"odata.type": "Cbs.OData.{}".format(type), "ID": id, "Position": position,
+            "ParentID": None, "Type": type, "Key": key, "Title": title,
+            "Description": None}
+
+
+STUB_DATA_PROPERTIES = [
+    _dimension(0, 0, "Bedrijfsgrootte", "Bedrijfsgrootte"),
+    _dimension(1, 1, "Perioden", "Perioden", type="TimeDimension"),
+    _topic_group(2, None, "Personeel en ICT"),
+    _topic(3, 1, 2, "ICTPersAangenomen_1", "ICT-pers. aangenomen"),
+    _topic(4, 2, 2, "ICTPersVacatures_2", "Vacatures ICT-pers."),
+    _topic_group(5, 2, "ICT-specialisten"),
+    _topic(6, 3, 5, "ICTSpecialistenInDienst_3", "ICT-specialisten in dienst"),
+    _topic(7, 4, 5, "ICTSpecialistenInLoondienst_4", "ICT-specialisten in loondienst",
+           unit="% van werkzame personen"),
+    _topic_group(8, None, "Cloud-diensten"),
+    _topic(9, 5, 8, "GebruikCloudDiensten_5", "Gebruik cloud-diensten"),
+]
+
+STUB_TOPIC_KEYS = [p["Key"] for p in STUB_DATA_PROPERTIES if p["Type"] == "Topic"]
+
+
+def _make_data_set(typed=True):
+    rows = []
+    for size_index, (size_key, _) in enumerate(STUB_SIZES):
+        for period_index, (period_key, _) in enumerate(STUB_PERIODS):
+            row = {"ID": len(rows), "Bedrijfsgrootte": size_key, "Perioden": period_key}
+            for topic_index, topic_key in enumerate(STUB_TOPIC_KEYS):
+                value = 10 * size_index + period_index + topic_index
+                row[topic_key] = value if typed else str(value)
+            rows.append(row)
+    return rows
+
+
+STUB_TABLES = {
+    "TableInfos": [{
+        "ID": 1, "Title": "Stub tabel; ICT-gebruik, bedrijfsgrootte",
+        "ShortTitle": "Stub ICT-gebruik", "Identifier": STUB_TABLE_ID,
+        "Summary": "Stub", "Modified": "2019-10-01T02:00:00",
+        "MetaDataModified": "2019-10-01T02:00:00", "ReasonDelivery": "Actualisering",
+        "Description": "Stub table used for testing", "RecordCount": 12,
+        "ColumnCount": 8, "DefaultSelection": "$select=Bedrijfsgrootte, Perioden"}],
+    "DataProperties": STUB_DATA_PROPERTIES,
+    "CategoryGroups": [],
+    "Bedrijfsgrootte": [{"Key": k, "Title": t, "Description": None, "CategoryGroupID": None}
+                        for k, t in STUB_SIZES],
+    "Perioden": [{"Key": k, "Title": t, "Description": None, "Status": "Definitief"}
+                 for k, t in STUB_PERIODS],
+    "TypedDataSet": _make_data_set(typed=True),
+    "UntypedDataSet": _make_data_set(typed=False),
+}
+
+STUB_CATALOG = [
+    {"ID": 0, "Identifier": STUB_TABLE_ID, "Title": STUB_TABLES["TableInfos"][0]["Title"],
+     "ShortTitle": "Stub ICT-gebruik", "Modified": "2019-10-01T02:00:00",
+     "Updated": "2019-10-01T02:00:00", "Catalog": "CBS", "Language": "nl",
+     "RecordCount": 12},
+    {"ID": 1, "Identifier": "00000AAA", "Title": "Niet bestaande tabel",
+     "ShortTitle": "Bestaat niet", "Modified": "2019-01-01T02:00:00",
+     "Updated": "2019-01-01T02:00:00", "Catalog": "CBS", "Language": "nl",
+     "RecordCount": 0},
+]
+
+
+class StubCBSHandler(BaseHTTPRequestHandler):
+    """Serve the stub table in the same way as the ODataFeed/ODataCatalog api."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        split = urlsplit(self.path)
+        # the parameters may be given twice, because the nextLink already contains them
+        params = {k: v[0] for k, v in parse_qs(split.query).items()}
+        self.server.requests.append(self.path)
+
+        parts = [p for p in split.path.split("/") if p]
+        if parts[:2] == ["ODataCatalog", "Tables"]:
+            self._send_value(STUB_CATALOG, split.path, params)
+        elif parts[:2] == ["ODataFeed", "odata"] and len(parts) >= 3 \
+                and parts[2] == STUB_TABLE_ID:
+            if len(parts) == 3:
+                index = [{"name": name, "url": "http://{}/ODataFeed/odata/{}/{}".format(
+                    self.server.url, STUB_TABLE_ID, name)} for name in STUB_TABLES]
+                self._send_value(index, split.path, params)
+            elif parts[3] in STUB_TABLES:
+                self._send_value(STUB_TABLES[parts[3]], split.path, params)
+            else:
+                self.send_error(404)
+        else:
+            self.send_error(404)
+
+    def _send_value(self, rows, path, params):
+        if "$filter" in params:
+            # only support simple filters like "Bedrijfsgrootte eq 'WP1'"
+            column, _, value = params["$filter"].split(" ", 2)
+            rows = [r for r in rows if r.get(column) == value.strip("'")]
+        if "$select" in params:
+            columns = [c.strip() for c in params["$select"].split(",")]
+            rows = [{c: r[c] for c in columns if c in r} for r in rows]
+
+        skip = int(params.get("$skip", 0))
+        top = int(params.get("$top", self.server.page_size))
+        page_size = min(top, self.server.page_size)
+        page = rows[skip:skip + page_size]
+
+        result = {"odata.metadata": "http://{}{}/$metadata".format(self.server.url, path),
+                  "value": page}
+        if skip + page_size < len(rows) and "$top" not in params:
+            next_params = dict(params)
+            next_params["$skip"] = skip + page_size
+            result["odata.nextLink"] = "http://{}{}?{}".format(
+                self.server.url, path, urlencode(next_params))
+
+        body = json.dumps(result).encode("utf-8")
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def cbs_server():
+    """Start a local stub of the CBS OData interface on a free port."""
+
+    from cbsodata import cbsodata3 as opendata
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCBSHandler)
+    server.daemon_threads = True
+    server.url = "{}:{}".format(*server.server_address)
+    server.requests = []
+    server.page_size = STUB_PAGE_SIZE
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    use_https = opendata.options.use_https
+    opendata.options.use_https = False
+
+    yield server
+
+    opendata.options.use_https = use_https
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import shutil
+
+import requests
+
+from cbsodata import cbsodata3 as opendata
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+pytest.importorskip("aiohttp")
+
+from cbsodata import aio  # noqa: E402
+
+TEST_ENV = 'test_env_aio'
+
+
+def setup_module(module):
+    print('\nsetup_module()')
+
+    if not os.path.exists(TEST_ENV):
+        os.makedirs(TEST_ENV)
+
+
+def teardown_module(module):
+    print('teardown_module()')
+
+    shutil.rmtree(TEST_ENV)
+
+
+def run(coroutine):
+    """Run the coroutine and close the shared session afterwards."""
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await aio.close_session()
+
+    return asyncio.run(main())
+
+
+def test_get_data(cbs_server):
+
+    data = run(aio.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url))
+
+    assert data == opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+
+
+def test_download_and_store(cbs_server):
+
+    data = run(aio.download_data(STUB_TABLE_ID,
+                                 dir=os.path.join(TEST_ENV, STUB_TABLE_ID),
+                                 catalog_url=cbs_server.url))
+
+    assert list(data.keys()) == [name for name in STUB_TABLES
+                                 if name != "UntypedDataSet"]
+    assert os.path.exists(os.path.join(TEST_ENV, STUB_TABLE_ID, 'TableInfos.json'))
+
+
+def test_info_meta_and_table_list(cbs_server):
+
+    async def main():
+        return await asyncio.gather(
+            aio.get_info(STUB_TABLE_ID, catalog_url=cbs_server.url),
+            aio.get_meta(STUB_TABLE_ID, "DataProperties", catalog_url=cbs_server.url),
+            aio.get_table_list(catalog_url=cbs_server.url),
+        )
+
+    info, meta, table_list = run(main())
+
+    assert info == STUB_TABLES["TableInfos"][0]
+    assert meta == STUB_TABLES["DataProperties"]
+    assert table_list[0]["Identifier"] == STUB_TABLE_ID
+
+
+def test_many_tables(cbs_server):
+
+    async def main():
+        return await asyncio.gather(*[
+            aio.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url) for _ in range(20)
+        ])
+
+    tables = run(main())
+
+    assert len(tables) == 20
+    assert all(len(data) == len(STUB_TABLES["TypedDataSet"]) for data in tables)
+
+
+def test_http_error(cbs_server):
+
+    with pytest.raises(requests.HTTPError):
+        run(aio.get_data('00000AAA', catalog_url=cbs_server.url))
@@ -0,0 +1,99 @@
+import os
+import shutil
+
+from cbsodata import cbsodata3 as opendata
+from cbsodata.cache import MemoryCache, FileCache
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+TEST_ENV = 'test_env_cache'
+
+
+def setup_module(module):
+    print('\nsetup_module()')
+
+    if not os.path.exists(TEST_ENV):
+        os.makedirs(TEST_ENV)
+
+
+def teardown_module(module):
+    print('teardown_module()')
+
+    shutil.rmtree(TEST_ENV)
+
+
+@pytest.fixture
+def cache(request):
+    """Set a cache in the options and remove it after the test."""
+
+    if request.param == "memory":
+        opendata.options.cache = MemoryCache()
+    else:
+        opendata.options.cache = FileCache(os.path.join(TEST_ENV, request.node.name))
+
+    yield opendata.options.cache
+
+    opendata.options.cache = None
+
+
+@pytest.mark.parametrize("cache", ["memory", "file"], indirect=True)
+def test_unchanged_table_from_cache(cbs_server, cache):
+
+    data = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    n_requests = len(cbs_server.requests)
+
+    data_cached = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+
+    # only the table information is requested (and not modified)
+    assert data_cached == data
+    assert len(cbs_server.requests) == n_requests + 1
+    assert "TableInfos" in cbs_server.requests[-1]
+
+
+@pytest.mark.parametrize("cache", ["memory"], indirect=True)
+def test_modified_table(cbs_server, cache, monkeypatch):
+
+    opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    n_requests = len(cbs_server.requests)
+
+    table_infos = dict(STUB_TABLES["TableInfos"][0], Modified="2020-01-01T02:00:00")
+    monkeypatch.setitem(STUB_TABLES, "TableInfos", [table_infos])
+    opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+
+    # all the tables are validated with the server again
+    assert len(cbs_server.requests) == 2 * n_requests
+
+
+@pytest.mark.parametrize("cache", ["memory"], indirect=True)
+def test_cache_ttl(cbs_server, cache):
+
+    cache.ttl = 3600
+
+    meta = opendata.get_meta(STUB_TABLE_ID, "DataProperties", catalog_url=cbs_server.url)
+    n_requests = len(cbs_server.requests)
+
+    assert opendata.get_meta(STUB_TABLE_ID, "DataProperties",
+                             catalog_url=cbs_server.url) == meta
+    assert len(cbs_server.requests) == n_requests
+
+
+@pytest.mark.parametrize("cache_class", [MemoryCache, FileCache])
+def test_cache_eviction(cache_class):
+
+    if cache_class is FileCache:
+        cache = cache_class(os.path.join(TEST_ENV, "eviction"), max_size=25)
+    else:
+        cache = cache_class(max_size=25)
+
+    cache.set("http://a", b"0123456789")
+    cache.set("http://b", b"0123456789")
+    cache.get("http://a")
+    cache.set("http://c", b"0123456789")
+
+    # b was least recently used
+    assert cache.get("http://b") is None
+    assert cache.get("http://a").body == b"0123456789"
+    assert cache.get("http://c") is not None
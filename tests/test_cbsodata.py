@@ -1,13 +1,17 @@
+import json
 import os
 import shutil
 
 import requests
 
 from cbsodata import cbsodata3 as opendata
+from cbsodata.columnar import columns_to_output
 
 # testing deps
 import pytest
 
+from conftest import STUB_PERIODS, STUB_TABLE_ID, STUB_TABLES
+
 
 datasets = [
     '82010NED',
@@ -242,3 +246,230 @@ def test_get_data_derden(table_id):
 
         assert data_option1[0][key] == \
             data_option2[0][key] == data_option3[0][key]
+
+
+class CountingSession(requests.Session):
+    """Session which counts the number of requests send."""
+
+    def __init__(self):
+        super(CountingSession, self).__init__()
+        self.n_requests = 0
+
+    def send(self, request, **kwargs):
+        self.n_requests += 1
+        return super(CountingSession, self).send(request, **kwargs)
+
+
+def test_shared_session(cbs_server):
+
+    session = opendata._get_session()
+
+    opendata.get_info(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    opendata.get_table_list(catalog_url=cbs_server.url)
+
+    assert opendata._get_session() is session
+
+    # changing the pool settings creates a new pool
+    opendata.options.pool_maxsize = 20
+    try:
+        assert opendata._get_session() is not session
+    finally:
+        opendata.options.pool_maxsize = 10
+        opendata.close_session()
+
+
+def test_custom_session(cbs_server):
+
+    opendata.options.session = CountingSession()
+    try:
+        data = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+        n_requests = opendata.options.session.n_requests
+    finally:
+        opendata.options.session = None
+
+    assert len(data) == len(STUB_TABLES["TypedDataSet"])
+    assert n_requests == len(cbs_server.requests)
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_download_max_workers(cbs_server, max_workers):
+
+    data = opendata.download_data(
+        STUB_TABLE_ID,
+        dir=os.path.join(TEST_ENV, "workers_{}".format(max_workers)),
+        catalog_url=cbs_server.url,
+        max_workers=max_workers
+    )
+
+    expected_names = [name for name in STUB_TABLES if name != "UntypedDataSet"]
+    assert list(data.keys()) == expected_names
+    assert data["TypedDataSet"] == STUB_TABLES["TypedDataSet"]
+
+    for name in expected_names:
+        assert os.path.exists(os.path.join(
+            TEST_ENV, "workers_{}".format(max_workers), name + '.json'))
+
+
+def test_iter_data(cbs_server):
+
+    rows = list(opendata.iter_data(STUB_TABLE_ID, catalog_url=cbs_server.url))
+
+    assert rows == opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    assert rows[0]["Bedrijfsgrootte"] == "2 of meer werkzame personen"
+
+
+def test_iter_data_batches(cbs_server):
+
+    pages = list(opendata.iter_data(STUB_TABLE_ID, catalog_url=cbs_server.url,
+                                    batches=True, select=["Bedrijfsgrootte"]))
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert all(list(row.keys()) == ["Bedrijfsgrootte"] for page in pages for row in page)
+
+
+def test_iter_data_lazy(cbs_server):
+
+    rows = opendata.iter_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    next(rows)
+    n_requests = len(cbs_server.requests)
+    rows.close()
+
+    # only the first page of the data set has been requested
+    assert sum("TypedDataSet" in r for r in cbs_server.requests[:n_requests]) == 1
+
+
+@pytest.mark.parametrize("prefetch", [1, 3])
+def test_prefetch(cbs_server, prefetch):
+
+    data = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url,
+                             prefetch=prefetch)
+    rows = list(opendata.iter_data(STUB_TABLE_ID, catalog_url=cbs_server.url,
+                                   prefetch=prefetch))
+    filtered = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url,
+                                 prefetch=prefetch, filters="Bedrijfsgrootte eq 'WP1'")
+
+    expected = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    assert data == rows == expected
+    assert filtered == expected[:4]
+
+
+@pytest.mark.parametrize("max_rows, n_pages", [(0, 0), (3, 1), (7, 2), (20, 4)])
+def test_iter_data_max_rows(cbs_server, max_rows, n_pages):
+
+    rows = list(opendata.iter_data(STUB_TABLE_ID, catalog_url=cbs_server.url,
+                                   max_rows=max_rows, prefetch=3))
+
+    # the rows are requested with $top, the next pages with $skip. At the end
+    # of the table an empty page is received
+    pages = [r for r in cbs_server.requests if "TypedDataSet" in r]
+    assert len(pages) == n_pages
+    assert all("%24top=" in r for r in pages)
+    assert rows == opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)[:max_rows]
+
+
+def test_prefetch_more_rows_than_record_count(cbs_server):
+
+    # the record count in the table information may be outdated
+    pages = opendata._iter_metadata_pages(STUB_TABLE_ID, "TypedDataSet",
+                                          catalog_url=cbs_server.url,
+                                          prefetch=3, record_count=7)
+
+    assert sum(pages, []) == STUB_TABLES["TypedDataSet"]
+
+
+def test_get_data_dataframe(cbs_server):
+
+    pd = pytest.importorskip("pandas")
+
+    df = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url, output="dataframe")
+    records = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+
+    # the dimensions are categories labeled by their titles
+    assert df["Bedrijfsgrootte"].dtype == "category"
+    assert list(df["Perioden"].cat.categories) == ["2016", "2017", "2018", "2019"]
+    # the topics have the type of their Datatype
+    assert df["ICTPersAangenomen_1"].dtype == "Int64"
+
+    expected = pd.DataFrame(records)
+    pd.testing.assert_frame_equal(df.astype(object), expected.astype(object))
+
+
+@pytest.mark.parametrize("output", ["pandas", "arrow", "numpy"])
+def test_get_data_columnar(cbs_server, output):
+
+    if output == "arrow":
+        pytest.importorskip("pyarrow")
+
+    records = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    data = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url, output=output)
+
+    if output == "pandas":
+        rows = data.to_dict(orient="records")
+    elif output == "arrow":
+        rows = data.to_pylist()
+    else:
+        rows = [dict(zip(data.dtype.names, row.tolist())) for row in data]
+
+    assert rows == records
+
+
+def test_get_data_not_categorical(cbs_server):
+
+    pytest.importorskip("pandas")
+
+    df = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url, output="pandas",
+                           categorical=False)
+
+    assert df["Perioden"].dtype == object
+    assert df["Perioden"].tolist()[:4] == ["2016", "2017", "2018", "2019"]
+
+
+def test_get_data_columnar_missing_values(cbs_server):
+
+    pd = pytest.importorskip("pandas")
+
+    df = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url, output="pandas",
+                           select=["Bedrijfsgrootte", "ICTPersAangenomen_1"],
+                           filters="Perioden eq '2016JJ00'")
+
+    assert df.shape == (3, 2)
+
+    columns = {"Bedrijfsgrootte": ["WP1", "XX"], "Topic": [1, None]}
+    df = columns_to_output(columns, "pandas", dtypes={"Topic": "Integer"},
+                           dimensions={"Bedrijfsgrootte": (["WP1"], ["Klein"])})
+
+    assert list(df["Bedrijfsgrootte"]) == ["Klein", "XX"]
+    assert df["Topic"].isna().tolist() == [False, True]
+
+
+def test_download_data_columnar(cbs_server, tmpdir):
+
+    pytest.importorskip("pandas")
+
+    data = opendata.download_data(STUB_TABLE_ID, dir=str(tmpdir), catalog_url=cbs_server.url,
+                                  output="pandas")
+
+    # the dimensions keep their keys
+    assert list(data["TypedDataSet"]["Perioden"].cat.categories) == \
+        [key for key, _ in STUB_PERIODS]
+    assert len(data["DataProperties"]) == len(STUB_TABLES["DataProperties"])
+
+    # the tables are stored as records
+    with open(os.path.join(str(tmpdir), "TypedDataSet.json")) as f:
+        assert json.load(f) == STUB_TABLES["TypedDataSet"]
+
+
+def test_get_meta_columnar(cbs_server):
+
+    pytest.importorskip("pandas")
+
+    df = opendata.get_meta(STUB_TABLE_ID, "Perioden", catalog_url=cbs_server.url,
+                           output="pandas")
+
+    assert df.to_dict(orient="records") == STUB_TABLES["Perioden"]
+
+
+def test_get_data_unknown_output():
+
+    with pytest.raises(ValueError):
+        opendata.get_data(STUB_TABLE_ID, output="xml")
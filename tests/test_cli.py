@@ -0,0 +1,81 @@
+import json
+import sys
+
+from cbsodata import cbsodata3 as opendata
+from cbsodata.__main__ import main, text_outputter
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TOPIC_KEYS
+
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["cbsodata"] + [str(arg) for arg in args])
+    main()
+
+
+def data_requests(cbs_server):
+    return [r for r in cbs_server.requests if "TypedDataSet" in r]
+
+
+def test_data_max_rows(cbs_server, monkeypatch, capsys):
+    run_cli(monkeypatch, "data", STUB_TABLE_ID, "--catalog_url", cbs_server.url, "-n", 3)
+
+    # only the rows shown are downloaded
+    assert [r for r in data_requests(cbs_server) if "%24top=3" in r] == data_requests(cbs_server)
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert rows == opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)[:3]
+
+
+def test_data_output_file(cbs_server, monkeypatch, capsys, tmpdir):
+    output_file = tmpdir.join("data.json")
+    run_cli(monkeypatch, "data", STUB_TABLE_ID, "--catalog_url", cbs_server.url, "-n", 3,
+            "-o", output_file)
+
+    # the file gets all the rows, the first rows are shown
+    expected = opendata.get_data(STUB_TABLE_ID, catalog_url=cbs_server.url)
+    with open(output_file) as f:
+        assert [json.loads(line) for line in f] == expected
+    assert len(capsys.readouterr().out.splitlines()) == 3
+
+
+@pytest.mark.parametrize("max_rows", [2, 100])
+def test_data_text(cbs_server, monkeypatch, capsys, max_rows):
+    run_cli(monkeypatch, "data", STUB_TABLE_ID, "--catalog_url", cbs_server.url,
+            "-n", max_rows, "-f", "text")
+
+    lines = capsys.readouterr().out.splitlines()
+    columns = ["ID", "Bedrijfsgrootte", "Perioden"] + STUB_TOPIC_KEYS
+    assert lines[0].split() == [column.upper() for column in columns]
+    assert len(lines) == 1 + min(max_rows, 12)
+
+
+def test_text_outputter(capsys):
+    rows = [{"Key": "a", "Title": "Eerste", "Value": 1.5},
+            {"Key": "bbbb", "Title": "Tweede", "Value": None},
+            {"Key": "c", "Value": 10}]
+    text_outputter(rows)
+    assert capsys.readouterr().out == ("KEY   TITLE   VALUE\n"
+                                       "a     Eerste  1.5\n"
+                                       "bbbb  Tweede  None\n"
+                                       "c             10\n")
+
+    # the widths of the first row only, the other rows are not cut off
+    text_outputter(rows, sample_rows=1, chunk_size=1)
+    assert capsys.readouterr().out == ("KEY  TITLE   VALUE\n"
+                                       "a    Eerste  1.5\n"
+                                       "bbbb Tweede  None\n"
+                                       "c            10\n")
+
+    text_outputter(iter(rows), max_rows=1)
+    assert capsys.readouterr().out.splitlines() == ["KEY  TITLE   VALUE", "a    Eerste  1.5"]
+
+
+def test_mirror(cbs_server, monkeypatch, capsys, tmpdir):
+    run_cli(monkeypatch, "mirror", STUB_TABLE_ID, "--catalog_url", cbs_server.url,
+            "--dir", tmpdir.join("mirror"))
+
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(r["table_id"], r["status"]) for r in results] == [(STUB_TABLE_ID, "downloaded")]
+    assert tmpdir.join("mirror", STUB_TABLE_ID, "TableInfos.json").exists()
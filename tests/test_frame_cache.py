@@ -0,0 +1,128 @@
+import json
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cbsodata.frame_cache import CACHE_VERSION, FRAME_CACHE_FORMATS, get_frame_cache
+from cbsodata.utils import StatLineTable
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID
+
+LABELS = ["question", "section", "dimensions"]
+
+
+@pytest.fixture
+def statline_kwargs(cbs_server, tmpdir):
+    return dict(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                cache_dir_name=str(tmpdir.join("cache")),
+                image_dir_name=str(tmpdir.join("images")))
+
+
+def statline_cache_format(request):
+    if request.param != "pickle":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+@pytest.fixture(params=FRAME_CACHE_FORMATS)
+def cache_format(request):
+    return statline_cache_format(request)
+
+
+@pytest.fixture(params=["parquet", "feather"])
+def arrow_format(request):
+    return statline_cache_format(request)
+
+
+def test_round_trip(statline_kwargs, cache_format, tmpdir):
+    statline = StatLineTable(to_pickle=False, **statline_kwargs)
+
+    cache = get_frame_cache(cache_format, str(tmpdir), STUB_TABLE_ID)
+    for label, df in zip(LABELS, [statline.question_df, statline.section_df,
+                                  statline.dimension_df]):
+        cache.write(label, df)
+        df_cached = cache.read(label)
+        assert_frame_equal(df_cached, df)
+        assert list(df_cached.index.names) == list(df.index.names)
+        # the python values of the object columns are restored
+        assert [type(v) for v in df_cached.values.ravel()] == [type(v) for v in df.values.ravel()]
+
+
+def test_projection_and_filters(statline_kwargs, cache_format, tmpdir):
+    question_df = StatLineTable(to_pickle=False, **statline_kwargs).question_df
+
+    cache = get_frame_cache(cache_format, str(tmpdir), STUB_TABLE_ID)
+    cache.write("question", question_df)
+
+    module = question_df.index.get_level_values("L0") == 2
+    assert_frame_equal(cache.read("question", filters=[("L0", "==", 2)]), question_df[module])
+
+    keys = ["ICTPersAangenomen_1", "GebruikCloudDiensten_5"]
+    selection = question_df["Key"].isin(keys) & ~module
+    df_cached = cache.read("question", columns=["Key", "Values"],
+                           filters=[("Key", "in", keys), ("L0", "!=", 2)])
+    assert_frame_equal(df_cached, question_df.loc[selection, ["Key", "Values"]])
+
+    with pytest.raises(ValueError):
+        cache.read("question", filters=[("L0", "~", 2)])
+
+
+def test_stamp(tmpdir, cache_format):
+    cache = get_frame_cache(cache_format, str(tmpdir), STUB_TABLE_ID)
+    cache.write("question", pd.DataFrame(dict(Key=["a", "b"])))
+    assert not cache.is_valid(["question"], table_version="v1")
+
+    cache.write_stamp(table_version="v1")
+    with open(cache.stamp_file, "r") as stream:
+        stamp = json.load(stream)
+    assert stamp == dict(format=cache_format, cache_version=CACHE_VERSION, table_version="v1")
+
+    assert cache.is_valid(["question"], table_version="v1")
+    assert not cache.is_valid(["question", "section"], table_version="v1")
+    assert not cache.is_valid(["question"], table_version="v2")
+
+    # a cache written in another format or by another version of the cache is stale
+    other_format = [f for f in FRAME_CACHE_FORMATS if f != cache_format][0]
+    with open(cache.stamp_file, "w") as stream:
+        json.dump(dict(stamp, format=other_format), stream)
+    assert not cache.is_valid(["question"], table_version="v1")
+    with open(cache.stamp_file, "w") as stream:
+        json.dump(dict(stamp, cache_version=CACHE_VERSION - 1), stream)
+    assert not cache.is_valid(["question"], table_version="v1")
+
+    cache.clear()
+    assert not cache.is_valid(["question"], table_version="v1")
+
+
+def test_statline_cache(statline_kwargs, cache_format, monkeypatch):
+    statline = StatLineTable(cache_format=cache_format, **statline_kwargs)
+    statline.load_dataframes()
+    assert statline.frame_cache.is_valid(LABELS, table_version=statline.table_version)
+
+    # the next time, the data frames are read from the cache
+    monkeypatch.setattr(StatLineTable, "fill_data", None)
+    statline_cached = StatLineTable(cache_format=cache_format, **statline_kwargs)
+    assert_frame_equal(statline_cached.question_df, statline.question_df)
+    assert statline_cached.level_keys == statline.level_keys
+    assert_frame_equal(statline_cached.section_df, statline.section_df)
+    assert_frame_equal(statline_cached.dimension_df, statline.dimension_df)
+
+
+def test_statline_stale_cache(statline_kwargs, arrow_format):
+    statline = StatLineTable(cache_format="pickle", **statline_kwargs)
+    statline.load_dataframes()
+
+    # a cache in another format is rebuilt
+    statline_arrow = StatLineTable(cache_format=arrow_format, **statline_kwargs)
+    statline_arrow.load_dataframes()
+    assert statline_arrow.frame_cache.file_name("question").exists()
+    assert_frame_equal(statline_arrow.question_df, statline.question_df)
+
+    module = statline_arrow.read_cached_questions(columns=["Key"], filters=[("L0", "==", 8)])
+    assert list(module.columns) == ["Key"]
+    assert set(module["Key"]) == {"GebruikCloudDiensten_5"}
+    assert len(module) == len(statline.question_df[statline.question_df["Key"] ==
+                                                   "GebruikCloudDiensten_5"])
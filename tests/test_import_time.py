@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import cbsodata
+
+# testing deps
+import pytest
+
+# the maximum import time in seconds of the modules, which is well above the import time on a
+# normal machine. The import of cbsodata.utils is dominated by pandas
+IMPORT_TIME_BUDGET = {
+    "cbsodata": 0.25,
+    "cbsodata.cbsodata3": 1.0,
+    "cbsodata.__main__": 1.0,
+    "cbsodata.utils": 3.0,
+}
+
+# modules which are only imported when they are used
+LAZY_MODULES = ["matplotlib", "yaml", "tabulate", "pkg_resources"]
+
+
+def import_times(module_name):
+    """ The cumulative import time in seconds per imported module, using python -X importtime """
+    env = dict(os.environ)
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(cbsodata.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([src_dir, env.get("PYTHONPATH", "")])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize("module_name", sorted(IMPORT_TIME_BUDGET))
+def test_import_time(module_name):
+    # the best of three, as the first import may have to read the files from disk
+    import_time = min(import_times(module_name)[module_name] for _ in range(3))
+    assert import_time < IMPORT_TIME_BUDGET[module_name]
+
+
+@pytest.mark.parametrize("module_name", ["cbsodata", "cbsodata.__main__", "cbsodata.utils"])
+def test_lazy_imports(module_name):
+    imported = import_times(module_name)
+    assert not [name for name in LAZY_MODULES if name in imported]
+    if module_name != "cbsodata.utils":
+        assert "pandas" not in imported
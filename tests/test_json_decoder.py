@@ -0,0 +1,69 @@
+import json
+
+from cbsodata import cbsodata3 as opendata
+from cbsodata.json_decoder import JSON_DECODERS, _is_installed, get_decoder_name, get_loads
+from cbsodata.storage import iter_saved_data, save_data
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+INSTALLED_DECODERS = [name for name in JSON_DECODERS if _is_installed(name)]
+
+DOCUMENT = {"value": [{"Key": "T001", "Title": "Één", "Values": 1.1, "Count": 2 ** 70,
+                       "Missing": None, "Flags": [True, False]}]}
+
+
+@pytest.mark.parametrize("name", INSTALLED_DECODERS)
+def test_loads(name):
+    loads = get_loads(name)
+    document = json.dumps(DOCUMENT)
+
+    # the same result as the standard library, also for the integer above 64 bits
+    assert loads(document.encode("utf-8")) == DOCUMENT
+    assert loads(document) == DOCUMENT
+    with pytest.raises(ValueError):
+        loads(b'{"value": ')
+
+
+def test_decoder_name():
+    assert get_decoder_name() == INSTALLED_DECODERS[0]
+    assert get_loads("json") is json.loads
+
+    with pytest.raises(ValueError):
+        get_decoder_name("yaml")
+
+    missing = [name for name in JSON_DECODERS if name not in INSTALLED_DECODERS]
+    if missing:
+        with pytest.raises(ImportError):
+            get_loads(missing[0])
+
+
+@pytest.mark.parametrize("name", INSTALLED_DECODERS)
+def test_get_data_decoder(cbs_server, monkeypatch, tmpdir, name):
+    documents = []
+    loads = get_loads(name)
+
+    def recording_loads(document):
+        documents.append(document)
+        return loads(document)
+
+    monkeypatch.setattr(opendata.options, "json_decoder", name)
+    monkeypatch.setattr(opendata, "get_loads", lambda decoder: recording_loads)
+
+    data = opendata.download_data(STUB_TABLE_ID, dir=str(tmpdir), catalog_url=cbs_server.url)
+
+    # the responses are decoded from their bytes
+    assert documents and all(isinstance(document, bytes) for document in documents)
+    assert data["TypedDataSet"] == STUB_TABLES["TypedDataSet"]
+    assert list(iter_saved_data(str(tmpdir), "TypedDataSet", json_decoder=name)) == \
+        STUB_TABLES["TypedDataSet"]
+
+
+@pytest.mark.parametrize("save_format", ["json", "ndjson.gz"])
+def test_iter_saved_data_decoder(tmpdir, save_format):
+    save_data(DOCUMENT["value"], str(tmpdir), "Table", save_format=save_format)
+
+    for name in INSTALLED_DECODERS:
+        assert list(iter_saved_data(str(tmpdir), "Table", json_decoder=name)) == DOCUMENT["value"]
@@ -0,0 +1,92 @@
+import json
+import os
+
+from cbsodata import cbsodata3 as opendata
+from cbsodata.mirror import (JOURNAL_NAME, SNAPSHOT_NAME, iter_mirror, mirror, read_journal,
+                             read_snapshot, sync)
+
+import conftest
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+MISSING_TABLE_ID = "00000AAA"
+
+
+def test_mirror(cbs_server, tmpdir):
+    mirror_dir = str(tmpdir.join("mirror"))
+    results = mirror([STUB_TABLE_ID, MISSING_TABLE_ID, STUB_TABLE_ID], dir=mirror_dir,
+                     catalog_url=cbs_server.url, max_workers=2)
+
+    results = {result["table_id"]: result for result in results}
+    assert results[STUB_TABLE_ID]["status"] == "downloaded"
+    assert results[STUB_TABLE_ID]["modified"] == STUB_TABLES["TableInfos"][0]["Modified"]
+    assert results[MISSING_TABLE_ID]["status"] == "failed"
+    assert read_journal(os.path.join(mirror_dir, JOURNAL_NAME)) == results
+
+    # the same files as download_data
+    download_dir = str(tmpdir.join("download"))
+    opendata.download_data(STUB_TABLE_ID, dir=download_dir, catalog_url=cbs_server.url)
+    assert sorted(os.listdir(os.path.join(mirror_dir, STUB_TABLE_ID))) == \
+        sorted(os.listdir(download_dir))
+    with open(os.path.join(mirror_dir, STUB_TABLE_ID, "TypedDataSet.json")) as f:
+        assert json.load(f) == STUB_TABLES["TypedDataSet"]
+
+
+def test_mirror_resume(cbs_server, tmpdir):
+    mirror_dir = str(tmpdir.join("mirror"))
+
+    # the run is interrupted after the first table
+    results = iter_mirror([STUB_TABLE_ID, MISSING_TABLE_ID], dir=mirror_dir,
+                          catalog_url=cbs_server.url, max_workers=1)
+    assert next(results)["table_id"] == STUB_TABLE_ID
+    results.close()
+    assert list(read_journal(os.path.join(mirror_dir, JOURNAL_NAME))) == [STUB_TABLE_ID]
+
+    n_requests = len(cbs_server.requests)
+    results = mirror([STUB_TABLE_ID, MISSING_TABLE_ID], dir=mirror_dir,
+                     catalog_url=cbs_server.url, resume=True)
+    assert [(r["table_id"], r["status"]) for r in results] == [
+        (STUB_TABLE_ID, "skipped"), (MISSING_TABLE_ID, "failed")]
+    assert not any(STUB_TABLE_ID in r for r in cbs_server.requests[n_requests:])
+
+    # the failed table is tried again, without resume all tables are downloaded
+    journal = read_journal(os.path.join(mirror_dir, JOURNAL_NAME))
+    assert journal[MISSING_TABLE_ID]["status"] == "failed"
+    results = mirror(dir=mirror_dir, filters=f"Identifier eq '{STUB_TABLE_ID}'",
+                     catalog_url=cbs_server.url)
+    assert [(r["table_id"], r["status"]) for r in results] == [(STUB_TABLE_ID, "downloaded")]
+    assert list(read_journal(os.path.join(mirror_dir, JOURNAL_NAME))) == [STUB_TABLE_ID]
+
+
+def test_sync(cbs_server, tmpdir, monkeypatch):
+    mirror_dir = str(tmpdir.join("mirror"))
+    filters = f"Identifier eq '{STUB_TABLE_ID}'"
+    results = sync(dir=mirror_dir, filters=filters, catalog_url=cbs_server.url)
+    assert [(r["table_id"], r["status"]) for r in results] == [(STUB_TABLE_ID, "new")]
+    snapshot = read_snapshot(os.path.join(mirror_dir, SNAPSHOT_NAME))
+    assert snapshot[STUB_TABLE_ID]["Modified"] == "2019-10-01T02:00:00"
+    assert snapshot[STUB_TABLE_ID]["bytes"] == results[0]["bytes"] > 0
+
+    # nothing changed: no data is downloaded
+    n_requests = len(cbs_server.requests)
+    results = sync(dir=mirror_dir, filters=filters, catalog_url=cbs_server.url)
+    assert results == [{"table_id": STUB_TABLE_ID, "status": "unchanged",
+                        "bytes_saved": snapshot[STUB_TABLE_ID]["bytes"],
+                        "seconds_saved": snapshot[STUB_TABLE_ID]["seconds"]}]
+    assert not any("ODataFeed" in r for r in cbs_server.requests[n_requests:])
+
+    # a modified table is downloaded again, a table no longer in the list is removed
+    catalog = [dict(table) for table in conftest.STUB_CATALOG]
+    catalog[0]["Modified"] = "2020-10-01T02:00:00"
+    monkeypatch.setattr(conftest, "STUB_CATALOG", catalog)
+    results = sync(dir=mirror_dir, catalog_url=cbs_server.url)
+    assert sorted((r["table_id"], r["status"]) for r in results) == [
+        (MISSING_TABLE_ID, "failed"), (STUB_TABLE_ID, "modified")]
+    assert read_snapshot(os.path.join(mirror_dir, SNAPSHOT_NAME))[STUB_TABLE_ID]["Modified"] == \
+        "2020-10-01T02:00:00"
+
+    results = sync(dir=mirror_dir, filters=f"Identifier eq '{MISSING_TABLE_ID}'",
+                   catalog_url=cbs_server.url)
+    assert sorted((r["table_id"], r["status"]) for r in results) == [
+        (MISSING_TABLE_ID, "failed"), (STUB_TABLE_ID, "removed")]
+    assert read_snapshot(os.path.join(mirror_dir, SNAPSHOT_NAME)) == {}
+    assert os.path.isdir(os.path.join(mirror_dir, STUB_TABLE_ID))
@@ -0,0 +1,86 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cbsodata.sql_sink import VERSION_TABLE, SQLiteSink, connect_sqlite
+from cbsodata.utils import StatLineTable
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+
+def index_names(connection, table_name):
+    return {row[1] for row in connection.execute(f'PRAGMA index_list("{table_name}")')}
+
+
+def test_write_frame(tmpdir):
+    df = pd.DataFrame(dict(Key=["a", "b", None], Values=[1.5, np.nan, 3.0],
+                           Count=np.array([1, 2, 3]), Size=pd.Categorical(["x", "y", "x"])),
+                      index=pd.Index([10, 20, 30], name="ID"))
+    connection = connect_sqlite(tmpdir.join("test.db"))
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    sink = SQLiteSink(connection)
+    assert sink.write_frame("frame", df, version="v1", index_columns=["ID", "Key", "Other"])
+    assert index_names(connection, "frame") == {"ix_frame_ID", "ix_frame_Key"}
+
+    # the same table as written by pandas
+    df.to_sql("frame_pandas", connection)
+    assert_frame_equal(pd.read_sql("SELECT * FROM frame", connection),
+                       pd.read_sql("SELECT * FROM frame_pandas", connection))
+
+    # a table with the same version is not written again
+    assert sink.is_current("frame", "v1")
+    assert not sink.write_frame("frame", df.head(1), version="v1")
+    assert sink.write_frame("frame", df.head(1), version="v2")
+    assert sink.table_version("frame") == "v2"
+    assert connection.execute("SELECT COUNT(*) FROM frame").fetchone()[0] == 1
+    assert not sink.is_current("frame", None)
+
+
+def test_write_frame_rollback(tmpdir):
+    connection = connect_sqlite(tmpdir.join("test.db"))
+    sink = SQLiteSink(connection)
+    sink.write_frame("frame", pd.DataFrame(dict(Key=["a", "b"])), version="v1")
+
+    # a value which sqlite can not store: the previous table stays
+    with pytest.raises(sqlite3.Error):
+        sink.write_frame("frame", pd.DataFrame(dict(Key=["c", dict(d=1)])), version="v2")
+    assert not connection.in_transaction
+    assert sink.table_version("frame") == "v1"
+    assert [row[0] for row in connection.execute("SELECT Key FROM frame")] == ["a", "b"]
+
+
+def test_statline_sql(cbs_server, tmpdir, monkeypatch):
+    kwargs = dict(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                  cache_dir_name=str(tmpdir.join("cache")),
+                  image_dir_name=str(tmpdir.join("images")), to_pickle=False,
+                  write_info_to_image_dir=False)
+    statline = StatLineTable(to_sql=True, write_questions_only=False, **kwargs)
+    connection = statline.connection
+    table_name = f"{STUB_TABLE_ID}_question"
+    assert index_names(connection, table_name) >= {
+        f"ix_{table_name}_L0", f"ix_{table_name}_Key", f"ix_{table_name}_Bedrijfsgrootte_Key",
+        f"ix_{table_name}_Perioden_Key"}
+    question_df = pd.read_sql(f'SELECT * FROM "{table_name}"', connection)
+    assert len(question_df) == len(statline.question_df)
+    versions = dict(connection.execute(f"SELECT name, version FROM {VERSION_TABLE}").fetchall())
+    assert versions == {f"{STUB_TABLE_ID}_{label}": "2019-10-01T02:00:00"
+                        for label in ("question", "section", "dimension")}
+
+    # an unchanged table is not loaded nor written again, also not by a new connection
+    connection.close()
+    monkeypatch.setattr(StatLineTable, "fill_data", None)
+    statline = StatLineTable(to_sql=True, **kwargs)
+    assert not statline._dataframes_loaded
+
+    # a new version of the table is written
+    monkeypatch.undo()
+    table_infos = [dict(STUB_TABLES["TableInfos"][0], Modified="2020-10-01T02:00:00")]
+    monkeypatch.setitem(STUB_TABLES, "TableInfos", table_infos)
+    statline = StatLineTable(to_sql=True, reset=True, **kwargs)
+    assert SQLiteSink(statline.connection).table_version(table_name) == "2020-10-01T02:00:00"
@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+
+from cbsodata import cbsodata3 as opendata
+from cbsodata.storage import DataWriter, find_data_file, iter_saved_data, save_data
+from cbsodata.utils import StatLineTable
+
+# testing deps
+import pytest
+
+from conftest import STUB_TABLE_ID, STUB_TABLES
+
+ROWS = [{"Key": "a", "Values": [1, 2], "Title": "Eerste"},
+        {"Key": "b", "Values": None, "Title": "Tweede é"},
+        {"Key": "c", "Values": {"x": 1.5}, "Title": ""}]
+
+
+@pytest.mark.parametrize("rows", [[], ROWS[:1], ROWS])
+def test_json_layout(tmpdir, rows):
+    # the json format is written page by page, but is the same as the original layout
+    with DataWriter(str(tmpdir), "Table") as writer:
+        writer.write_rows(rows[:1])
+        writer.write_rows([])
+        writer.write_rows(rows[1:])
+
+    with open(tmpdir.join("Table.json")) as f:
+        assert f.read() == json.dumps(rows, indent=2)
+    assert list(iter_saved_data(str(tmpdir), "Table")) == rows
+
+
+@pytest.mark.parametrize("save_format", ["ndjson", "ndjson.gz", "ndjson.zst"])
+def test_ndjson(tmpdir, save_format):
+    if save_format == "ndjson.zst":
+        pytest.importorskip("zstandard")
+
+    save_data(ROWS, str(tmpdir), "Table")
+    file_name = save_data(ROWS, str(tmpdir), "Table", save_format=save_format)
+
+    # only the last format is kept
+    assert os.listdir(str(tmpdir)) == [os.path.basename(file_name)]
+    assert find_data_file(str(tmpdir), "Table") == file_name
+    assert list(iter_saved_data(str(tmpdir), "Table")) == ROWS
+
+    if save_format == "ndjson.gz":
+        with gzip.open(file_name, "rt", encoding="utf-8") as f:
+            assert [json.loads(line) for line in f] == ROWS
+
+
+def test_writer_error(tmpdir):
+    save_data(ROWS, str(tmpdir), "Table", save_format="ndjson.gz")
+
+    # an incomplete table does not replace the previous one
+    with pytest.raises(RuntimeError):
+        with DataWriter(str(tmpdir), "Table", save_format="ndjson") as writer:
+            writer.write_rows(ROWS[:1])
+            raise RuntimeError("interrupted")
+    assert os.listdir(str(tmpdir)) == ["Table.ndjson.gz"]
+    assert list(iter_saved_data(str(tmpdir), "Table")) == ROWS
+
+    with pytest.raises(ValueError):
+        DataWriter(str(tmpdir), "Table", save_format="csv")
+    with pytest.raises(FileNotFoundError):
+        list(iter_saved_data(str(tmpdir), "Other"))
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_download_data_save_format(cbs_server, tmpdir, monkeypatch, prefetch):
+    monkeypatch.setattr(opendata.options, "save_format", "ndjson.gz")
+    data = opendata.download_data(STUB_TABLE_ID, dir=str(tmpdir), prefetch=prefetch,
+                                  catalog_url=cbs_server.url)
+
+    assert sorted(os.listdir(str(tmpdir))) == sorted(f"{name}.ndjson.gz" for name in data)
+    for name, table in data.items():
+        assert list(iter_saved_data(str(tmpdir), name)) == table
+    assert data["TypedDataSet"] == STUB_TABLES["TypedDataSet"]
+
+    # the argument overrules the option
+    opendata.get_data(STUB_TABLE_ID, dir=str(tmpdir), catalog_url=cbs_server.url,
+                      output="pandas", save_format="json")
+    assert find_data_file(str(tmpdir), "TypedDataSet").endswith("TypedDataSet.json")
+    assert list(iter_saved_data(str(tmpdir), "TypedDataSet")) == STUB_TABLES["TypedDataSet"]
+
+
+def test_statline_save_format(cbs_server, tmpdir):
+    kwargs = dict(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url, to_pickle=False,
+                  image_dir_name=str(tmpdir.join("images")), write_info_to_image_dir=False)
+
+    statline = StatLineTable(cache_dir_name=str(tmpdir.join("json")), **kwargs)
+    compressed = StatLineTable(cache_dir_name=str(tmpdir.join("gz")), save_format="ndjson.gz",
+                               **kwargs)
+    assert compressed.question_df.equals(statline.question_df)
+    assert find_data_file(compressed.output_directory, "DataProperties").endswith(".ndjson.gz")
+    assert find_data_file(statline.output_directory, "DataProperties").endswith(".json")
+
+    # a cache directory in the json layout is read without downloading it again
+    n_requests = len(cbs_server.requests)
+    statline_json = StatLineTable(cache_dir_name=str(tmpdir.join("json")),
+                                  save_format="ndjson.gz", **kwargs)
+    assert statline_json.question_df.equals(statline.question_df)
+    assert len(cbs_server.requests) == n_requests
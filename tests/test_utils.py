@@ -7,7 +7,9 @@ import pickle
 import string
 import random
 
-from cbsodata.utils import StatLineTable, dataframe_clip_strings
+from cbsodata.utils import StatLineTable, dataframe_clip_strings, level_depth
+
+from conftest import STUB_PERIODS, STUB_TABLE_ID, STUB_TABLES
 
 # testing deps
 import pytest
@@ -32,6 +34,12 @@ TEST_ENV = 'test_env'  # this directory is cleared after running
 COMPRESSION = "zip"
 
 
+def categories_to_objects(df):
+    """ The dimensions are categoricals, the stored data frames have plain object columns """
+    categories = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return df.astype({c: object for c in categories})
+
+
 def pick_url(table_id):
     if table_id in DATASETS_DERDEN:
         url = URL_DERDEN
@@ -109,7 +117,25 @@ def test_question_df(table_id):
     file_name = table_file_name(table_id=table_id)
     question_df_expect = pd.read_pickle(file_name, compression=COMPRESSION)
 
-    assert_frame_equal(question_df, question_df_expect)
+    assert_frame_equal(categories_to_objects(question_df), question_df_expect)
+
+
+def test_categorical_dimensions(cbs_server, tmpdir):
+    kwargs = dict(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                  cache_dir_name=str(tmpdir.join("cache")),
+                  image_dir_name=str(tmpdir.join("images")), to_pickle=False)
+
+    statline = StatLineTable(**kwargs)
+    question_df = statline.question_df
+
+    for column in ("Bedrijfsgrootte", "Bedrijfsgrootte_Key", "Perioden", "Perioden_Key"):
+        assert isinstance(question_df[column].dtype, pd.CategoricalDtype)
+    assert list(question_df["Perioden"].cat.categories) == [t for _, t in STUB_PERIODS]
+
+    statline_plain = StatLineTable(categorical_dimensions=False, **kwargs)
+
+    assert statline_plain.question_df["Perioden"].dtype == object
+    assert_frame_equal(categories_to_objects(question_df), statline_plain.question_df)
 
 
 @pytest.mark.parametrize("table_id", DATASETS_ALL)
@@ -158,6 +184,168 @@ def test_selection(table_id):
         assert (selection == selection_expect).all()
 
 
+def test_question_structure(cbs_server, tmpdir):
+    statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                             cache_dir_name=str(tmpdir.join("cache")),
+                             image_dir_name=str(tmpdir.join("images")), to_pickle=False)
+    statline.load_dataframes()
+
+    # the stub has modules with a sub module, so only three levels are used
+    assert statline.level_keys == ["L0", "L1", "L2"]
+    assert list(statline.dimension_df["Key"]) == ["Perioden", "Bedrijfsgrootte"]
+    assert list(statline.section_df["Title"]) == ["Personeel en ICT", "ICT-specialisten",
+                                                  "Cloud-diensten"]
+
+    questions = statline.question_df
+    first_block = questions[(questions["Bedrijfsgrootte_Key"] == "WP1") &
+                            (questions["Perioden_Key"] == "2016JJ00")]
+    assert list(first_block["ID"]) == [3, 4, 6, 7, 9]
+    assert list(first_block["Section"]) == ["Personeel en ICT", "Personeel en ICT",
+                                            "Personeel en ICT\nICT-specialisten",
+                                            "Personeel en ICT\nICT-specialisten",
+                                            "Cloud-diensten"]
+    assert list(first_block.index.get_level_values("L1")) == [3, 4, 5, 5, 9]
+    assert list(first_block.index.get_level_values("L2").fillna(0)) == [0, 0, 6, 7, 0]
+
+
+def test_get_question_df(cbs_server, tmpdir):
+    statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                             cache_dir_name=str(tmpdir.join("cache")),
+                             image_dir_name=str(tmpdir.join("images")), to_pickle=False)
+    n_observations = len(statline.typed_data_set)
+
+    question_df = statline.get_question_df(3)
+    assert list(question_df["ID"]) == [3] * n_observations
+    assert list(question_df.index.names) == ["L1", "L2"]
+
+    # a section with only options is one question
+    question_df = statline.get_question_df(5)
+    assert list(question_df.index.names) == ["L2"]
+    assert sorted(set(question_df["ID"])) == [6, 7]
+
+    # a module with questions at different levels gives the list of questions
+    question_dfs = statline.get_question_df(2)
+    assert [sorted(set(df["ID"])) for df in question_dfs] == [[3], [4], [6, 7]]
+    assert_frame_equal(question_dfs[0], statline.get_question_df(3))
+
+    assert statline.get_question_df(100) is None
+
+    question_dfs = statline.get_question_dfs([9, 3, 100])
+    assert list(question_dfs.keys()) == [9, 3, 100]
+    assert list(question_dfs[9]["ID"]) == [9] * n_observations
+    assert question_dfs[100] is None
+
+    assert statline.question_index.related[6] == {2, 5, 6}
+    statline.questions_to_plot = [5]
+    assert statline.question_or_its_parent_in_index(question_df, level_id=7)
+    assert statline.question_or_its_parent_in_index(statline.question_df)
+    assert not statline.question_or_its_parent_in_index(question_dfs[9], level_id=9)
+    assert not statline.question_or_its_parent_in_index(question_dfs[9])
+
+
+def test_section_levels(cbs_server, tmpdir):
+    statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                             cache_dir_name=str(tmpdir.join("cache")),
+                             image_dir_name=str(tmpdir.join("images")), to_pickle=False)
+    question_df = statline.question_df
+    first_block = question_df[(question_df["Bedrijfsgrootte_Key"] == "WP1") &
+                              (question_df["Perioden_Key"] == "2016JJ00")]
+    assert list(level_depth(first_block.index)) == [2, 2, 3, 3, 2]
+
+    # module 2 has questions at level 1 and options of section 5 at level 2
+    module_df = question_df.xs(2, level="L0", drop_level=False)
+    sub_level_df = statline._remove_all_section_levels(module_df)
+    assert list(sub_level_df.index.names) == ["L1", "L2"]
+    assert not statline._has_equal_number_of_nans(2, sub_level_df)
+
+    # the options of section 5 are one question: level L1 is a section level
+    section_df = module_df[module_df.index.get_level_values("L1") == 5]
+    sub_level_df = statline._remove_all_section_levels(section_df)
+    assert list(sub_level_df.index.names) == ["L2"]
+    assert statline._has_equal_number_of_nans(5, sub_level_df)
+    assert statline._has_equal_number_of_nans(5, section_df)
+
+
+def test_lazy_statline(cbs_server, tmpdir, monkeypatch):
+    image_dir = tmpdir.join("images")
+    statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=cbs_server.url,
+                             cache_dir_name=str(tmpdir.join("cache")),
+                             image_dir_name=str(image_dir))
+
+    # the table information is available without building the data frames
+    fill_data = StatLineTable.fill_data
+    monkeypatch.setattr(StatLineTable, "fill_data", None)
+    assert statline.table_infos[0]["ShortTitle"] == "Stub ICT-gebruik"
+    assert not image_dir.join(STUB_TABLE_ID, "TableInfos.yml").exists()
+
+    # the data frames are build on first access, once
+    monkeypatch.setattr(StatLineTable, "fill_data", fill_data)
+    question_df = statline.question_df
+    assert statline.question_df is question_df
+    assert image_dir.join(STUB_TABLE_ID, "TableInfos.yml").exists()
+    assert list(statline.question_info_df["Key"])[0] == "ICTPersAangenomen_1"
+
+
+@pytest.fixture
+def one_period_server(cbs_server, monkeypatch):
+    """ The stub table with only the first period, which has the dimension of the plots """
+    monkeypatch.setitem(STUB_TABLES, "DataProperties", [p for p in STUB_TABLES["DataProperties"]
+                                                        if p["Key"] != "Perioden"])
+    monkeypatch.delitem(STUB_TABLES, "Perioden")
+    for name in ("TypedDataSet", "UntypedDataSet"):
+        rows = [{k: v for k, v in row.items() if k != "Perioden"}
+                for row in STUB_TABLES[name] if row["Perioden"] == STUB_PERIODS[0][0]]
+        monkeypatch.setitem(STUB_TABLES, name, rows)
+    return cbs_server
+
+
+def test_plot_workers(one_period_server, tmpdir):
+    image_files = dict()
+    for workers in (None, 2):
+        image_dir = tmpdir.join(f"images_{workers}")
+        statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=one_period_server.url,
+                                 cache_dir_name=str(tmpdir.join("cache")),
+                                 image_dir_name=str(image_dir), to_pickle=False,
+                                 save_plot=True, show_plot=False, store_plot_data_to_tex=True,
+                                 write_info_to_image_dir=False)
+        statline.plot(workers=workers)
+        image_files[workers] = sorted(f for f in os.listdir(image_dir.join(STUB_TABLE_ID))
+                                      if f != "plot_manifest.json")
+        assert sorted(statline.plot_timings) == [os.path.splitext(f)[0] for f in
+                                                 image_files[workers] if f.endswith(".png")]
+
+    # the plots are the same for any number of workers
+    assert image_files[None] == image_files[2]
+    assert len(image_files[None]) == 2 * len(statline.plot_timings) > 0
+
+
+def test_plot_manifest(one_period_server, tmpdir):
+    statline = StatLineTable(table_id=STUB_TABLE_ID, catalog_url=one_period_server.url,
+                             cache_dir_name=str(tmpdir.join("cache")),
+                             image_dir_name=str(tmpdir.join("images")), to_pickle=False,
+                             save_plot=True, show_plot=False, write_info_to_image_dir=False)
+    statline.plot()
+    file_bases = list(statline.plot_timings)
+    assert statline.skipped_plots == []
+    assert sorted(statline.read_plot_manifest()) == sorted(file_bases)
+
+    # nothing changed: all plots are skipped
+    statline.plot()
+    assert list(statline.plot_timings) == []
+    assert statline.skipped_plots == file_bases
+
+    # a missing image and a changed setting are rendered again
+    statline.image_dir.joinpath(file_bases[0] + ".png").unlink()
+    statline.plot()
+    assert list(statline.plot_timings) == file_bases[:1]
+    statline.legend_title = "Grootte"
+    statline.plot()
+    assert list(statline.plot_timings) == file_bases
+
+    statline.plot(force=True)
+    assert list(statline.plot_timings) == file_bases
+
+
 def test_clip_data_frame_strings():
     string_length = 10
 